@@ -1,30 +1,46 @@
 """Main module managing processes."""
 
-from cachetools import LRUCache
-from functools import partial
-import inspect
+from collections import OrderedDict
 from itertools import chain, product
+import json
 import logging
 from multiprocessing import cpu_count, current_process
-from multiprocessing.pool import Pool
+from multiprocessing.pool import AsyncResult, Pool, ThreadPool
+# for Python 2 & 3 compatibility:
+try:
+    from multiprocessing import SimpleQueue
+except ImportError:
+    from multiprocessing.queues import SimpleQueue
 import numpy as np
 import numpy.ma as ma
 import os
 from shapely.geometry import shape
 import signal
 import six
+from six.moves import queue
 import threading
 from tilematrix import TilePyramid
 import time
 from traceback import format_exc
 import types
+import weakref
 
 from mapchete.commons import clip as commons_clip
 from mapchete.commons import contours as commons_contours
 from mapchete.commons import hillshade as commons_hillshade
 from mapchete.config import MapcheteConfig
+from mapchete._coverage import tile_coverage
+from mapchete import _http_cache
+from mapchete._input_cache import input_cache
+from mapchete._prefetch import (
+    NextTilePrefetcher, TileBlock, block_key, current_block, use_block)
+from mapchete._scheduler import (
+    TILE_ORDERS, ChunkSizer, TileScheduler, sort_tiles)
+from mapchete._tile_cache import TILE_CACHE_SIZE, TILE_SPILL_SIZE, TileCache
 from mapchete.tile import BufferedTile
 from mapchete.io import raster
+from mapchete._timing import (
+    TileTimer, TimedInputTile, TimingSummary, add_bytes, current_timer, timed)
 from mapchete.errors import (
     MapcheteProcessException, MapcheteProcessOutputError, MapcheteNodataTile
 )
@@ -35,10 +51,27 @@ logger.addHandler(logging.NullHandler())
 # suppress rasterio logging
 logging.getLogger("rasterio").setLevel(logging.ERROR)
 
+# message for process tiles where no output was written as it was empty
+_EMPTY_WRITE_MESSAGE = "output empty, nothing written"
+
+# process object, number of output writer threads and prefetch block size of
+# a batch processing worker, set by _worker_init()
+_worker_process = None
+_worker_write_threads = 0
+_worker_prefetch_block = 0
+_worker_prefetcher = None
+
+# process ID and thread pools per number of threads used by
+# MapcheteProcess.read_many(); pools are kept so the threads can reuse their
+# open datasets and are never closed as other threads may still use them
+_read_pools = (None, {})
+_read_pools_lock = threading.Lock()
+
 
 def open(
     config, mode="continue", zoom=None, bounds=None, single_input_file=None,
-    with_cache=False, debug=False
+    with_cache=False, debug=False, cache_size=TILE_CACHE_SIZE, spill_dir=None,
+    spill_size=TILE_SPILL_SIZE
 ):
     """
     Open a Mapchete process.
@@ -61,6 +94,13 @@ def open(
         single input file if supported by process
     with_cache : bool
         process output data cached in memory
+    cache_size : integer or float
+        memory budget in megabytes for cached process output (default: 1024)
+    spill_dir : string
+        directory to keep cached process output dropped from memory
+        (default: None)
+    spill_size : integer or float
+        disk budget in megabytes for spill_dir (default: 4096)
 
     Returns
     -------
@@ -71,7 +111,8 @@ def open(
         MapcheteConfig(
             config, mode=mode, zoom=zoom, bounds=bounds,
             single_input_file=single_input_file, debug=debug),
-        with_cache=with_cache)
+        with_cache=with_cache, cache_size=cache_size, spill_dir=spill_dir,
+        spill_size=spill_size)
 
 
 class Mapchete(object):
@@ -86,6 +127,13 @@ class Mapchete(object):
         Mapchete process configuration
     with_cache : bool
         cache processed output data in memory (default: False)
+    cache_size : integer or float
+        memory budget in megabytes for cached process output (default: 1024)
+    spill_dir : string
+        directory to keep cached process output dropped from memory
+        (default: None)
+    spill_size : integer or float
+        disk budget in megabytes for spill_dir (default: 4096)
 
     Attributes
     ----------
@@ -93,9 +141,17 @@ class Mapchete(object):
         Mapchete process configuration
     with_cache : bool
         process output data cached in memory
+    process_tile_cache : ``TileCache``
+        cached process output with hit, miss and eviction counters if
+        with_cache is active
+    timing_summary : ``TimingSummary``
+        aggregated per tile timings of the latest ``batch_processor()`` run
     """
 
-    def __init__(self, config, with_cache=False):
+    def __init__(
+        self, config, with_cache=False, cache_size=TILE_CACHE_SIZE,
+        spill_dir=None, spill_size=TILE_SPILL_SIZE
+    ):
         """
         Initialize Mapchete processing endpoint.
 
@@ -105,6 +161,14 @@ class Mapchete(object):
             Mapchete process configuration
         with_cache : bool
             cache processed output data in memory (default: False)
+        cache_size : integer or float
+            memory budget in megabytes for cached process output
+            (default: 1024)
+        spill_dir : string
+            directory to keep cached process output dropped from memory
+            (default: None)
+        spill_size : integer or float
+            disk budget in megabytes for spill_dir (default: 4096)
         """
         logger.debug("initialize process")
         if not isinstance(config, MapcheteConfig):
@@ -117,12 +181,34 @@ class Mapchete(object):
         else:
             self.with_cache = with_cache
         if self.with_cache:
-            self.process_tile_cache = LRUCache(maxsize=512)
+            for name, size in [
+                ("cache_size", cache_size), ("spill_size", spill_size)
+            ]:
+                if (
+                    isinstance(size, bool) or
+                    not isinstance(size, (int, float)) or
+                    size <= 0
+                ):
+                    raise ValueError("invalid %s: %s" % (name, size))
+            self.process_tile_cache = TileCache(
+                int(cache_size * 1024 * 1024), spill_path=spill_dir,
+                spill_max_bytes=int(spill_size * 1024 * 1024))
             self.current_processes = {}
             self.process_lock = threading.Lock()
         self._count_tiles_cache = {}
-
-    def get_process_tiles(self, zoom=None):
+        self._coverage_cache = {}
+        self.timing_summary = TimingSummary()
+        # input cache, dataset pool and HTTP cache are shared by all open
+        # processes
+        _activate(self)
+        # tiles registered with other tile pyramids or bounds are discarded
+        registry = self.config.output.registry
+        if registry is not None and self.config.mode in [
+            "continue", "overwrite"
+        ]:
+            registry.set_signature(_registry_signature(self.config))
+
+    def get_process_tiles(self, zoom=None, order="rowcol"):
         """
         Yield process tiles.
 
@@ -135,25 +221,48 @@ class Mapchete(object):
         zoom : integer
             zoom level process tiles should be returned from; if none is given,
             return all process tiles
+        order : string
+            order of tiles within a zoom level: "rowcol" (row by row),
+            "zorder" or "hilbert" (along a space filling curve, keeps
+            neighbouring tiles together); (default: "rowcol")
 
         yields
         ------
         BufferedTile objects
         """
         if zoom or zoom == 0:
-            for tile in self.config.process_pyramid.tiles_from_geom(
-                self.config.area_at_zoom(zoom), zoom
-            ):
+            for tile in sort_tiles(self._process_tiles_at_zoom(zoom), order):
                 yield tile
         else:
             for zoom in reversed(self.config.zoom_levels):
-                for tile in self.config.process_pyramid.tiles_from_geom(
-                    self.config.area_at_zoom(zoom), zoom
+                for tile in sort_tiles(
+                    self._process_tiles_at_zoom(zoom), order
                 ):
                     yield tile
 
+    def _process_tiles_at_zoom(self, zoom):
+        coverage = self._tile_coverage(zoom)
+        if coverage is None:
+            return self.config.process_pyramid.tiles_from_geom(
+                self.config.area_at_zoom(zoom), zoom)
+        return (
+            self.config.process_pyramid.tile(*tile_id)
+            for tile_id in coverage.tile_ids()
+        )
+
+    def _tile_coverage(self, zoom):
+        # rasterized process area, shared by get_process_tiles() and
+        # count_tiles()
+        if zoom not in self._coverage_cache:
+            self._coverage_cache[zoom] = tile_coverage(
+                self.config.area_at_zoom(zoom),
+                self.config.process_pyramid.tile_pyramid, zoom)
+        return self._coverage_cache[zoom]
+
     def batch_process(
-        self, zoom=None, tile=None, multi=cpu_count(), max_chunksize=1
+        self, zoom=None, tile=None, multi=cpu_count(), max_chunksize=1,
+        write_threads=0, tile_order="rowcol", adaptive_chunksize=False,
+        prefetch_block=0, prefetch_next=False
     ):
         """
         Process a large batch of tiles.
@@ -173,15 +282,48 @@ class Mapchete(object):
         max_chunksize : int
             maximum number of process tiles to be queued for each worker;
             (default: 1)
+        write_threads : int
+            number of threads per worker writing output while the worker
+            already processes the next tiles of its task; 0 writes output
+            directly in the worker (default: 0)
+        tile_order : string
+            order in which tiles of a zoom level are processed: "rowcol",
+            "zorder" or "hilbert"; space filling curves hand spatially
+            coherent chunks of tiles to the workers (default: "rowcol")
+        adaptive_chunksize : bool
+            adapt number of tiles per worker task between 1 and max_chunksize
+            to the measured tile durations and shrink tasks towards the end
+            of the run (default: False)
+        prefetch_block : int
+            hand out blocks of up to prefetch_block x prefetch_block adjacent
+            process tiles as one task; raster file inputs are read once per
+            block and every tile gets a slice of it; 0 disables blocks
+            (default: 0)
+        prefetch_next : bool
+            read inputs of the next tile of a worker task into the input
+            cache in a background thread while the current tile is processed;
+            requires ``input_cache`` to be configured and, if multi > 1,
+            worker tasks of more than one tile, i.e. max_chunksize or
+            prefetch_block > 1 (default: False)
         """
-        list(self.batch_processor(zoom, tile, multi, max_chunksize))
+        list(self.batch_processor(
+            zoom, tile, multi, max_chunksize, write_threads, tile_order,
+            adaptive_chunksize, prefetch_block, prefetch_next))
 
     def batch_processor(
-        self, zoom=None, tile=None, multi=cpu_count(), max_chunksize=1
+        self, zoom=None, tile=None, multi=cpu_count(), max_chunksize=1,
+        write_threads=0, tile_order="rowcol", adaptive_chunksize=False,
+        prefetch_block=0, prefetch_next=False
     ):
         """
         Process a large batch of tiles and yield report messages per tile.
 
+        Besides the "process" and "write" messages, every report contains
+        "timings", a dictionary with seconds spent reading input, running the
+        user process, preparing arrays and writing output as well as read
+        (decoded) and written bytes. Timings of the whole run are aggregated
+        in ``timing_summary``.
+
         Parameters
         ----------
         zoom : list or int
@@ -195,25 +337,68 @@ class Mapchete(object):
         max_chunksize : int
             maximum number of process tiles to be queued for each worker;
             (default: 1)
+        write_threads : int
+            number of threads per worker writing output while the worker
+            already processes the next tiles of its task; 0 writes output
+            directly in the worker (default: 0)
+        tile_order : string
+            order in which tiles of a zoom level are processed: "rowcol",
+            "zorder" or "hilbert"; space filling curves hand spatially
+            coherent chunks of tiles to the workers (default: "rowcol")
+        adaptive_chunksize : bool
+            adapt number of tiles per worker task between 1 and max_chunksize
+            to the measured tile durations and shrink tasks towards the end
+            of the run (default: False)
+        prefetch_block : int
+            hand out blocks of up to prefetch_block x prefetch_block adjacent
+            process tiles as one task; raster file inputs are read once per
+            block and every tile gets a slice of it; 0 disables blocks
+            (default: 0)
+        prefetch_next : bool
+            read inputs of the next tile of a worker task into the input
+            cache in a background thread while the current tile is processed;
+            requires ``input_cache`` to be configured and, if multi > 1,
+            worker tasks of more than one tile, i.e. max_chunksize or
+            prefetch_block > 1 (default: False)
         """
         if zoom and tile:
             raise ValueError("use either zoom or tile")
+        if tile_order not in TILE_ORDERS:
+            raise ValueError(
+                "tile_order must be one of %s: %s" % (TILE_ORDERS, tile_order))
+        if prefetch_next and not self.config.input_cache_size:
+            logger.warning("prefetch_next has no effect without input_cache")
+            prefetch_next = False
+        if (
+            prefetch_next and not tile and multi > 1 and
+            max_chunksize < 2 and prefetch_block < 2
+        ):
+            logger.warning(
+                "prefetch_next only prefetches tiles of the same worker task "
+                "and has no effect with max_chunksize=1 unless prefetch_block "
+                "is set")
+            prefetch_next = False
+        self.timing_summary = TimingSummary()
 
         # run single tile
         if tile:
-            yield _run_on_single_tile(self, tile)
+            results = [_run_on_single_tile(self, tile)]
         # run using multiprocessing
         elif multi > 1:
-            for result in _run_with_multiprocessing(
-                self, list(_get_zoom_level(zoom, self)), multi, max_chunksize
-            ):
-                yield result
+            results = _run_with_multiprocessing(
+                self, list(_get_zoom_level(zoom, self)), multi, max_chunksize,
+                write_threads, tile_order, adaptive_chunksize, prefetch_block,
+                prefetch_next)
         # run without multiprocessing
         elif multi == 1:
-            for result in _run_without_multiprocessing(
-                self, list(_get_zoom_level(zoom, self))
-            ):
-                yield result
+            results = _run_without_multiprocessing(
+                self, list(_get_zoom_level(zoom, self)), tile_order,
+                prefetch_block, prefetch_next)
+        else:
+            results = []
+        for result in results:
+            self.timing_summary.update(result["timings"])
+            yield result
 
     def count_tiles(self, minzoom, maxzoom, init_zoom=0):
         """
@@ -232,9 +417,23 @@ class Mapchete(object):
         number of tiles
         """
         if (minzoom, maxzoom) not in self._count_tiles_cache:
-            self._count_tiles_cache[(minzoom, maxzoom)] = count_tiles(
-                self.config.area_at_zoom(), self.config.process_pyramid,
-                minzoom, maxzoom, init_zoom=0)
+            zoom_levels = range(minzoom, maxzoom + 1)
+            # count exactly the tiles get_process_tiles() yields
+            if all(z in self.config.init_zoom_levels for z in zoom_levels):
+                count = 0
+                for zoom in zoom_levels:
+                    coverage = self._tile_coverage(zoom)
+                    if coverage is None:
+                        count += count_tiles(
+                            self.config.area_at_zoom(zoom),
+                            self.config.process_pyramid, zoom, zoom)
+                    else:
+                        count += coverage.count
+            else:
+                count = count_tiles(
+                    self.config.area_at_zoom(), self.config.process_pyramid,
+                    minzoom, maxzoom, init_zoom=0)
+            self._count_tiles_cache[(minzoom, maxzoom)] = count
         return self._count_tiles_cache[(minzoom, maxzoom)]
 
     def execute(self, process_tile, raise_nodata=False):
@@ -264,7 +463,7 @@ class Mapchete(object):
         else:
             raise TypeError("process_tile must be tuple or BufferedTile")
         if process_tile.zoom not in self.config.zoom_levels:
-            return self.config.output.empty(process_tile)
+            return self.config.output._empty(process_tile)
         return self._execute(process_tile, raise_nodata=raise_nodata)
 
     def read(self, output_tile):
@@ -320,12 +519,23 @@ class Mapchete(object):
             return message
         else:
             if data is None:
-                message = "output empty, nothing written"
+                message = _EMPTY_WRITE_MESSAGE
                 logger.debug((process_tile.id, message))
                 return message
             start = time.time()
-            self.config.output.write(process_tile=process_tile, data=data)
-            message = "output written in %ss" % round(time.time() - start, 3)
+            # output formats skip writing data which is completely masked and
+            # return the output tiles written, if they report them
+            written = self.config.output.write(
+                process_tile=process_tile, data=data)
+            if written is not None and not written:
+                message = _EMPTY_WRITE_MESSAGE
+            else:
+                message = "output written in %ss" % round(
+                    time.time() - start, 3)
+                if written and current_timer() is not None:
+                    add_bytes(written=sum(
+                        _file_size(self.config.output.get_path(output_tile))
+                        for output_tile in written))
             logger.debug((process_tile.id, message))
             return message
 
@@ -356,7 +566,7 @@ class Mapchete(object):
 
         # Return empty data if zoom level is outside of process zoom levels.
         if tile.zoom not in self.config.zoom_levels:
-            return self.config.output.empty(tile)
+            return self.config.output._empty(tile)
 
         # TODO implement reprojection
         if tile.crs != self.config.process_pyramid.crs:
@@ -388,7 +598,7 @@ class Mapchete(object):
             if self.config.output.tiles_exist(process_tile):
                 return self._read_existing_output(tile, output_tiles)
             else:
-                return self.config.output.empty(tile)
+                return self.config.output._empty(tile)
         elif self.config.mode == "continue" and not _baselevel_readonly:
             if self.config.output.tiles_exist(process_tile):
                 return self._read_existing_output(tile, output_tiles)
@@ -423,31 +633,32 @@ class Mapchete(object):
 
     def _execute_using_cache(self, process_tile):
         # Extract Tile subset from process Tile and return.
-        try:
-            return self.process_tile_cache[process_tile.id]
-        except KeyError:
-            # Lock process for Tile or wait.
-            with self.process_lock:
-                process_event = self.current_processes.get(process_tile.id)
-                if not process_event:
-                    self.current_processes[process_tile.id] = threading.Event()
-            # Wait and return.
-            if process_event:
-                process_event.wait()
-                return self.process_tile_cache[process_tile.id]
-            else:
-                try:
-                    output = self.execute(process_tile)
-                    self.process_tile_cache[process_tile.id] = output
-                    if self.config.mode in ["continue", "overwrite"]:
-                        self.write(process_tile, output)
-                    return self.process_tile_cache[process_tile.id]
-                finally:
-                    with self.process_lock:
-                        process_event = self.current_processes.get(
-                            process_tile.id)
-                        del self.current_processes[process_tile.id]
-                        process_event.set()
+        output = self.process_tile_cache.get(process_tile.id)
+        if output is not None:
+            return output
+        # Lock process for Tile or wait.
+        with self.process_lock:
+            process_event = self.current_processes.get(process_tile.id)
+            if not process_event:
+                self.current_processes[process_tile.id] = threading.Event()
+        # Wait and return.
+        if process_event:
+            process_event.wait()
+            # output may have been too large for the cache or already dropped
+            return self._execute_using_cache(process_tile)
+        else:
+            try:
+                output = self.execute(process_tile)
+                self.process_tile_cache.set(process_tile.id, output)
+                if self.config.mode in ["continue", "overwrite"]:
+                    self.write(process_tile, output)
+                return output
+            finally:
+                with self.process_lock:
+                    process_event = self.current_processes.get(
+                        process_tile.id)
+                    del self.current_processes[process_tile.id]
+                    process_event.set()
 
     def _extract(self, in_tile=None, in_data=None, out_tile=None):
         """Extract data from tile."""
@@ -487,19 +698,10 @@ class Mapchete(object):
         try:
             starttime = time.time()
             # Actually run process.
-            if len(inspect.getargspec(self.config.process_func).args) == 1:
-                process_data = self.config.process_func(tile_process)
-            else:
-                process_data = self.config.process_func(
-                    tile_process,
-                    **{
-                        k: v for k, v in six.iteritems(params)
-                        if k not in [
-                            "input", "output", "pyramid", "zoom_levels", "mapchete_file",
-                            "init_bounds", "init_zoom_levels"
-                        ]
-                    }
-                )
+            process_data = self.config.process_func(
+                tile_process,
+                **self.config.process_kwargs_at_zoom(process_tile.zoom)
+            )
         except Exception as e:
             # Log process time
             elapsed = "%ss" % (round((time.time() - starttime), 3))
@@ -517,7 +719,7 @@ class Mapchete(object):
             try:
                 return self._streamline_output(process_data)
             except MapcheteNodataTile:
-                return self.config.output.empty(process_tile)
+                return self.config.output._empty(process_tile)
 
     def _streamline_output(self, process_data):
         if isinstance(process_data, six.string_types) and (
@@ -587,7 +789,17 @@ class Mapchete(object):
         for ip in self.config.input.values():
             if ip is not None:
                 ip.cleanup()
+        if self.config.output.registry is not None:
+            self.config.output.registry.close()
+        _deactivate(self)
         if self.with_cache:
+            logger.debug(
+                "process tile cache: %s hits (%s from disk), %s misses, %s "
+                "evictions", self.process_tile_cache.hits,
+                self.process_tile_cache.disk_hits,
+                self.process_tile_cache.misses,
+                self.process_tile_cache.evictions)
+            self.process_tile_cache.close()
             self.process_tile_cache = None
             self.current_processes = None
             self.process_lock = None
@@ -689,11 +901,55 @@ class MapcheteProcess(object):
             reprojected input data within tile
         """
         if not isinstance(input_id, six.string_types):
-            return input_id.open(self.tile, **kwargs)
-        if input_id not in self.params["input"]:
+            input_tile = input_id.open(self.tile, **kwargs)
+        elif input_id not in self.params["input"]:
             raise ValueError(
                 "%s not found in config as input file" % input_id)
-        return self.params["input"][input_id].open(self.tile, **kwargs)
+        else:
+            input_tile = self.params["input"][input_id].open(
+                self.tile, **kwargs)
+        # count read time and bytes when running in batch_processor()
+        if current_timer() is not None:
+            return TimedInputTile(input_tile)
+        return input_tile
+
+    def read_many(self, inputs, threads=None, **kwargs):
+        """
+        Read several inputs concurrently.
+
+        rasterio releases the GIL while reading and decoding data, so reading
+        inputs in threads overlaps their I/O latency. This is useful for
+        processes with many inputs, e.g. bands stored in separate files.
+
+        Parameters
+        ----------
+        inputs : list
+            input identifiers from configuration file, input objects (e.g.
+            from file groups) or input tiles returned by ``open()``
+        threads : integer
+            number of threads reading inputs (default: number of CPU cores)
+        kwargs : driver specific parameters passed on to ``open()`` (e.g.
+            resampling)
+
+        Returns
+        -------
+        data : list
+            data of every input in the given order
+        """
+        input_tiles = [
+            i if hasattr(i, "read") else self.open(i, **kwargs)
+            for i in inputs
+        ]
+        if len(input_tiles) < 2:
+            return [input_tile.read() for input_tile in input_tiles]
+        # threads do not have an active timer, so reading is counted here
+        with timed("read"):
+            data = _get_read_pool(threads or cpu_count()).map(
+                _read_input_tile,
+                [(input_tile, current_block()) for input_tile in input_tiles],
+                chunksize=1)
+        add_bytes(read=sum(getattr(d, "nbytes", 0) for d in data))
+        return data
 
     def hillshade(
         self, elevation, azimuth=315.0, altitude=45.0, z=1.0, scale=1.0
@@ -798,16 +1054,32 @@ def count_tiles(geometry, pyramid, minzoom, maxzoom, init_zoom=0):
     )
     # make sure no rounding errors occur
     geometry = geometry.buffer(-0.000000001)
-    return _count_tiles(
-        [
+    count = 0
+    quadtree_zooms = []
+    for zoom in range(minzoom, maxzoom + 1):
+        coverage = tile_coverage(geometry, unbuffered_pyramid, zoom)
+        if coverage is None:
+            quadtree_zooms.append(zoom)
+        else:
+            count += coverage.count
+    # zoom levels which cannot be rasterized are counted by walking down the
+    # quadtree
+    if quadtree_zooms:
+        init_tiles = [
             unbuffered_pyramid.tile(*tile_id)
             for tile_id in product(
                 [init_zoom],
                 range(pyramid.matrix_height(init_zoom)),
                 range(pyramid.matrix_width(init_zoom))
             )
-        ], geometry, minzoom, maxzoom
-    )
+        ]
+        if quadtree_zooms == list(range(quadtree_zooms[0], maxzoom + 1)):
+            count += _count_tiles(
+                init_tiles, geometry, quadtree_zooms[0], maxzoom)
+        else:
+            for zoom in quadtree_zooms:
+                count += _count_tiles(init_tiles, geometry, zoom, zoom)
+    return count
 
 
 def _count_tiles(tiles, geometry, minzoom, maxzoom):
@@ -842,57 +1114,392 @@ def _count_tiles(tiles, geometry, minzoom, maxzoom):
 ########################################
 def _run_on_single_tile(process, tile):
     logger.debug("run process on single tile")
-    tile, message = _process_worker(
-        process, process.config.process_pyramid.tile(*tuple(tile)))
+    try:
+        tile, message = _process_worker(
+            process, process.config.process_pyramid.tile(*tuple(tile)))
+    except Exception:
+        _record_failed(process, tuple(tile))
+        raise
+    _update_registry(process, [(tile, message)])
+    _flush_registry(process)
     return dict(process_tile=tile, **message)
 
 
-def _run_with_multiprocessing(process, zoom_levels, multi, max_chunksize):
+def _run_with_multiprocessing(
+    process, zoom_levels, multi, max_chunksize, write_threads=0,
+    tile_order="rowcol", adaptive_chunksize=False, prefetch_block=0,
+    prefetch_next=False
+):
     logger.debug("run with multiprocessing")
     num_processed = 0
     total_tiles = process.count_tiles(min(zoom_levels), max(zoom_levels))
     logger.debug(
         "run process on %s tiles using %s workers", total_tiles, multi)
-    f = partial(_process_worker, process)
-    for zoom in zoom_levels:
-        pool = Pool(multi, _worker_sigint_handler)
-        try:
-            for tile, message in pool.imap_unordered(
-                f,
-                process.get_process_tiles(zoom),
+    scheduler = TileScheduler(
+        process, zoom_levels, tile_order, block_size=prefetch_block)
+    existing, unchecked = _existing_process_tiles(process, zoom_levels)
+    chunksize = ChunkSizer(
+        max_chunksize, adaptive=adaptive_chunksize, workers=multi,
+        total=total_tiles)
+    finished = queue.Queue()
+    num_tasks = 0
+    # one pool lives for the whole run; tiles are submitted as soon as the
+    # tiles they depend on are finished; the process object is handed over
+    # once per worker so only tile indexes are sent with each task
+    started = SimpleQueue()
+    pool = Pool(
+        multi, _worker_init,
+        (process, write_threads, prefetch_block, prefetch_next, started))
+    workers = _Workers(multi, started)
+    try:
+        while True:
+            # keep all workers busy plus have one more task queued per worker
+            while num_tasks < multi * 2:
                 # set chunksize to between 1 and max_chunksize
-                chunksize=max_chunksize
-            ):
+                process_tiles = scheduler.ready(chunksize.size())
+                if not process_tiles:
+                    break
+                chunksize.dispatched(len(process_tiles))
+                # tiles found by the existence pre-scan are not dispatched
+                skipped, process_tiles = _split_existing(
+                    process_tiles, existing)
+                for tile in skipped:
+                    scheduler.done(tile)
+                    num_processed += 1
+                    yield dict(process_tile=tile, **_exists_message())
+                if not process_tiles:
+                    continue
+                pool.apply_async(
+                    _process_tiles_worker,
+                    (
+                        [tile.id for tile in process_tiles],
+                        any(tile.zoom in unchecked for tile in process_tiles)
+                    ),
+                    callback=finished.put,
+                    **_error_callback(finished))
+                num_tasks += 1
+            if not num_tasks:
+                break
+            results, duration, exception, failed_tile_id = _get_finished(
+                finished, workers)
+            num_tasks -= 1
+            if exception is not None:
+                _record_failed(process, failed_tile_id)
+                raise exception
+            chunksize.finished(len(results), duration)
+            results = [
+                (process.config.process_pyramid.tile(*tile_id), message)
+                for tile_id, message in results
+            ]
+            _update_registry(process, results)
+            for tile, message in results:
+                scheduler.done(tile)
                 num_processed += 1
                 logger.debug("tile %s/%s finished", num_processed, total_tiles)
                 yield dict(process_tile=tile, **message)
-        except KeyboardInterrupt:
-            logger.error("Caught KeyboardInterrupt, terminating workers")
-            pool.terminate()
-            raise
-        except Exception:
-            pool.terminate()
-            raise
-        finally:
-            pool.close()
-            pool.join()
+    except KeyboardInterrupt:
+        logger.error("Caught KeyboardInterrupt, terminating workers")
+        pool.terminate()
+        raise
+    except Exception:
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+    if scheduler.num_waiting:
+        logger.error(
+            "%s tile(s) not processed because of unmet dependencies",
+            scheduler.num_waiting)
+    else:
+        _complete_journal(process, unchecked)
+    _flush_registry(process)
     logger.debug("%s tile(s) iterated", (str(num_processed)))
 
 
-def _run_without_multiprocessing(process, zoom_levels):
+def _run_without_multiprocessing(
+    process, zoom_levels, tile_order="rowcol", prefetch_block=0,
+    prefetch_next=False
+):
     logger.debug("run without multiprocessing")
     num_processed = 0
     total_tiles = process.count_tiles(min(zoom_levels), max(zoom_levels))
     logger.debug("run process on %s tiles using 1 worker", total_tiles)
-    for zoom in zoom_levels:
-        for process_tile in process.get_process_tiles(zoom):
-            tile, message = _process_worker(process, process_tile)
+    scheduler = TileScheduler(
+        process, zoom_levels, tile_order, block_size=prefetch_block)
+    existing, unchecked = _existing_process_tiles(process, zoom_levels)
+    prefetcher = NextTilePrefetcher(process) if prefetch_next else None
+    next_tiles = []
+    while True:
+        process_tiles = next_tiles or scheduler.ready()
+        if not process_tiles:
+            break
+        # tiles which are ready now do not depend on the current ones, so
+        # they can be taken in advance to prefetch across batches
+        next_tiles = scheduler.ready() if prefetcher else []
+        skipped, process_tiles = _split_existing(process_tiles, existing)
+        results = [(tile, _exists_message()) for tile in skipped]
+        blocks = _tile_blocks(process_tiles, prefetch_block)
+        following = _following_tiles(blocks)
+        upcoming = _split_existing(next_tiles, existing)[1]
+        if process_tiles and upcoming:
+            following[blocks[-1][1][-1].id] = (upcoming[0], None)
+        for block, block_tiles in blocks:
+            with block.active():
+                for process_tile in block_tiles:
+                    if prefetcher and process_tile.id in following:
+                        prefetcher.prefetch(*following[process_tile.id])
+                    try:
+                        tile, message = _process_worker(
+                            process, process_tile,
+                            check_exists=process_tile.zoom in unchecked)
+                    except Exception:
+                        _record_failed(process, process_tile.id)
+                        raise
+                    _update_registry(process, [(tile, message)])
+                    results.append((tile, message))
+        for tile, message in results:
+            scheduler.done(tile)
             num_processed += 1
             logger.debug("tile %s/%s finished", num_processed, total_tiles)
             yield dict(process_tile=tile, **message)
+    if prefetcher:
+        prefetcher.close()
+    _complete_journal(process, unchecked)
+    _flush_registry(process)
     logger.debug("%s tile(s) iterated", (str(num_processed)))
 
 
+def _existing_process_tiles(process, zoom_levels):
+    """
+    Return IDs of process tiles to skip and zoom levels to check per tile.
+
+    In continue mode, process tiles are skipped if the journal of their zoom
+    level is complete and has them as written or empty, so the output is not
+    touched at all. Otherwise the output is listed once per zoom level and the
+    journal is completed with the listed tiles. Zoom levels whose output
+    cannot be listed are returned to be checked per tile by the workers.
+    """
+    if process.config.mode != "continue":
+        return set(), set(zoom_levels)
+    output = process.config.output
+    registry = output.registry
+    existing, unchecked = set(), set()
+    for zoom in zoom_levels:
+        if registry is not None and registry.is_complete(zoom):
+            journaled = registry.recorded(["written", "empty"], zoom=zoom)
+            if not _zoom_output_removed(output, zoom):
+                logger.debug(
+                    "zoom %s: %s journaled tile(s) found", zoom,
+                    len(journaled))
+                existing.update(journaled)
+                continue
+            logger.info(
+                "zoom %s: output removed, discard journal", zoom)
+            registry.discard(zoom)
+        journaled = registry.recorded(
+            ["written", "empty"], zoom=zoom) if registry is not None else set()
+        output_tiles = output.existing_tiles(zoom)
+        if output_tiles is None:
+            # skip journaled tiles and let the workers check the others
+            existing.update(journaled)
+            unchecked.add(zoom)
+            continue
+        logger.debug(
+            "zoom %s: %s existing output tile(s) found", zoom,
+            len(output_tiles))
+        written = _intersecting_process_tiles(process, zoom, output_tiles)
+        existing.update(written)
+        if registry is not None:
+            # processed tiles without output are skipped as well
+            empty = _intersecting_process_tiles(
+                process, zoom, registry.tiles(zoom))
+            existing.update(empty)
+            # from now on the journal holds all finished tiles
+            registry.record(written - journaled, "written")
+            registry.record(empty - written - journaled, "empty")
+            registry.set_complete([zoom])
+    if registry is not None:
+        failed = registry.recorded(["failed"])
+        if failed:
+            logger.info(
+                "%s tile(s) failed in previous runs: %s", len(failed),
+                sorted(failed))
+    return existing, unchecked
+
+
+def _intersecting_process_tiles(process, zoom, output_tiles):
+    """Return IDs of process tiles intersecting output tiles (row, col)."""
+    return set(
+        tile.id
+        for row, col in output_tiles
+        for tile in process.config.process_pyramid.intersecting(
+            process.config.output_pyramid.tile(zoom, row, col))
+    )
+
+
+def _zoom_output_removed(output, zoom):
+    """Return whether a local output directory lacks a whole zoom level."""
+    path = getattr(output, "path", None)
+    return bool(
+        path and
+        os.path.isdir(path) and
+        output.registry.recorded(["written"], zoom=zoom) and
+        not os.path.isdir(os.path.join(path, str(zoom)))
+    )
+
+
+def _complete_journal(process, zoom_levels):
+    """Mark journal complete after all tiles of zoom levels were finished."""
+    registry = process.config.output.registry
+    if (
+        registry is not None and
+        zoom_levels and
+        process.config.mode in ["continue", "overwrite"]
+    ):
+        registry.set_complete(zoom_levels)
+
+
+# open processes sharing the input cache, the dataset pool and the HTTP cache
+# configuration, ordered by when they were opened; processes which are
+# garbage collected without being closed drop out
+_active_processes = []
+_active_lock = threading.Lock()
+
+
+def _activate(process):
+    """Configure shared caches for a newly opened process."""
+    with _active_lock:
+        _active_processes.append(weakref.ref(process))
+        _configure_shared_caches()
+
+
+def _deactivate(process):
+    """Configure shared caches for the remaining open processes."""
+    with _active_lock:
+        _active_processes[:] = [
+            ref for ref in _active_processes if ref() not in [None, process]]
+        if _configure_shared_caches():
+            return
+        raster.close_datasets()
+        input_cache.clear()
+        _http_cache.configure()
+
+
+def _configure_shared_caches():
+    """
+    Apply input_cache and http_cache settings of all open processes.
+
+    The input cache gets the largest budget of all open processes. If the
+    processes use different HTTP cache settings, the ones of the most
+    recently opened process are used. Returns False if no process is open.
+    """
+    configs = [
+        process.config for process in (ref() for ref in _active_processes)
+        if process is not None
+    ]
+    if not configs:
+        return False
+    input_cache_size = max(config.input_cache_size for config in configs)
+    # resizing drops cached arrays
+    if input_cache_size != input_cache.max_bytes:
+        input_cache.resize(input_cache_size)
+    http_caches = [
+        config.http_cache for config in configs if config.http_cache["path"]
+    ]
+    if len(set(tuple(sorted(c.items())) for c in http_caches)) > 1:
+        logger.warning(
+            "open processes use different http_cache settings, using %s",
+            http_caches[-1])
+    _http_cache.configure(**(http_caches[-1] if http_caches else {}))
+    return True
+
+
+def _registry_signature(config):
+    """Return tile pyramids and bounds registered tiles are valid for."""
+    signature = dict(bounds=list(config.bounds))
+    for name, pyramid in [
+        ("process_pyramid", config.process_pyramid),
+        ("output_pyramid", config.output_pyramid)
+    ]:
+        signature[name] = dict(
+            crs=pyramid.crs.to_string(), bounds=list(pyramid.bounds),
+            tile_size=pyramid.tile_size, metatiling=pyramid.metatiling,
+            pixelbuffer=pyramid.pixelbuffer)
+    return json.dumps(signature, sort_keys=True)
+
+
+def _update_registry(process, results):
+    """
+    Register output tiles of empty process tiles and journal finished tiles.
+
+    In overwrite mode, output tiles which were written get removed from the
+    registry. This runs in the parent process only so the registry does not
+    get locked by concurrent workers.
+    """
+    registry = process.config.output.registry
+    if registry is None:
+        return
+    output_pyramid = process.config.output.pyramid
+    empty, written = [], []
+    for process_tile, message in results:
+        if message["write"] == _EMPTY_WRITE_MESSAGE:
+            empty.append(process_tile)
+        elif (
+            message["write"].startswith("output written") or
+            message["process"] == "output already exists"
+        ):
+            # existing output found by the workers is journaled as well
+            written.append(process_tile)
+    registry.add(chain.from_iterable(
+        output_pyramid.intersecting(tile) for tile in empty))
+    if process.config.mode == "overwrite":
+        registry.remove(chain.from_iterable(
+            output_pyramid.intersecting(tile) for tile in written))
+    registry.record([tile.id for tile in empty], "empty")
+    registry.record([tile.id for tile in written], "written")
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # output is not a local file
+        return 0
+
+
+def _record_failed(process, tile_id):
+    """Record failed process tile in journal."""
+    registry = process.config.output.registry
+    if registry is not None and tile_id is not None:
+        logger.error("process tile %s failed", tile_id)
+        registry.record([tile_id], "failed")
+        registry.flush()
+
+
+def _flush_registry(process):
+    registry = process.config.output.registry
+    if registry is not None:
+        registry.flush()
+
+
+def _exists_message():
+    """Report for process tiles skipped because their output exists."""
+    return dict(
+        process="output already exists", write="nothing written",
+        timings=TileTimer().as_dict())
+
+
+def _split_existing(process_tiles, existing):
+    """Split process tiles into tiles with existing output and the rest."""
+    if not existing:
+        return [], process_tiles
+    return (
+        [tile for tile in process_tiles if tile.id in existing],
+        [tile for tile in process_tiles if tile.id not in existing]
+    )
+
+
 def _get_zoom_level(zoom, process):
     """Determine zoom levels."""
     if zoom is None:
@@ -905,32 +1512,249 @@ def _get_zoom_level(zoom, process):
         return zoom
 
 
-def _process_worker(process, process_tile):
-    """Worker function running the process."""
+def _process_worker(process, process_tile, writer=None, check_exists=True):
+    """
+    Worker function running the process.
+
+    If a writer is given, output is handed over to it and the write message is
+    replaced by an ``AsyncResult`` eventually holding the write message.
+    ``check_exists`` can be deactivated if existing output was already
+    filtered out by a pre-scan.
+    """
     logger.debug((process_tile.id, "running on %s" % current_process().name))
 
     # skip execution if overwrite is disabled and tile exists
-    if process.config.mode == "continue" and (
+    if check_exists and process.config.mode == "continue" and (
         process.config.output.tiles_exist(process_tile)
     ):
         logger.debug((process_tile.id, "tile exists, skipping"))
-        return process_tile, dict(
-            process="output already exists",
-            write="nothing written")
+        return process_tile, _exists_message()
 
     # execute on process tile
     else:
+        timer = TileTimer()
         start = time.time()
-        try:
-            output = process.execute(process_tile, raise_nodata=True)
-        except MapcheteNodataTile:
-            output = None
+        with timer.active():
+            with timed("process"):
+                try:
+                    output = process.execute(process_tile, raise_nodata=True)
+                except MapcheteNodataTile:
+                    output = None
         processor_message = "processed in %ss" % round(time.time() - start, 3)
         logger.debug((process_tile.id, processor_message))
-        writer_message = process.write(process_tile, output)
-        return process_tile, dict(
-            process=processor_message,
-            write=writer_message)
+        if writer is None:
+            with timer.active():
+                with timed("write"):
+                    writer_message = process.write(process_tile, output)
+            return process_tile, dict(
+                process=processor_message,
+                write=writer_message,
+                timings=timer.as_dict())
+        else:
+            # timings are complete once the writer has finished
+            return process_tile, dict(
+                process=processor_message,
+                write=writer.write(process_tile, output, timer),
+                timings=timer)
+
+
+class _PipelinedWriter(object):
+    """
+    Write process output in background threads.
+
+    At most twice as many outputs as threads are kept waiting in memory; if
+    this limit is reached, the worker blocks until a write has finished.
+    ``close()`` waits for pending writes and stops the threads.
+    """
+
+    def __init__(self, process, threads):
+        self.process = process
+        self.pool = ThreadPool(threads)
+        self.slots = threading.BoundedSemaphore(threads * 2)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def write(self, process_tile, output, timer):
+        self.slots.acquire()
+        return self.pool.apply_async(
+            self._write, (process_tile, output, timer))
+
+    def _write(self, process_tile, output, timer):
+        try:
+            with timer.active():
+                with timed("write"):
+                    return self.process.write(process_tile, output)
+        finally:
+            self.slots.release()
+
+
+def _worker_init(
+    process, write_threads=0, prefetch_block=0, prefetch_next=False,
+    started=None
+):
+    """
+    Keep process in worker for subsequent tasks and ignore SIGINT.
+
+    If a ``started`` queue is given, the worker reports its process ID to it.
+    """
+    global _worker_process, _worker_write_threads, _worker_prefetch_block, \
+        _worker_prefetcher
+    if started is not None:
+        started.put(os.getpid())
+    _worker_process = process
+    input_cache.resize(process.config.input_cache_size)
+    _http_cache.configure(**process.config.http_cache)
+    _worker_prefetch_block = prefetch_block
+    _worker_prefetcher = NextTilePrefetcher(process) if prefetch_next else None
+    _worker_write_threads = write_threads
+    _worker_sigint_handler()
+
+
+def _error_callback(finished):
+    """
+    Return keyword arguments to put failed tasks on the finished queue.
+
+    Tasks fail outside of _process_tiles_worker() e.g. if the result cannot
+    be pickled. Python 2 pools do not support error callbacks.
+    """
+    if six.PY2:  # pragma: no cover
+        return {}
+    return dict(error_callback=lambda e: finished.put((None, None, e, None)))
+
+
+class _Workers(object):
+    """
+    Process IDs reported by pool workers when they are started.
+
+    Workers of a pool without maxtasksperchild are only replaced if they
+    died, e.g. killed by the OOM killer, and their task is lost. A replaced
+    worker reports its process ID as well, so more process IDs than workers
+    mean a worker died.
+    """
+
+    def __init__(self, num_workers, started):
+        self.num_workers = num_workers
+        self.started = started
+        self.pids = set()
+
+    def replaced(self):
+        """Return whether a worker was replaced."""
+        # SimpleQueue writes synchronously, so IDs of killed workers are
+        # not lost in a feeder thread
+        while not self.started.empty():
+            self.pids.add(self.started.get())
+        return len(self.pids) > self.num_workers
+
+
+def _get_finished(finished, workers):
+    """Return next task result or raise if a worker died."""
+    while True:
+        try:
+            return finished.get(timeout=1)
+        except queue.Empty:
+            if workers.replaced():
+                raise MapcheteProcessException(
+                    "worker process died unexpectedly")
+
+
+def _process_tiles_worker(tile_ids, check_exists=True):
+    """
+    Worker function running the process on a list of process tile indexes.
+
+    Exceptions are returned together with the failed tile index instead of
+    raised so the parent process can record the failed tile and re-raise them
+    without waiting for a result which never arrives. The task duration is
+    returned to adapt the size of subsequent tasks.
+    """
+    process = _worker_process
+    start = time.time()
+    tile_id = None
+    # writer threads of a task are stopped once its output is written or it
+    # failed
+    writer = (
+        _PipelinedWriter(process, _worker_write_threads)
+        if _worker_write_threads else None)
+    try:
+        results = []
+        blocks = _tile_blocks(
+            [process.config.process_pyramid.tile(*t) for t in tile_ids],
+            _worker_prefetch_block)
+        following = _following_tiles(blocks)
+        for block, process_tiles in blocks:
+            with block.active():
+                for process_tile in process_tiles:
+                    tile_id = process_tile.id
+                    if _worker_prefetcher and tile_id in following:
+                        _worker_prefetcher.prefetch(*following[tile_id])
+                    results.append(_process_worker(
+                        process, process_tile, writer=writer,
+                        check_exists=check_exists))
+        # wait until all output of this task is written
+        for process_tile, message in results:
+            if isinstance(message["write"], AsyncResult):
+                tile_id = process_tile.id
+                message.update(
+                    write=message["write"].get(),
+                    timings=message["timings"].as_dict())
+        return [
+            (process_tile.id, message) for process_tile, message in results
+        ], time.time() - start, None, None
+    except Exception as e:
+        return None, None, e, tile_id
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _get_read_pool(threads):
+    """Return thread pool for reading inputs, create new ones after fork."""
+    global _read_pools
+    with _read_pools_lock:
+        if _read_pools[0] != os.getpid():
+            _read_pools = (os.getpid(), {})
+        if threads not in _read_pools[1]:
+            _read_pools[1][threads] = ThreadPool(threads)
+        return _read_pools[1][threads]
+
+
+def _read_input_tile(args):
+    input_tile, block = args
+    with use_block(block):
+        return input_tile.read()
+
+
+def _tile_blocks(process_tiles, block_size):
+    """
+    Group process tiles into ``TileBlock`` objects.
+
+    Without block_size, every tile is a block on its own which does not
+    prefetch anything.
+    """
+    blocks = OrderedDict()
+    for i, tile in enumerate(process_tiles):
+        blocks.setdefault(
+            block_key(tile, block_size) if block_size else i, []
+        ).append(tile)
+    return [(TileBlock(tiles), tiles) for tiles in blocks.values()]
+
+
+def _following_tiles(blocks):
+    """
+    Map every tile id to the following tile and the block covering both.
+
+    The block is only given if the following tile is part of the same
+    prefetchable block, otherwise it is None.
+    """
+    pairs = [(block, tile) for block, tiles in blocks for tile in tiles]
+    return {
+        tile.id: (
+            next_tile,
+            block if next_block is block and block.prefetchable else None
+        )
+        for (block, tile), (next_block, next_tile) in zip(pairs, pairs[1:])
+    }
 
 
 def _worker_sigint_handler():
@@ -0,0 +1,156 @@
+"""Determine tiles intersecting with a geometry by rasterizing it."""
+
+from affine import Affine
+import logging
+import numpy as np
+from rasterio.features import rasterize
+from shapely.prepared import prep
+
+
+logger = logging.getLogger(__name__)
+
+# maximum number of tile matrix cells to be rasterized at once; larger areas
+# fall back to tilematrix
+MAX_CELLS = 2 ** 25
+
+
+class TileCoverage(object):
+    """
+    Tiles of one zoom level intersecting with a geometry.
+
+    Parameters
+    ----------
+    zoom : integer
+        zoom level
+    row_offset : integer
+        first row of mask in tile matrix
+    col_offset : integer
+        first column of mask in tile matrix
+    mask : array
+        2D boolean array, True for intersecting tiles
+
+    Attributes
+    ----------
+    count : integer
+        number of intersecting tiles
+    """
+
+    def __init__(self, zoom, row_offset, col_offset, mask):
+        """Initialize."""
+        self.zoom = zoom
+        self.row_offset = row_offset
+        self.col_offset = col_offset
+        self.mask = mask
+        self.count = int(mask.sum())
+
+    def tile_ids(self):
+        """
+        Yield intersecting tile indexes row by row.
+
+        Yields
+        ------
+        tile index : tuple
+            zoom, row, col
+        """
+        for row_index in np.flatnonzero(self.mask.any(axis=1)):
+            row = self.row_offset + int(row_index)
+            for col_index in np.flatnonzero(self.mask[row_index]):
+                yield self.zoom, row, self.col_offset + int(col_index)
+
+
+def tile_coverage(geometry, pyramid, zoom):
+    """
+    Determine tiles of a zoom level intersecting with a geometry.
+
+    The result is the same as from ``TilePyramid.tiles_from_geom()``, but
+    instead of intersecting every tile within the geometry bounding box, the
+    geometry is rasterized onto the tile matrix. Only tiles touched by a
+    polygon boundary are checked exactly using shapely.
+
+    Parameters
+    ----------
+    geometry : ``shapely.geometry``
+    pyramid : ``TilePyramid``
+    zoom : integer
+        zoom level
+
+    Returns
+    -------
+    coverage : ``TileCoverage`` or None
+        None if the geometry cannot be handled (e.g. points, invalid
+        geometries, geometries crossing the pyramid bounds or a bounding box
+        with too many tiles); use ``TilePyramid.tiles_from_geom()`` instead
+    """
+    if geometry.is_empty:
+        return TileCoverage(zoom, 0, 0, np.zeros((0, 0), dtype=bool))
+    if (
+        geometry.geom_type not in (
+            "LineString", "MultiLineString", "Polygon", "MultiPolygon",
+            "GeometryCollection") or
+        not geometry.is_valid
+    ):
+        return None
+    left, bottom, right, top = geometry.bounds
+    if (
+        left < pyramid.left or bottom < pyramid.bottom or
+        right > pyramid.right or top > pyramid.top
+    ):
+        return None
+    # same window as TilePyramid.tiles_from_bbox()
+    try:
+        lb = pyramid.tile_from_xy(left, bottom, zoom, on_edge_use="rt")
+        rt = pyramid.tile_from_xy(right, top, zoom, on_edge_use="lb")
+    except ValueError:
+        return None
+    if lb.col > rt.col or rt.row > lb.row:
+        return None
+    row_offset, col_offset = rt.row, lb.col
+    shape = (lb.row - rt.row + 1, rt.col - lb.col + 1)
+    if shape[0] * shape[1] > MAX_CELLS:
+        logger.debug(
+            "zoom %s: %s tiles in bounding box, too many to rasterize", zoom,
+            shape[0] * shape[1])
+        return None
+    tile_x_size = pyramid.tile_x_size(zoom)
+    tile_y_size = pyramid.tile_y_size(zoom)
+    transform = Affine(
+        tile_x_size, 0, pyramid.left + col_offset * tile_x_size,
+        0, -tile_y_size, pyramid.top - row_offset * tile_y_size)
+
+    def _rasterize(geom):
+        return rasterize(
+            [geom], out_shape=shape, transform=transform, fill=0,
+            default_value=1, all_touched=True, dtype="uint8"
+        ).astype(bool)
+
+    if geometry.geom_type in ("Polygon", "MultiPolygon"):
+        # tiles touched by the polygon but not by its boundary are within
+        # the polygon; add neighbours of boundary tiles to be safe from
+        # rounding errors
+        candidates = _dilate(_rasterize(geometry.boundary))
+        mask = _rasterize(geometry) & ~candidates
+    else:
+        candidates = _dilate(_rasterize(geometry))
+        mask = np.zeros(shape, dtype=bool)
+    # check remaining tiles exactly
+    prepared = prep(geometry)
+    for row_index, col_index in zip(*np.nonzero(candidates)):
+        if prepared.intersects(
+            pyramid.tile(
+                zoom, row_offset + int(row_index), col_offset + int(col_index)
+            ).bbox()
+        ):
+            mask[row_index, col_index] = True
+    return TileCoverage(zoom, row_offset, col_offset, mask)
+
+
+def _dilate(mask):
+    """Add all 8 neighbours of True cells."""
+    padded = np.pad(mask, 1, mode="constant")
+    height, width = mask.shape
+    out = np.zeros(mask.shape, dtype=bool)
+    for row_shift in range(3):
+        for col_shift in range(3):
+            out |= padded[
+                row_shift:row_shift + height, col_shift:col_shift + width]
+    return out
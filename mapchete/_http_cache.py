@@ -0,0 +1,518 @@
+"""Persistent disk cache of byte ranges read from remote raster files."""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import urlparse
+from six.moves.urllib.request import (
+    build_opener, HTTPSHandler, ProxyHandler, Request)
+
+from mapchete.errors import MapcheteConfigError
+
+
+logger = logging.getLogger(__name__)
+
+# size of cached byte ranges
+BLOCK_SIZE = 2 ** 16
+# timeout of requests to remote servers in seconds
+HTTP_TIMEOUT = 30
+# GDAL options for connections to remote servers which the proxy has to apply
+# as GDAL only connects to the proxy
+UPSTREAM_OPTS = (
+    "GDAL_HTTP_PROXY", "GDAL_HTTPS_PROXY", "GDAL_HTTP_PROXYUSERPWD",
+    "GDAL_HTTP_UNSAFESSL", "CURL_CA_BUNDLE"
+)
+# request headers not forwarded to remote servers, either hop-by-hop or
+# changing the response of cached requests
+_LOCAL_HEADERS = (
+    "accept-encoding", "connection", "host", "if-modified-since",
+    "if-none-match", "if-range", "keep-alive", "proxy-authorization",
+    "range", "te", "trailer", "transfer-encoding", "upgrade"
+)
+
+
+class BlockCache(object):
+    """
+    Keep blocks of remote files on local disk.
+
+    Remote files are split into blocks of ``block_size`` bytes which are
+    stored as one file per block, keyed by URL, ETag, request headers and
+    byte offset. If a server does not send an ETag, Last-Modified and the file
+    size are used instead, so changed remote files are fetched again. As the
+    request headers are part of the key, blocks fetched with one set of
+    credentials are never served to requests with other or no credentials.
+
+    Blocks are written to a temporary file first and then renamed, so several
+    processes can share one cache directory without locking. Blocks removed
+    by another process are fetched again. Once more than a tenth of
+    ``max_bytes`` has been written, the least recently used blocks are removed
+    until the cache fits into ``max_bytes``.
+
+    Requests to remote servers carry the given ``headers``, e.g. for
+    authentication, and are sent using the proxy and SSL settings in
+    ``options`` (see ``UPSTREAM_OPTS``).
+
+    Parameters
+    ----------
+    path : string
+        cache directory
+    max_bytes : integer
+        maximum size of all cached blocks
+    block_size : integer
+        size of cached byte ranges (default: 64 KiB)
+
+    Attributes
+    ----------
+    requests : integer
+        number of requests sent to remote servers
+    """
+
+    def __init__(self, path, max_bytes, block_size=BLOCK_SIZE):
+        """Initialize."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.requests = 0
+        self._files = {}
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def stat(self, url, headers=None, options=None):
+        """
+        Return cache key and size of remote file.
+
+        The remote file is only requested once per ``BlockCache`` object and
+        set of request headers.
+
+        Parameters
+        ----------
+        url : string
+            HTTP(S) URL of remote file
+        headers : dict
+            request headers sent to remote server
+        options : dict
+            proxy and SSL options for remote server
+
+        Returns
+        -------
+        key : string
+            hash of URL, ETag and request headers
+        size : integer
+            file size in bytes
+        """
+        # headers may carry credentials, so files are cached per user
+        file_id = (url, _headers_hash(headers))
+        with self._lock:
+            if file_id in self._files:
+                return self._files[file_id]
+        request = Request(url, headers=headers or {})
+        request.get_method = lambda: "HEAD"
+        response = self._open(request, options)
+        headers = response.info()
+        response.close()
+        size = int(headers["Content-Length"])
+        version = headers.get("ETag") or "%s %s" % (
+            headers.get("Last-Modified"), size)
+        key = hashlib.sha1(
+            ("%s %s %s" % (url, version, file_id[1])).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            self._files[file_id] = key, size
+        return key, size
+
+    def read(self, url, start, end, headers=None, options=None):
+        """
+        Return byte range of remote file from cache or remote server.
+
+        Consecutive blocks missing in the cache are fetched with one request.
+
+        Parameters
+        ----------
+        url : string
+            HTTP(S) URL of remote file
+        start : integer
+            first byte
+        end : integer
+            last byte (inclusive)
+        headers : dict
+            request headers sent to remote server
+        options : dict
+            proxy and SSL options for remote server
+
+        Returns
+        -------
+        data : bytes
+        """
+        key, size = self.stat(url, headers, options)
+        end = min(end, size - 1)
+        if end < start:
+            return b""
+        first, last = start // self.block_size, end // self.block_size
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            data = self._load(key, index)
+            if data is None:
+                missing.append(index)
+            else:
+                blocks[index] = data
+        for indexes in _consecutive(missing):
+            data = self._fetch(
+                url,
+                indexes[0] * self.block_size,
+                min((indexes[-1] + 1) * self.block_size, size) - 1,
+                headers, options
+            )
+            for i, index in enumerate(indexes):
+                blocks[index] = data[
+                    i * self.block_size:(i + 1) * self.block_size]
+                self._store(key, index, blocks[index])
+        data = b"".join(blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset + 1]
+
+    def evict(self):
+        """Remove least recently used blocks until cache fits max_bytes."""
+        blocks = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                blocks.append(
+                    (stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in blocks)
+        for _, size, path in sorted(blocks):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another process
+                pass
+            total -= size
+        with self._lock:
+            self._written = 0
+
+    def _block_path(self, key, index):
+        # block files are named by byte offset and block size
+        return os.path.join(self.path, key[:2], key, "%s_%s" % (
+            index * self.block_size, self.block_size))
+
+    def _load(self, key, index):
+        path = self._block_path(key, index)
+        try:
+            with open(path, "rb") as src:
+                data = src.read()
+            # modification time marks recently used blocks
+            os.utime(path, None)
+            return data
+        except (IOError, OSError):
+            return None
+
+    def _store(self, key, index, data):
+        path = self._block_path(key, index)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        temp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        with open(temp, "wb") as dst:
+            dst.write(data)
+        getattr(os, "replace", os.rename)(temp, path)
+        with self._lock:
+            self._written += len(data)
+            full = self._written > self.max_bytes // 10
+        if full:
+            self.evict()
+
+    def _fetch(self, url, start, end, headers=None, options=None):
+        headers = dict(headers or {}, Range="bytes=%s-%s" % (start, end))
+        response = self._open(Request(url, headers=headers), options)
+        data = response.read()
+        response.close()
+        # servers not supporting ranges send the whole file
+        if response.getcode() == 200:
+            data = data[start:end + 1]
+        return data
+
+    def _open(self, request, options=None):
+        with self._lock:
+            self.requests += 1
+        logger.debug("%s %s", request.get_method(), request.get_full_url())
+        return _opener(options or {}).open(request, timeout=HTTP_TIMEOUT)
+
+
+def _headers_hash(headers):
+    """Return hash of request headers independent of order and case."""
+    return hashlib.sha1(json.dumps(sorted(
+        (k.lower(), v) for k, v in (headers or {}).items()
+    )).encode("utf-8")).hexdigest()
+
+
+def _opener(options):
+    """Return URL opener applying GDAL proxy and SSL options."""
+    handlers = []
+    proxy = options.get("GDAL_HTTP_PROXY")
+    if proxy:
+        userpwd = options.get("GDAL_HTTP_PROXYUSERPWD")
+        if userpwd and "@" not in proxy:
+            scheme, _, address = proxy.rpartition("://")
+            proxy = "%s://%s@%s" % (scheme or "http", userpwd, address)
+        elif "://" not in proxy:
+            proxy = "http://" + proxy
+        handlers.append(ProxyHandler(dict(
+            http=proxy,
+            https=options.get("GDAL_HTTPS_PROXY") or proxy)))
+    if _true(options.get("GDAL_HTTP_UNSAFESSL")):
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        handlers.append(HTTPSHandler(context=context))
+    elif options.get("CURL_CA_BUNDLE"):
+        handlers.append(HTTPSHandler(context=ssl.create_default_context(
+            cafile=options["CURL_CA_BUNDLE"])))
+    return build_opener(*handlers)
+
+
+def _true(value):
+    return str(value).upper() in ("TRUE", "YES", "ON", "1")
+
+
+class _ProxyHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve HEAD and ranged GET requests from the server's BlockCache."""
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        cache = self.server.cache
+        try:
+            url, options = _decode_url(self.path, self.server.token)
+        except Exception:
+            # only URLs created by cached_url() of this run are served
+            self.send_error(403)
+            return
+        # headers GDAL sends e.g. from GDAL_HTTP_USERPWD or
+        # GDAL_HTTP_HEADER_FILE are passed on to the remote server
+        headers = {
+            k: v for k, v in self.headers.items()
+            if k.lower() not in _LOCAL_HEADERS
+        }
+        try:
+            _, size = cache.stat(url, headers, options)
+            start, end = _parse_range(self.headers.get("Range"), size)
+            data = (
+                cache.read(url, start, end, headers, options) if send_body
+                else None
+            )
+        except HTTPError as e:
+            self.send_error(e.code)
+            return
+        except Exception as e:
+            logger.exception("cannot serve %s: %s", self.path, e)
+            self.send_error(502)
+            return
+        if self.headers.get("Range"):
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes %s-%s/%s" % (start, end, size))
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class _ProxyServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+# cache directory, size and (owner pid, process, port, token) of the proxy
+# server
+_cache_path = None
+_cache_max_bytes = 0
+_proxy = None
+
+
+def configure(path=None, max_bytes=0):
+    """
+    Configure the block cache used by ``cached_url()``.
+
+    Parameters
+    ----------
+    path : string
+        cache directory; None disables the cache
+    max_bytes : integer
+        maximum size of all cached blocks
+    """
+    global _cache_path, _cache_max_bytes
+    if (path, max_bytes) == (_cache_path, _cache_max_bytes):
+        return
+    _stop_proxy()
+    _cache_path = path
+    _cache_max_bytes = max_bytes
+    # start the proxy before worker processes are forked so they share it
+    if _cache_path:
+        _start_proxy()
+
+
+def cached_url(url, gdal_opts=None):
+    """
+    Return URL reading a remote file through the block cache.
+
+    GDAL reads remote files using HTTP range requests. These are sent to a
+    local proxy server which serves byte ranges from the ``BlockCache``. The
+    proxy runs in a separate process as GDAL does not release the GIL for all
+    requests; forked worker processes share the proxy of their parent.
+
+    Request headers GDAL sends, e.g. for ``GDAL_HTTP_USERPWD`` or
+    ``GDAL_HTTP_HEADER_FILE``, are passed on to the remote server. Proxy and
+    SSL options (see ``UPSTREAM_OPTS``) from ``gdal_opts`` or the environment
+    are encoded in the returned URL and applied by the proxy; GDAL itself has
+    to connect to the returned URL without a proxy. The proxy only serves URLs
+    containing a random token of the current run.
+
+    Parameters
+    ----------
+    url : string
+        file path or URL
+    gdal_opts : dict
+        GDAL options used for reading
+
+    Returns
+    -------
+    url : string
+        URL of proxy server if cache is configured and url is a HTTP(S) URL,
+        otherwise the unchanged url
+    """
+    if not _cache_path or not url.startswith(("http://", "https://")):
+        return url
+    if _proxy is None:
+        _start_proxy()
+    gdal_opts = gdal_opts or {}
+    options = {
+        k: str(gdal_opts.get(k, os.environ.get(k)))
+        for k in UPSTREAM_OPTS
+        if gdal_opts.get(k, os.environ.get(k)) is not None
+    }
+    # keep the file name so GDAL recognizes the file extension and can
+    # request sidecar files like overviews; the query string e.g. of signed
+    # URLs stays with the file name
+    parsed = urlparse(url)
+    base, name = parsed.path.rsplit("/", 1)
+    encoded = base64.urlsafe_b64encode(json.dumps(dict(
+        url="%s://%s%s" % (parsed.scheme, parsed.netloc, base),
+        options=options
+    ), sort_keys=True).encode("utf-8")).decode("ascii")
+    return "http://127.0.0.1:%s/%s/%s/%s%s" % (
+        _proxy[2], _proxy[3], encoded.rstrip("="), name,
+        "?" + parsed.query if parsed.query else "")
+
+
+def _start_proxy():
+    global _proxy
+    token = uuid.uuid4().hex
+    # errors go to a file instead of a pipe which could fill up and block the
+    # proxy
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [
+                sys.executable, "-c",
+                "from mapchete._http_cache import _serve; "
+                "_serve(%r, %s, %r)" % (_cache_path, _cache_max_bytes, token)
+            ],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+        line = process.stdout.readline().strip()
+        if not line.isdigit() or process.poll() is not None:
+            process.stdin.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            stderr.seek(0)
+            raise MapcheteConfigError(
+                "cannot start http_cache proxy on %s: %s" % (
+                    _cache_path,
+                    stderr.read().decode("utf-8", "replace").strip() or
+                    "exit code %s" % process.returncode))
+    port = int(line)
+    _proxy = (os.getpid(), process, port, token)
+    logger.debug("block cache proxy listening on port %s", port)
+
+
+def _stop_proxy():
+    global _proxy
+    if _proxy is not None and _proxy[0] == os.getpid():
+        _proxy[1].stdin.close()
+        _proxy[1].terminate()
+        _proxy[1].wait()
+    _proxy = None
+
+
+def _serve(path, max_bytes, token):
+    server = _ProxyServer(("127.0.0.1", 0), _ProxyHandler)
+    server.cache = BlockCache(path, max_bytes)
+    server.token = token
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    sys.stdout.write("%s\n" % server.server_address[1])
+    sys.stdout.flush()
+    # stop if the parent process exits without terminating the proxy
+    sys.stdin.read()
+
+
+def _decode_url(path, token):
+    parsed = urlparse(path)
+    request_token, encoded, name = parsed.path.lstrip("/").split("/", 2)
+    if request_token != token:
+        raise ValueError("invalid token")
+    decoded = json.loads(base64.urlsafe_b64decode(
+        (encoded + "=" * (-len(encoded) % 4)).encode("ascii")
+    ).decode("utf-8"))
+    url = "%s/%s%s" % (
+        decoded["url"], name, "?" + parsed.query if parsed.query else "")
+    return url, decoded["options"]
+
+
+def _parse_range(header, size):
+    if not header:
+        return 0, size - 1
+    start, end = header.split("=")[1].split(",")[0].split("-")
+    if not start:
+        # suffix range: last n bytes
+        return max(size - int(end), 0), size - 1
+    return int(start), (min(int(end), size - 1) if end else size - 1)
+
+
+def _consecutive(indexes):
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
@@ -0,0 +1,146 @@
+"""Cache of decoded and reprojected input arrays within a process."""
+
+from cachetools import LRUCache
+import logging
+import threading
+
+from mapchete._timing import count_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class InputCache(object):
+    """
+    Keep decoded input arrays in memory up to a total number of bytes.
+
+    Reading the same input for the same tile again, e.g. reading bands one
+    by one or opening an input twice within a process, then returns a copy
+    of the cached array instead of decoding and warping it again. Least
+    recently used arrays are dropped once ``max_bytes`` is exceeded. Hits and
+    misses are counted in the active ``TileTimer``.
+
+    Arrays can also be read in advance by a background thread using
+    ``prefetch()``; reads of an array which is still being prefetched wait for
+    the prefetch instead of reading it twice.
+
+    Parameters
+    ----------
+    max_bytes : integer
+        memory budget in bytes; 0 disables the cache (default: 0)
+
+    Attributes
+    ----------
+    hits : integer
+        number of reads served from cache
+    misses : integer
+        number of reads which had to be decoded
+    """
+
+    def __init__(self, max_bytes=0):
+        """Initialize."""
+        self._lock = threading.Lock()
+        self.resize(max_bytes)
+
+    def resize(self, max_bytes):
+        """
+        Set memory budget and drop all cached arrays.
+
+        Parameters
+        ----------
+        max_bytes : integer
+            memory budget in bytes; 0 disables the cache
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._arrays = LRUCache(
+                maxsize=max_bytes, getsizeof=_nbytes) if max_bytes else None
+            self._pending = {}
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key, read):
+        """
+        Return cached array or read and cache it.
+
+        Parameters
+        ----------
+        key : tuple
+            hashable identifier of input, tile, bands and read options
+        read : callable
+            function returning the array if not cached
+
+        Returns
+        -------
+        data : array
+            newly read array or copy of the cached array
+        """
+        if self._arrays is None:
+            return read()
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            pending.wait()
+        with self._lock:
+            data = self._arrays.get(key)
+            if data is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        count_cache(hit=data is not None)
+        # processes can modify returned arrays without affecting the cache
+        if data is not None:
+            return data.copy()
+        data = read()
+        # arrays exceeding the budget are returned without any copy
+        if _nbytes(data) <= self.max_bytes:
+            with self._lock:
+                self._arrays[key] = data.copy()
+        return data
+
+    def prefetch(self, key, read):
+        """
+        Read array and cache it unless it is already cached or being read.
+
+        Prefetched arrays count as hits once they are requested by ``get()``.
+
+        Parameters
+        ----------
+        key : tuple
+            hashable identifier of input, tile, bands and read options
+        read : callable
+            function returning the array
+        """
+        with self._lock:
+            arrays = self._arrays
+            if arrays is None or key in arrays or key in self._pending:
+                return
+            pending = self._pending[key] = threading.Event()
+        try:
+            data = read()
+            if _nbytes(data) <= self.max_bytes:
+                with self._lock:
+                    arrays[key] = data
+        except Exception as e:
+            # the read is repeated and fails again once the data is requested
+            logger.debug("prefetching %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+    def clear(self):
+        """Drop all cached arrays."""
+        self.resize(self.max_bytes)
+
+    def __len__(self):
+        """Return number of cached arrays."""
+        return len(self._arrays) if self._arrays is not None else 0
+
+
+def _nbytes(data):
+    mask = getattr(data, "mask", None)
+    return data.nbytes + getattr(mask, "nbytes", 0)
+
+
+input_cache = InputCache()
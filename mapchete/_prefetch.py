@@ -0,0 +1,257 @@
+"""Read raster inputs once for a block of adjacent process tiles."""
+
+from affine import Affine
+from contextlib import contextmanager
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+
+from mapchete.io.raster import extract_from_array, read_raster_window
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class TileBlock(object):
+    """
+    Serve input reads of adjacent process tiles from one read per input.
+
+    Buffered process tiles of neighbouring tiles overlap, so reading every
+    tile separately decodes and warps the same pixels several times. Once a
+    block is activated, raster inputs are read for the union bounds of all
+    its tiles and tiles get a slice of this array.
+
+    Blocks touching the tile pyramid boundaries are not prefetched as reads
+    there have to be split on the antimeridian.
+
+    Parameters
+    ----------
+    process_tiles : list
+        ``BufferedTile`` objects of one zoom level
+
+    Attributes
+    ----------
+    bounds : tuple
+        left, bottom, right, top of all tiles including their buffers
+    shape : tuple
+        height and width in pixels
+    crs : ``rasterio.crs.CRS``
+    affine : ``Affine``
+    pixelbuffer : integer
+        always 0 as tile buffers are already contained in bounds
+    """
+
+    def __init__(self, process_tiles):
+        """Initialize."""
+        tile = process_tiles[0]
+        if any(t.zoom != tile.zoom for t in process_tiles):
+            raise ValueError("tiles of a block must have the same zoom level")
+        self.tile_pyramid = tile.tile_pyramid
+        self.crs = tile.crs
+        self.pixel_x_size = tile.pixel_x_size
+        self.pixel_y_size = tile.pixel_y_size
+        self.pixelbuffer = 0
+        # bounds of BufferedTiles include the pixelbuffer
+        self.bounds = (
+            min(t.bounds[0] for t in process_tiles),
+            min(t.bounds[1] for t in process_tiles),
+            max(t.bounds[2] for t in process_tiles),
+            max(t.bounds[3] for t in process_tiles)
+        )
+        left, bottom, right, top = self.bounds
+        self.shape = (
+            int(round((top - bottom) / self.pixel_y_size)),
+            int(round((right - left) / self.pixel_x_size))
+        )
+        self.affine = Affine(
+            self.pixel_x_size, 0, left, 0, -self.pixel_y_size, top)
+        self._tile_ids = set(t.id for t in process_tiles)
+        self._data = {}
+
+    @property
+    def prefetchable(self):
+        """Return whether block lies within the tile pyramid boundaries."""
+        left, bottom, right, top = self.bounds
+        return (
+            len(self._tile_ids) > 1 and
+            left > self.tile_pyramid.left and
+            bottom > self.tile_pyramid.bottom and
+            right < self.tile_pyramid.right and
+            top < self.tile_pyramid.top
+        )
+
+    @contextmanager
+    def active(self):
+        """Make this the active block of the current thread."""
+        try:
+            with use_block(self if self.prefetchable else None):
+                yield self
+        finally:
+            self._data = {}
+
+    def covers(self, tile):
+        """
+        Return whether tile is part of this block.
+
+        Parameters
+        ----------
+        tile : ``BufferedTile``
+
+        Returns
+        -------
+        covered : bool
+        """
+        left, bottom, right, top = self.bounds
+        return (
+            tile.id in self._tile_ids and
+            tile.bounds[0] >= left and tile.bounds[1] >= bottom and
+            tile.bounds[2] <= right and tile.bounds[3] <= top
+        )
+
+    def read(
+        self, input_file, tile, indexes=None, resampling="nearest",
+        gdal_opts=None
+    ):
+        """
+        Return input data of tile sliced from the data read for the block.
+
+        Parameters
+        ----------
+        input_file : string
+            path to a raster file readable by rasterio
+        tile : ``BufferedTile``
+            tile covered by this block
+        indexes : list or int
+            a list of band numbers; None will read all
+        resampling : string
+            resampling method passed on to ``read_raster_window()``
+        gdal_opts : dict
+            GDAL options passed on to rasterio.Env()
+
+        Returns
+        -------
+        raster : MaskedArray
+        """
+        key = (
+            input_file,
+            indexes if isinstance(indexes, int) or indexes is None
+            else tuple(indexes),
+            resampling,
+            tuple(sorted((gdal_opts or {}).items()))
+        )
+        if key not in self._data:
+            logger.debug("read %s for block of %s tiles", input_file, len(
+                self._tile_ids))
+            self._data[key] = read_raster_window(
+                input_file, self, indexes=indexes, resampling=resampling,
+                gdal_opts=gdal_opts)
+        # copy so processes can modify their input without affecting others
+        return extract_from_array(
+            in_raster=self._data[key], in_affine=self.affine, out_tile=tile
+        ).copy()
+
+
+class NextTilePrefetcher(object):
+    """
+    Read inputs of the next process tile while the current one is processed.
+
+    Inputs declared for the tile's zoom level are opened in a background
+    thread and their ``prefetch()`` method is called, which reads raster file
+    inputs into the input cache. Prefetching therefore only has an effect if
+    the input cache is enabled.
+
+    Parameters
+    ----------
+    process : ``Mapchete``
+    """
+
+    def __init__(self, process):
+        """Initialize."""
+        self.process = process
+        self._pool = ThreadPool(1)
+
+    def prefetch(self, tile, block=None):
+        """
+        Start reading inputs of tile in the background.
+
+        Parameters
+        ----------
+        tile : ``BufferedTile``
+            process tile
+        block : ``TileBlock`` or None
+            active block covering the tile
+        """
+        self._pool.apply_async(self._prefetch, (tile, block))
+
+    def close(self):
+        """Wait for running prefetches and stop background thread."""
+        self._pool.close()
+        self._pool.join()
+
+    def _prefetch(self, tile, block):
+        config = self.process.config
+        # tiles outside of baselevels are interpolated and read no inputs
+        if config.baselevels and tile.zoom not in config.baselevels["zooms"]:
+            return
+        with use_block(block):
+            for input_data in _input_objects(
+                config.params_at_zoom(tile.zoom)["input"]
+            ):
+                try:
+                    with input_data.open(tile) as input_tile:
+                        input_tile.prefetch()
+                except Exception as e:
+                    logger.debug(
+                        (tile.id, "prefetching input failed: %s" % e))
+
+
+def _input_objects(inputs):
+    for value in inputs.values():
+        if isinstance(value, dict):
+            for input_data in _input_objects(value):
+                yield input_data
+        elif value is not None:
+            yield value
+
+
+def current_block():
+    """Return active ``TileBlock`` of current thread or None."""
+    return getattr(_local, "block", None)
+
+
+@contextmanager
+def use_block(block):
+    """
+    Make an already active block available in another thread.
+
+    Parameters
+    ----------
+    block : ``TileBlock`` or None
+        output of ``current_block()`` in the thread owning the block
+    """
+    previous = getattr(_local, "block", None)
+    _local.block = block
+    try:
+        yield block
+    finally:
+        _local.block = previous
+
+
+def block_key(tile, block_size):
+    """
+    Return index of the block a process tile belongs to.
+
+    Parameters
+    ----------
+    tile : ``BufferedTile``
+    block_size : integer
+        number of tiles per block side
+
+    Returns
+    -------
+    key : tuple
+        zoom, block row, block column
+    """
+    return tile.zoom, tile.row // block_size, tile.col // block_size
@@ -0,0 +1,327 @@
+"""Registry of processed tiles which allows resuming batch runs."""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# registry file name within the output directory
+REGISTRY_FILE = ".mapchete_tiles.sqlite"
+
+# status of process tiles in journal
+JOURNAL_STATUSES = ("written", "empty", "failed")
+
+
+class TileRegistry(object):
+    """
+    Keep track of processed tiles.
+
+    Empty output is not written, so without a registry such tiles would be
+    processed again in every subsequent run in ``continue`` mode. Tiles are
+    stored per zoom level in a SQLite file next to the output, which is only
+    created once the first tile is registered.
+
+    Besides the empty output tiles, a journal holds the status of every
+    finished process tile ("written", "empty" or "failed"). Journal entries
+    are buffered and written at most every ``flush_interval`` seconds. Once a
+    zoom level is marked as complete, its journal holds all finished tiles
+    and restarted runs do not have to look at the output anymore.
+
+    Tile indexes are only valid for the tile pyramids they were registered
+    with. If a ``signature`` describing these is set, all tiles registered
+    with another or no signature are discarded once the file is opened.
+
+    Parameters
+    ----------
+    path : string
+        path to registry file
+    flush_interval : float
+        maximum seconds journal entries are kept in memory (default: 1)
+    signature : string
+        configuration the registered tiles belong to (default: None)
+
+    Attributes
+    ----------
+    path : string
+        path to registry file
+    signature : string
+        configuration the registered tiles belong to
+    """
+
+    def __init__(self, path, flush_interval=1., signature=None):
+        """Initialize."""
+        self.path = path
+        self.flush_interval = flush_interval
+        self.signature = signature
+        self._reset()
+
+    def __getstate__(self):
+        """Don't pickle database connection."""
+        return dict(
+            path=self.path, flush_interval=self.flush_interval,
+            signature=self.signature)
+
+    def __setstate__(self, state):
+        """Restore without database connection."""
+        self.__init__(
+            state["path"], state["flush_interval"], state.get("signature"))
+
+    def set_signature(self, signature):
+        """
+        Set configuration the registered tiles belong to.
+
+        Tiles registered with another configuration are discarded.
+
+        Parameters
+        ----------
+        signature : string
+            configuration the registered tiles belong to
+        """
+        self.close()
+        self.signature = signature
+        # check existing registry right away
+        self._query("SELECT 1 FROM meta", ())
+
+    def tiles(self, zoom):
+        """
+        Return all output tiles of a zoom level registered as empty.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        tiles : set
+            set of (row, col) tuples
+        """
+        return set(
+            self._query("SELECT row, col FROM tiles WHERE zoom=?", (zoom, )))
+
+    def is_complete(self, zoom):
+        """
+        Return whether journal holds all finished process tiles of a zoom.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        is complete : bool
+        """
+        return bool(self._query(
+            "SELECT 1 FROM meta WHERE key=?", (_complete_key(zoom), )))
+
+    def set_complete(self, zoom_levels):
+        """
+        Mark journal of zoom levels as holding all finished process tiles.
+
+        Parameters
+        ----------
+        zoom_levels : list
+            zoom levels
+        """
+        self.flush()
+        self._execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, '')",
+            [(_complete_key(zoom), ) for zoom in zoom_levels], create=True)
+
+    def discard(self, zoom):
+        """
+        Remove journal entries of a zoom level.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+        """
+        self.flush()
+        self._execute("DELETE FROM journal WHERE zoom=?", [(zoom, )])
+        self._execute(
+            "DELETE FROM meta WHERE key=?", [(_complete_key(zoom), )])
+
+    def add(self, tiles):
+        """
+        Register output tiles as empty.
+
+        Parameters
+        ----------
+        tiles : list
+            list of ``BufferedTile`` objects of output ``TilePyramid``
+        """
+        tile_ids = [tile.id for tile in tiles]
+        if tile_ids:
+            self._execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?)", tile_ids,
+                create=True)
+
+    def remove(self, tiles):
+        """
+        Remove output tiles from registry.
+
+        Parameters
+        ----------
+        tiles : list
+            list of ``BufferedTile`` objects of output ``TilePyramid``
+        """
+        tile_ids = [tile.id for tile in tiles]
+        if tile_ids:
+            self._execute(
+                "DELETE FROM tiles WHERE zoom=? AND row=? AND col=?", tile_ids)
+
+    def record(self, tile_ids, status):
+        """
+        Add process tiles with their status to the journal.
+
+        Parameters
+        ----------
+        tile_ids : list
+            process tile indexes (zoom, row, col)
+        status : string
+            one of ``JOURNAL_STATUSES``
+        """
+        if status not in JOURNAL_STATUSES:
+            raise ValueError(
+                "status must be one of %s: %s" % (JOURNAL_STATUSES, status))
+        self._check_pid()
+        self._pending.extend(
+            (zoom, row, col, status) for zoom, row, col in tile_ids)
+        if time.time() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write pending journal entries."""
+        self._check_pid()
+        pending, self._pending = self._pending, []
+        self._last_flush = time.time()
+        if pending:
+            self._execute(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?)", pending,
+                create=True)
+
+    def recorded(self, statuses=JOURNAL_STATUSES, zoom=None):
+        """
+        Return process tiles from journal.
+
+        Parameters
+        ----------
+        statuses : list
+            only return tiles with one of these statuses (default: all)
+        zoom : integer
+            only return tiles of this zoom level (default: all)
+
+        Returns
+        -------
+        tile indexes : set
+            set of (zoom, row, col) tuples
+        """
+        self.flush()
+        sql = "SELECT zoom, row, col FROM journal WHERE status IN (%s)" % (
+            ", ".join("?" for _ in statuses))
+        parameters = tuple(statuses)
+        if zoom is not None:
+            sql += " AND zoom=?"
+            parameters += (zoom, )
+        return set(self._query(sql, parameters))
+
+    def close(self):
+        """Write pending journal entries and close database connection."""
+        self.flush()
+        self._check_pid()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _reset(self):
+        # the connection belongs to the process which opened it
+        self._pid = os.getpid()
+        self._connection = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.time()
+
+    def _check_pid(self):
+        # a SQLite connection must not be used after fork(), so forked
+        # processes open their own and drop the inherited lock and entries
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connect(self, create=False):
+        # connect lazily and don't create the file unless tiles get registered
+        if self._connection is None:
+            if not create and not os.path.isfile(self.path):
+                return None
+            logger.debug("open tile registry %s", self.path)
+            if create and not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self._connection = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tiles ("
+                "zoom INTEGER, row INTEGER, col INTEGER, "
+                "PRIMARY KEY (zoom, row, col))")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "zoom INTEGER, row INTEGER, col INTEGER, status TEXT, "
+                "PRIMARY KEY (zoom, row, col))")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "key TEXT PRIMARY KEY, value TEXT)")
+            self._connection.commit()
+            if self.signature is not None:
+                self._check_signature()
+        return self._connection
+
+    def _check_signature(self):
+        if self._stored_signature() == self.signature:
+            return
+        connection = self._connection
+        # other processes may register tiles with this signature meanwhile,
+        # so check again while holding the write lock
+        connection.execute("BEGIN IMMEDIATE")
+        with connection:
+            if self._stored_signature() == self.signature:
+                return
+            logger.info(
+                "discard tiles registered with other configuration in %s",
+                self.path)
+            connection.execute("DELETE FROM tiles")
+            connection.execute("DELETE FROM journal")
+            connection.execute("DELETE FROM meta")
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('signature', ?)",
+                (self.signature, ))
+
+    def _stored_signature(self):
+        stored = self._connection.execute(
+            "SELECT value FROM meta WHERE key='signature'").fetchall()
+        return stored[0][0] if stored else None
+
+    def _query(self, sql, parameters):
+        self._check_pid()
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return []
+            return connection.execute(sql, parameters).fetchall()
+
+    def _execute(self, sql, parameters, create=False):
+        self._check_pid()
+        with self._lock:
+            connection = self._connect(create=create)
+            if connection is None:
+                return
+            with connection:
+                connection.executemany(sql, parameters)
+
+
+def _complete_key(zoom):
+    return "complete_%s" % zoom
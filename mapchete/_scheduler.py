@@ -0,0 +1,428 @@
+"""Dependency aware scheduling of process tiles for batch processing."""
+
+from collections import deque, OrderedDict
+from itertools import chain
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# available orders of process tiles within a zoom level
+TILE_ORDERS = ["rowcol", "zorder", "hilbert"]
+
+
+class TileScheduler(object):
+    """
+    Hand out process tiles as soon as all tiles they depend on are finished.
+
+    Without baselevels, process tiles do not depend on each other and are
+    streamed zoom level by zoom level from ``Mapchete.get_process_tiles()``.
+
+    With baselevels, tiles of zoom levels below the baselevels ("lower") are
+    interpolated from their children and tiles of zoom levels above the
+    baselevels ("higher") from their parent. Such a tile is only released
+    once all of its children respectively its parent are finished. Tiles which
+    are not part of the current run (e.g. because of zoom or bounds
+    delimiters) are not waited for. Tiles of a dependent zoom level are only
+    loaded once the first tile of the zoom level they depend on is handed
+    out, so at most two zoom levels are held in memory at a time.
+
+    Parameters
+    ----------
+    process : ``Mapchete``
+        process providing the process tiles
+    zoom_levels : list
+        zoom levels to be processed
+    tile_order : string
+        order of process tiles within a zoom level, one of ``TILE_ORDERS``
+        (default: "rowcol")
+    block_size : integer
+        if set, tiles without dependencies are handed out in square blocks of
+        up to block_size x block_size adjacent tiles; blocks follow
+        tile_order (default: None)
+
+    Attributes
+    ----------
+    num_waiting : integer
+        number of tiles still waiting for their dependencies
+    """
+
+    def __init__(
+        self, process, zoom_levels, tile_order="rowcol", block_size=None
+    ):
+        """Initialize."""
+        self.process = process
+        self.zoom_levels = list(zoom_levels)
+        self.tile_order = tile_order
+        self.block_size = block_size
+        self._blocks = None
+        self._ready = deque()
+        self._waiting = {}
+        self._lower, self._higher = set(), set()
+        # zoom levels depending on a zoom level and zoom levels handed out
+        self._dependents = {}
+        self._started = set()
+        if process.config.baselevels:
+            base_zooms = process.config.baselevels["zooms"]
+            self._lower = set(
+                z for z in self.zoom_levels if z < min(base_zooms))
+            self._higher = set(
+                z for z in self.zoom_levels if z > max(base_zooms))
+        if self._lower or self._higher:
+            streamed = []
+            for zoom in self.zoom_levels:
+                source = self._source(zoom)
+                if source in self.zoom_levels:
+                    self._dependents.setdefault(source, []).append(zoom)
+                else:
+                    streamed.append(zoom)
+            self._tiles = chain.from_iterable(
+                self._stream(zoom) for zoom in streamed)
+        elif block_size:
+            self._tiles = iter(())
+            self._blocks = chain.from_iterable(
+                block_tiles(
+                    process.get_process_tiles(zoom), block_size, tile_order)
+                for zoom in self.zoom_levels)
+        else:
+            self._tiles = chain.from_iterable(
+                process.get_process_tiles(zoom, order=tile_order)
+                for zoom in self.zoom_levels)
+
+    @property
+    def num_waiting(self):
+        """Return number of tiles waiting for their dependencies."""
+        return len(self._waiting)
+
+    def ready(self, max_tiles=1):
+        """
+        Return up to ``max_tiles`` process tiles which can be processed now.
+
+        If tiles are handed out in blocks, one whole block is returned
+        regardless of ``max_tiles``.
+
+        Parameters
+        ----------
+        max_tiles : integer
+            maximum number of tiles returned
+
+        Returns
+        -------
+        process tiles : list
+            list of ``BufferedTile`` objects, empty if no tile is ready
+        """
+        if self._blocks is not None:
+            return next(self._blocks, [])
+        tiles = []
+        while len(tiles) < max_tiles:
+            if self._ready:
+                tile = self._ready.popleft()
+            else:
+                try:
+                    tile = next(self._tiles)
+                except StopIteration:
+                    break
+            self._start(tile.zoom)
+            tiles.append(tile)
+        return tiles
+
+    def done(self, process_tile):
+        """
+        Mark process tile as finished and release tiles depending on it.
+
+        Parameters
+        ----------
+        process_tile : ``BufferedTile``
+            finished process tile
+        """
+        if not self._waiting:
+            return
+        zoom, row, col = process_tile.id
+        # lower tiles wait for all of their children
+        if zoom - 1 in self._lower:
+            self._release(process_tile.get_parent())
+        # higher tiles wait for their parent
+        if zoom + 1 in self._higher:
+            for child in process_tile.get_children():
+                self._release(child)
+
+    def _release(self, tile):
+        waiting = self._waiting.get(tile.id)
+        if waiting is None:
+            return
+        waiting[1] -= 1
+        if waiting[1] == 0:
+            logger.debug((tile.id, "dependencies finished"))
+            self._ready.append(self._waiting.pop(tile.id)[0])
+
+    def _source(self, zoom):
+        # zoom level the tiles of a zoom level are interpolated from
+        if zoom in self._lower:
+            return zoom + 1
+        elif zoom in self._higher:
+            return zoom - 1
+
+    def _stream(self, zoom):
+        for tile in self.process.get_process_tiles(
+            zoom, order=self.tile_order
+        ):
+            yield tile
+        # zoom levels without tiles still release their dependents
+        self._start(zoom)
+
+    def _start(self, zoom):
+        if zoom in self._started:
+            return
+        self._started.add(zoom)
+        for dependent in self._dependents.get(zoom, []):
+            self._load(dependent)
+
+    def _load(self, zoom):
+        # count dependencies of every tile of a dependent zoom level
+        source_tiles = self.process.get_process_tiles(self._source(zoom))
+        if zoom in self._lower:
+            # number of children per tile
+            source_ids = {}
+            for child in source_tiles:
+                parent_id = child.get_parent().id
+                source_ids[parent_id] = source_ids.get(parent_id, 0) + 1
+        else:
+            source_ids = set(tile.id for tile in source_tiles)
+        empty = True
+        for tile in self.process.get_process_tiles(
+            zoom, order=self.tile_order
+        ):
+            empty = False
+            if zoom in self._lower:
+                dependencies = source_ids.get(tile.id, 0)
+            else:
+                dependencies = int(tile.get_parent().id in source_ids)
+            if dependencies:
+                self._waiting[tile.id] = [tile, dependencies]
+            else:
+                self._ready.append(tile)
+        logger.debug("zoom %s: tiles loaded", zoom)
+        if empty:
+            self._start(zoom)
+
+
+class ChunkSizer(object):
+    """
+    Determine how many process tiles are handed to a worker at once.
+
+    With a fixed chunksize, every task gets ``max_chunksize`` tiles. In
+    adaptive mode, the chunksize starts at 1 and then follows the measured
+    per tile durations so each task runs about ``target_duration`` seconds:
+    cheap tiles get batched to save queue overhead, expensive tiles are
+    handed out one by one. Towards the end of a run, chunks shrink so the
+    remaining tiles are spread over all workers instead of leaving some
+    workers with a long queue while others idle.
+
+    Parameters
+    ----------
+    max_chunksize : integer
+        maximum number of tiles per task
+    adaptive : bool
+        adapt chunksize to measured tile durations (default: False)
+    workers : integer
+        number of workers (default: 1)
+    total : integer
+        expected number of tiles in the run, used to shrink chunks towards
+        the end (default: None)
+    target_duration : float
+        desired duration of one task in seconds (default: 0.5)
+
+    Attributes
+    ----------
+    tile_duration : float
+        moving average of seconds per tile or None if nothing was measured
+    """
+
+    def __init__(
+        self, max_chunksize, adaptive=False, workers=1, total=None,
+        target_duration=0.5
+    ):
+        """Initialize."""
+        self.max_chunksize = max(1, max_chunksize)
+        self.adaptive = adaptive
+        self.workers = workers
+        self.total = total
+        self.target_duration = target_duration
+        self.tile_duration = None
+        self._dispatched = 0
+
+    def size(self):
+        """
+        Return number of tiles for the next task.
+
+        Returns
+        -------
+        chunksize : integer
+        """
+        if not self.adaptive:
+            return self.max_chunksize
+        if self.tile_duration is None:
+            size = 1
+        elif self.tile_duration == 0:
+            size = self.max_chunksize
+        else:
+            size = int(self.target_duration / self.tile_duration)
+        if self.total is not None:
+            # leave enough tiles for every worker and one queued task each
+            remaining = self.total - self._dispatched
+            size = min(size, remaining // (self.workers * 2))
+        return min(max(size, 1), self.max_chunksize)
+
+    def dispatched(self, num_tiles):
+        """
+        Count tiles which were handed out or skipped.
+
+        Parameters
+        ----------
+        num_tiles : integer
+        """
+        self._dispatched += num_tiles
+
+    def finished(self, num_tiles, duration):
+        """
+        Update tile duration estimate with a finished task.
+
+        Parameters
+        ----------
+        num_tiles : integer
+            number of tiles in task
+        duration : float
+            task duration in seconds
+        """
+        if not num_tiles:
+            return
+        tile_duration = float(duration) / num_tiles
+        if self.tile_duration is None:
+            self.tile_duration = tile_duration
+        else:
+            self.tile_duration = 0.7 * self.tile_duration + 0.3 * tile_duration
+
+
+def sort_tiles(tiles, order="rowcol"):
+    """
+    Sort tiles of one zoom level along a space filling curve.
+
+    Consecutive tiles in Z-order or Hilbert order are spatial neighbours most
+    of the time, so a worker processing a chunk of them hits the same input
+    data blocks and features again. "rowcol" keeps the original row-major
+    order and does not materialize the tiles.
+
+    Parameters
+    ----------
+    tiles : iterable
+        ``BufferedTile`` objects of one zoom level
+    order : string
+        one of ``TILE_ORDERS`` (default: "rowcol")
+
+    Returns
+    -------
+    tiles : iterable
+        sorted ``BufferedTile`` objects
+    """
+    if order == "rowcol":
+        return tiles
+    return _curve_sorted(tiles, order, lambda t: (t.row, t.col))
+
+
+def block_tiles(tiles, block_size, order="rowcol"):
+    """
+    Group tiles of one zoom level into square blocks of adjacent tiles.
+
+    Parameters
+    ----------
+    tiles : iterable
+        ``BufferedTile`` objects of one zoom level
+    block_size : integer
+        maximum number of tiles per block side
+    order : string
+        order of blocks, one of ``TILE_ORDERS`` (default: "rowcol")
+
+    Returns
+    -------
+    blocks : list
+        lists of ``BufferedTile`` objects
+    """
+    blocks = OrderedDict()
+    for tile in tiles:
+        blocks.setdefault(
+            (tile.row // block_size, tile.col // block_size), []
+        ).append(tile)
+    return [
+        blocks[key]
+        for key in _curve_sorted(blocks.keys(), order, lambda key: key)
+    ]
+
+
+def _curve_sorted(items, order, row_col):
+    if order == "rowcol":
+        return sorted(items, key=row_col)
+    elif order == "zorder":
+        return sorted(items, key=lambda i: zorder_index(*row_col(i)))
+    elif order == "hilbert":
+        items = list(items)
+        if not items:
+            return items
+        size = 1
+        while size <= max(max(row_col(i)) for i in items):
+            size *= 2
+        return sorted(
+            items, key=lambda i: hilbert_index(*(row_col(i) + (size, ))))
+    else:
+        raise ValueError(
+            "tile order must be one of %s: %s" % (TILE_ORDERS, order))
+
+
+def zorder_index(row, col):
+    """
+    Return position of tile on Z-order (Morton) curve.
+
+    Parameters
+    ----------
+    row : integer
+    col : integer
+
+    Returns
+    -------
+    index : integer
+    """
+    index = 0
+    for bit in range(max(row.bit_length(), col.bit_length())):
+        index |= ((row >> bit) & 1) << (2 * bit + 1)
+        index |= ((col >> bit) & 1) << (2 * bit)
+    return index
+
+
+def hilbert_index(row, col, size):
+    """
+    Return position of tile on Hilbert curve.
+
+    Parameters
+    ----------
+    row : integer
+    col : integer
+    size : integer
+        side length of curve, a power of 2 larger than row and col
+
+    Returns
+    -------
+    index : integer
+    """
+    index = 0
+    step = size // 2
+    while step > 0:
+        rx = 1 if col & step else 0
+        ry = 1 if row & step else 0
+        index += step * step * ((3 * rx) ^ ry)
+        # rotate quadrant
+        if ry == 0:
+            if rx == 1:
+                col = size - 1 - col
+                row = size - 1 - row
+            col, row = row, col
+        step //= 2
+    return index
@@ -0,0 +1,415 @@
+"""Cache of process output kept in memory by memory mode and serve."""
+
+from cachetools import LRUCache
+from collections import namedtuple, OrderedDict
+import logging
+import numpy as np
+import numpy.ma as ma
+import os
+import shutil
+from six.moves import cPickle as pickle
+import sys
+import tempfile
+import threading
+
+from mapchete.io.raster import empty_array
+
+
+logger = logging.getLogger(__name__)
+
+# default memory budget of the process tile cache in megabytes
+TILE_CACHE_SIZE = 1024
+# default disk budget of the spill directory in megabytes
+TILE_SPILL_SIZE = 4096
+
+# stored instead of broadcast arrays which would be written at full size
+_Broadcast = namedtuple("_Broadcast", ("shape", "dtype", "value", "masked"))
+
+
+class TileCache(object):
+    """
+    Keep process output in memory up to a total number of bytes.
+
+    Raster output is sized by the bytes of its data and mask arrays, vector
+    output by an estimate of its features including geometry coordinates and
+    properties. Least recently used tiles are dropped once ``max_bytes`` is
+    exceeded; output larger than ``max_bytes`` is not cached in memory.
+
+    If ``spill_path`` is given, dropped tiles and tiles too large for memory
+    are written to a temporary directory within it instead, arrays as
+    uncompressed ``.npy`` files which are read back memory mapped, all other
+    output pickled. Tiles are then looked up in memory, then on disk. The
+    least recently used files are removed once ``spill_max_bytes`` is
+    exceeded and all files are removed by ``close()``. Files are written by a
+    background thread, so neither ``set()`` nor lookups wait for disk writes;
+    ``flush()`` waits until all dropped tiles are written.
+
+    Parameters
+    ----------
+    max_bytes : integer
+        memory budget in bytes
+    spill_path : string
+        directory for tiles dropped from memory (default: None, disabled)
+    spill_max_bytes : integer
+        disk budget in bytes for spilled tiles
+
+    Attributes
+    ----------
+    hits : integer
+        number of tiles served from memory or disk
+    disk_hits : integer
+        number of tiles served from disk
+    misses : integer
+        number of requested tiles which were not cached
+    evictions : integer
+        number of tiles dropped from memory to stay within ``max_bytes``
+    """
+
+    def __init__(self, max_bytes, spill_path=None, spill_max_bytes=0):
+        """Initialize."""
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._tiles = _EvictionCounter(self, max_bytes)
+        # tiles to be spilled, written by a writer thread which is notified
+        # and notifies about written tiles through _changed
+        self._pending = OrderedDict()
+        self._changed = threading.Condition(self._lock)
+        # (owner pid, thread) of the writer thread
+        self._writer = None
+        self._closed = False
+        self._spill = (
+            _SpillDirectory(spill_path, spill_max_bytes) if spill_path
+            else None
+        )
+
+    def get(self, key):
+        """
+        Return cached process output or None.
+
+        Parameters
+        ----------
+        key : tuple
+            process tile ID
+
+        Returns
+        -------
+        output : array, list, tuple or None
+        """
+        with self._lock:
+            output = self._tiles.get(key)
+            if output is None:
+                output = self._pending.pop(key, None)
+                if output is not None:
+                    self._cache(key, output)
+        if output is None and self._spill is not None:
+            output = self._spill.load(key)
+            if output is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._cache(key, output)
+        with self._lock:
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return output
+
+    def set(self, key, output):
+        """
+        Cache process output in memory or, if too large, on disk.
+
+        Parameters
+        ----------
+        key : tuple
+            process tile ID
+        output : array, list or tuple
+            process output
+        """
+        with self._lock:
+            self._cache(key, output)
+
+    def flush(self):
+        """Wait until all tiles dropped from memory are written to disk."""
+        with self._changed:
+            while self._pending and self._writer_alive():
+                self._changed.wait(1)
+
+    def close(self):
+        """Stop writing tiles to disk and remove spilled tiles."""
+        with self._changed:
+            self._closed = True
+            self._pending = OrderedDict()
+            self._changed.notify_all()
+        if self._writer_alive():
+            self._writer[1].join()
+        if self._spill is not None:
+            self._spill.close()
+
+    @property
+    def nbytes(self):
+        """Return estimated bytes of all tiles cached in memory."""
+        return self._tiles.currsize
+
+    @property
+    def spilled_nbytes(self):
+        """Return bytes of all tiles spilled to disk."""
+        return self._spill.nbytes if self._spill is not None else 0
+
+    def _cache(self, key, output):
+        size = output_nbytes(output)
+        if size <= self.max_bytes:
+            self._tiles[key] = output
+        elif self._spill is not None:
+            self._spill_later(key, output)
+        else:
+            logger.debug(
+                "output of %s too large to be cached: %s bytes", key, size)
+
+    def _evicted(self, key, output):
+        self.evictions += 1
+        if self._spill is not None:
+            self._spill_later(key, output)
+
+    def _spill_later(self, key, output):
+        # called with _lock held
+        if self._closed:
+            return
+        self._pending[key] = output
+        if not self._writer_alive():
+            thread = threading.Thread(target=self._write_pending)
+            thread.daemon = True
+            self._writer = (os.getpid(), thread)
+            thread.start()
+        self._changed.notify_all()
+
+    def _writer_alive(self):
+        # threads are not inherited by forked processes
+        return (
+            self._writer is not None and self._writer[0] == os.getpid() and
+            self._writer[1].is_alive()
+        )
+
+    def _write_pending(self):
+        while True:
+            with self._changed:
+                while not self._pending and not self._closed:
+                    self._changed.wait()
+                if self._closed:
+                    return
+                # pending tiles stay available to get() until written
+                key, output = next(iter(self._pending.items()))
+            try:
+                self._spill.store(key, output)
+            except Exception as e:
+                logger.debug("cannot spill output of %s: %s", key, e)
+            with self._changed:
+                # keep tiles evicted again in the meantime
+                if self._pending.get(key) is output:
+                    del self._pending[key]
+                self._changed.notify_all()
+
+    def __contains__(self, key):
+        """Return whether output of a tile is cached in memory or on disk."""
+        return key in self._tiles or key in self._pending or (
+            self._spill is not None and key in self._spill)
+
+    def __len__(self):
+        """Return number of cached tiles."""
+        return len(self._tiles)
+
+
+class _EvictionCounter(LRUCache):
+    """LRUCache counting dropped items in its TileCache."""
+
+    def __init__(self, tile_cache, maxsize):
+        super(_EvictionCounter, self).__init__(
+            maxsize=maxsize, getsizeof=output_nbytes)
+        self._tile_cache = tile_cache
+
+    def popitem(self):
+        key, output = super(_EvictionCounter, self).popitem()
+        self._tile_cache._evicted(key, output)
+        return key, output
+
+
+class _SpillDirectory(object):
+    """Files of process output dropped from memory with LRU removal."""
+
+    def __init__(self, path, max_bytes):
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+        # separate directory per cache as output is only valid for one run
+        self.path = tempfile.mkdtemp(prefix="tile_cache_", dir=path)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # tile ID: (file paths, bytes) ordered from least recently used
+        self._files = OrderedDict()
+        # only guards _files, files are written and read without it
+        self._lock = threading.Lock()
+
+    def store(self, key, output):
+        with self._lock:
+            if key in self._files:
+                # output of a tile does not change, mark as recently used
+                self._files[key] = self._files.pop(key)
+                return
+        base = os.path.join(self.path, "_".join(map(str, key)))
+        try:
+            paths = _dump(output, base)
+        except Exception as e:
+            logger.debug("cannot spill output of %s: %s", key, e)
+            return
+        size = sum(os.path.getsize(path) for path in paths)
+        with self._lock:
+            self._files[key] = (paths, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self._files:
+                _, (paths, size) = self._files.popitem(last=False)
+                self._remove(paths, size)
+
+    def load(self, key):
+        with self._lock:
+            if key not in self._files:
+                return None
+            self._files[key] = self._files.pop(key)
+            paths = self._files[key][0]
+        try:
+            return _load(paths)
+        except (IOError, OSError):
+            # removed to stay within max_bytes in the meantime
+            return None
+
+    def close(self):
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._files = OrderedDict()
+            self.nbytes = 0
+
+    def _remove(self, paths, size):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.nbytes -= size
+
+    def __contains__(self, key):
+        return key in self._files
+
+
+def _dump(output, base):
+    if (
+        isinstance(output, np.ndarray) and
+        output.size and
+        any(output.strides)
+    ):
+        paths = [base + ".npy"]
+        np.save(paths[0], ma.getdata(output))
+        if ma.getmask(output) is not ma.nomask:
+            paths.append(base + ".mask.npy")
+            np.save(paths[1], ma.getmaskarray(output))
+        return paths
+    paths = [base + ".pickle"]
+    with open(paths[0], "wb") as dst:
+        pickle.dump(_compact(output), dst, pickle.HIGHEST_PROTOCOL)
+    return paths
+
+
+def _load(paths):
+    if paths[0].endswith(".pickle"):
+        with open(paths[0], "rb") as src:
+            return _expand(pickle.load(src))
+    data = np.load(paths[0], mmap_mode="r")
+    if len(paths) == 1:
+        return data
+    return ma.MaskedArray(data, mask=np.load(paths[1], mmap_mode="r"))
+
+
+def _compact(output):
+    if isinstance(output, tuple):
+        return tuple(_compact(item) for item in output)
+    elif (
+        isinstance(output, np.ndarray) and
+        output.size and
+        not any(output.strides)
+    ):
+        return _Broadcast(
+            output.shape, output.dtype.str, ma.getdata(output).flat[0],
+            bool(ma.getmaskarray(output).flat[0]))
+    return output
+
+
+def _expand(output):
+    if isinstance(output, _Broadcast):
+        return empty_array(
+            output.shape, output.dtype, output.value, masked=output.masked)
+    elif isinstance(output, tuple):
+        return tuple(_expand(item) for item in output)
+    return output
+
+
+def output_nbytes(output):
+    """
+    Return estimated memory of process output in bytes.
+
+    Parameters
+    ----------
+    output : array, list or tuple
+        raster array, list of features or tuple of data and tags
+
+    Returns
+    -------
+    nbytes : integer
+    """
+    # output with tags
+    if isinstance(output, tuple):
+        return sum(output_nbytes(item) for item in output)
+    elif isinstance(output, np.ndarray):
+        return _array_nbytes(output) + _array_nbytes(
+            getattr(output, "mask", None))
+    elif isinstance(output, list):
+        return sys.getsizeof(output) + sum(
+            _feature_nbytes(feature) for feature in output)
+    elif isinstance(output, dict):
+        return sys.getsizeof(output) + sum(
+            sys.getsizeof(value) for value in output.values())
+    return sys.getsizeof(output)
+
+
+def _array_nbytes(array):
+    if not isinstance(array, np.ndarray):
+        return 0
+    # broadcast arrays like from empty_array() only hold one value
+    if array.size and not any(array.strides):
+        return array.itemsize
+    return array.nbytes
+
+
+def _feature_nbytes(feature):
+    if not isinstance(feature, dict):
+        return sys.getsizeof(feature)
+    size = sys.getsizeof(feature)
+    properties = feature.get("properties") or {}
+    size += sys.getsizeof(properties) + sum(
+        sys.getsizeof(key) + sys.getsizeof(value)
+        for key, value in properties.items())
+    geometry = feature.get("geometry")
+    if hasattr(geometry, "wkb"):
+        # shapely geometries store about as many bytes as their WKB
+        size += len(geometry.wkb)
+    elif isinstance(geometry, dict):
+        size += _coordinates_nbytes(geometry.get("coordinates", ()))
+    return size
+
+
+def _coordinates_nbytes(coordinates):
+    if not isinstance(coordinates, (list, tuple)):
+        return sys.getsizeof(coordinates)
+    return sys.getsizeof(coordinates) + sum(
+        _coordinates_nbytes(item) for item in coordinates)
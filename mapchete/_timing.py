@@ -0,0 +1,192 @@
+"""Per tile timings and byte counts of the processing stages."""
+
+from contextlib import contextmanager
+import threading
+import time
+
+
+# processing stages; time spent in nested stages is not counted twice, e.g.
+# reading input within the user process only counts as "read"
+STAGES = ("read", "process", "prepare", "write")
+
+_local = threading.local()
+
+
+class TileTimer(object):
+    """
+    Accumulate durations, byte counts and input cache hits of one process tile.
+
+    A timer has to be activated in the thread doing the work. Functions
+    wrapped in ``timed()`` then add their durations to the active timer.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self.durations = dict((stage, 0.) for stage in STAGES)
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._stack = []
+
+    @contextmanager
+    def active(self):
+        """Make this the active timer of the current thread."""
+        previous = getattr(_local, "timer", None)
+        _local.timer = self
+        try:
+            yield self
+        finally:
+            _local.timer = previous
+
+    def as_dict(self):
+        """
+        Return numeric timing fields.
+
+        Returns
+        -------
+        timings : dictionary
+            seconds spent per stage ("read_time", "process_time",
+            "prepare_time", "write_time"), "read_bytes", "written_bytes" and
+            input cache "cache_hits", "cache_misses"
+        """
+        timings = dict(
+            (stage + "_time", round(duration, 6))
+            for stage, duration in self.durations.items()
+        )
+        timings.update(
+            read_bytes=self.read_bytes, written_bytes=self.written_bytes,
+            cache_hits=self.cache_hits, cache_misses=self.cache_misses)
+        return timings
+
+
+def current_timer():
+    """Return active ``TileTimer`` of current thread or None."""
+    return getattr(_local, "timer", None)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Add duration of the wrapped block to a stage of the active timer.
+
+    Parameters
+    ----------
+    stage : string
+        one of ``STAGES``
+    """
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    # frame: [start time, time spent in nested stages]
+    frame = [time.time(), 0.]
+    timer._stack.append(frame)
+    try:
+        yield
+    finally:
+        timer._stack.pop()
+        elapsed = time.time() - frame[0]
+        timer.durations[stage] += elapsed - frame[1]
+        if timer._stack:
+            timer._stack[-1][1] += elapsed
+
+
+def add_bytes(read=0, written=0):
+    """Add byte counts to the active timer."""
+    timer = current_timer()
+    if timer is not None:
+        timer.read_bytes += read
+        timer.written_bytes += written
+
+
+def count_cache(hit):
+    """Count input cache hit or miss in the active timer."""
+    timer = current_timer()
+    if timer is not None:
+        if hit:
+            timer.cache_hits += 1
+        else:
+            timer.cache_misses += 1
+
+
+class TimingSummary(object):
+    """
+    Aggregate per tile timings of a batch run.
+
+    Attributes
+    ----------
+    tiles : integer
+        number of tiles with timings
+    totals : dictionary
+        sums of all timing fields
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self.tiles = 0
+        self.totals = TileTimer().as_dict()
+
+    def update(self, timings):
+        """
+        Add timings of one tile.
+
+        Parameters
+        ----------
+        timings : dictionary
+            output of ``TileTimer.as_dict()``
+        """
+        self.tiles += 1
+        for k, v in timings.items():
+            self.totals[k] += v
+
+    def as_dict(self):
+        """
+        Return totals and per tile means.
+
+        Returns
+        -------
+        summary : dictionary
+            "tiles", "total" and "mean" timing fields
+        """
+        return dict(
+            tiles=self.tiles,
+            total=dict(self.totals),
+            mean=dict(
+                (k, float(v) / self.tiles if self.tiles else 0.)
+                for k, v in self.totals.items()
+            )
+        )
+
+
+class TimedInputTile(object):
+    """
+    Wrap an ``InputTile`` and count time and bytes spent in ``read()``.
+
+    All other attributes are passed on to the wrapped input tile. Bytes are
+    counted from the returned NumPy arrays, i.e. decoded bytes.
+    """
+
+    def __init__(self, input_tile):
+        """Initialize."""
+        self._input_tile = input_tile
+
+    def read(self, *args, **kwargs):
+        """Read from wrapped input tile."""
+        with timed("read"):
+            data = self._input_tile.read(*args, **kwargs)
+        add_bytes(read=getattr(data, "nbytes", 0))
+        return data
+
+    def __getattr__(self, name):
+        """Pass on everything else to wrapped input tile."""
+        return getattr(self._input_tile, name)
+
+    def __enter__(self):
+        """Required for 'with' statement."""
+        self._input_tile.__enter__()
+        return self
+
+    def __exit__(self, t, v, tb):
+        """Clean up wrapped input tile."""
+        return self._input_tile.__exit__(t, v, tb)
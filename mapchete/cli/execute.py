@@ -96,12 +96,18 @@ def main(args=None):
             for result in tqdm.tqdm(
                 mp.batch_processor(
                     multi=multi, zoom=parsed.zoom,
-                    max_chunksize=parsed.max_chunksize),
+                    max_chunksize=parsed.max_chunksize,
+                    write_threads=parsed.write_threads,
+                    tile_order=parsed.tile_order,
+                    adaptive_chunksize=parsed.adaptive_chunksize,
+                    prefetch_block=parsed.prefetch_block,
+                    prefetch_next=parsed.prefetch_next),
                 total=tiles_count,
                 unit="tile",
                 disable=parsed.debug or parsed.no_pbar
             ):
                 _write_verbose_msg(result, dst=verbose_dst)
+            _write_timing_summary(mp.timing_summary, dst=verbose_dst)
 
     tqdm.tqdm.write("process finished", file=verbose_dst)
 
@@ -111,3 +117,18 @@ def _write_verbose_msg(result, dst):
         tuple(result["process_tile"].id), result["process"],
         result["write"])
     tqdm.tqdm.write(msg, file=dst)
+
+
+def _write_timing_summary(timing_summary, dst):
+    total = timing_summary.as_dict()["total"]
+    msg = (
+        "%s tile(s): read %ss (%s bytes), process %ss, prepare %ss, "
+        "write %ss (%s bytes), input cache %s hit(s) %s miss(es)" % (
+            timing_summary.tiles, round(total["read_time"], 3),
+            total["read_bytes"], round(total["process_time"], 3),
+            round(total["prepare_time"], 3), round(total["write_time"], 3),
+            total["written_bytes"], total["cache_hits"],
+            total["cache_misses"]
+        )
+    )
+    tqdm.tqdm.write(msg, file=dst)
@@ -10,6 +10,8 @@ import sys
 import tilematrix
 
 import mapchete
+from mapchete._scheduler import TILE_ORDERS
+from mapchete._tile_cache import TILE_CACHE_SIZE, TILE_SPILL_SIZE
 from mapchete.cli.create import create_empty_process
 from mapchete.cli.execute import main as execute
 from mapchete.cli.formats import list_formats
@@ -111,9 +113,17 @@ class MapcheteCLI(object):
             "--port", "-p", type=int, help="port process is hosted on",
             metavar="<int>", default=5000)
         parser.add_argument(
-            "--internal_cache", "-c", type=int,
-            help="number of web tiles to be cached in RAM",
-            metavar="<int>", default=1024)
+            "--internal_cache", "-c", type=float,
+            help="megabytes of process output to be cached in RAM",
+            metavar="<float>", default=TILE_CACHE_SIZE)
+        parser.add_argument(
+            "--spill_dir", "-sd", type=str,
+            help="directory for process output dropped from RAM cache",
+            metavar="<path>")
+        parser.add_argument(
+            "--spill_size", "-ss", type=float,
+            help="megabytes of process output to be kept in spill_dir",
+            metavar="<float>", default=TILE_SPILL_SIZE)
         parser.add_argument(
             "--zoom", "-z", type=int, nargs='*',
             help="either minimum and maximum zoom level or just one zoom level",
@@ -191,6 +201,28 @@ class MapcheteCLI(object):
             "--max_chunksize", "-c", type=int, metavar="<int>", default=1,
             help="maximum number of process tiles to be queued for each \
                 worker; (default: 1)")
+        parser.add_argument(
+            "--write_threads", "-wt", type=int, metavar="<int>", default=0,
+            help="number of threads per worker writing output while the next \
+                tiles are processed; (default: 0)")
+        parser.add_argument(
+            "--tile_order", type=str, choices=TILE_ORDERS, default="rowcol",
+            help="order of process tiles within a zoom level; space filling \
+                curves (zorder, hilbert) keep neighbouring tiles together")
+        parser.add_argument(
+            "--adaptive_chunksize", "-ac", action="store_true",
+            help="adapt number of process tiles per worker task between 1 and \
+                max_chunksize to the measured tile durations")
+        parser.add_argument(
+            "--prefetch_block", "-pb", type=int, metavar="<int>", default=0,
+            help="hand out blocks of up to n x n adjacent process tiles and \
+                read raster inputs once per block; (default: 0)")
+        parser.add_argument(
+            "--prefetch_next", "-pn", action="store_true",
+            help="read inputs of the next process tile into the input cache \
+                while the current tile is processed; with multiprocessing \
+                only within worker tasks, i.e. requires --max_chunksize or \
+                --prefetch_block > 1")
         execute(parser.parse_args(self.args[2:]))
 
     def pyramid(self):
@@ -12,6 +12,7 @@ from flask import (
 
 import mapchete
 from mapchete.tile import BufferedTilePyramid
+from mapchete._tile_cache import TILE_CACHE_SIZE, TILE_SPILL_SIZE
 
 formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
 stream_handler = logging.StreamHandler()
@@ -32,7 +33,9 @@ def main(args=None, _test=False):
     app = create_app(
         mapchete_files=[args.mapchete_file], zoom=args.zoom,
         bounds=args.bounds, single_input_file=args.input_file,
-        mode=_get_mode(args), debug=args.debug)
+        mode=_get_mode(args), debug=args.debug,
+        cache_size=args.internal_cache, spill_dir=args.spill_dir,
+        spill_size=args.spill_size)
     if not _test:
         app.run(
             threaded=True, debug=True, port=args.port, host='0.0.0.0',
@@ -41,7 +44,8 @@ def main(args=None, _test=False):
 
 def create_app(
     mapchete_files=None, zoom=None, bounds=None, single_input_file=None,
-    mode="continue", debug=None
+    mode="continue", debug=None, cache_size=TILE_CACHE_SIZE, spill_dir=None,
+    spill_size=TILE_SPILL_SIZE
 ):
     """Configure and create Flask app."""
     if debug:
@@ -53,7 +57,8 @@ def create_app(
         os.path.splitext(os.path.basename(mapchete_file))[0]: mapchete.open(
             mapchete_file, zoom=zoom, bounds=bounds,
             single_input_file=single_input_file, mode=mode, with_cache=True,
-            debug=debug)
+            debug=debug, cache_size=cache_size, spill_dir=spill_dir,
+            spill_size=spill_size)
         for mapchete_file in mapchete_files
     }
 
@@ -58,6 +58,14 @@ _RESERVED_PARAMETERS = [
     "process_bounds",   # process boundaries (deprecated)
     "metatiling",       # process metatile size (deprecated)
     "pixelbuffer",      # buffer around each tile in pixels (deprecated)
+    "input_cache",      # memory budget for decoded input data in MB
+    "http_cache",       # disk cache directory and size for remote inputs
+]
+
+# configuration snapshot entries not passed on to the process function
+_NON_USER_PARAMS = [
+    "input", "output", "pyramid", "zoom_levels", "mapchete_file",
+    "init_bounds", "init_zoom_levels"
 ]
 
 
@@ -114,6 +122,10 @@ class MapcheteConfig(object):
     baselevels : dictionary
         base zoomlevels, where data is processed; zoom levels not included are
         generated from baselevels
+    input_cache_size : integer
+        memory budget in bytes for decoded input data per process
+    http_cache : dictionary
+        directory and size in bytes of the disk cache for remote inputs
 
     Deprecated Attributes:
     ----------------------
@@ -203,6 +215,13 @@ class MapcheteConfig(object):
         logger.debug("initializing input")
         self.input
 
+        # (8) resolve inputs and process function arguments per zoom level
+        # once instead of for every process tile
+        logger.debug("preparing parameter snapshots")
+        self._snapshots = {
+            zoom: self._params_snapshot(zoom) for zoom in self.init_zoom_levels
+        }
+
     @cached_property
     def zoom_levels(self):
         """Process zoom levels as defined in the configuration."""
@@ -250,6 +269,10 @@ class MapcheteConfig(object):
             output_params.update(
                 path=os.path.normpath(
                     os.path.join(self.config_dir, output_params["path"])))
+        if "registry" in output_params:
+            output_params.update(
+                registry=os.path.normpath(
+                    os.path.join(self.config_dir, output_params["registry"])))
         output_params.update(
             type=self.output_pyramid.grid,
             pixelbuffer=self.output_pyramid.pixelbuffer,
@@ -372,6 +395,48 @@ class MapcheteConfig(object):
                 pixelbuffer=self.output_pyramid.pixelbuffer,
                 metatiling=self.process_pyramid.metatiling))
 
+    @cached_property
+    def input_cache_size(self):
+        """
+        Optional memory budget for decoded input data in bytes.
+
+        input_cache: <megabytes>
+        """
+        size = self._raw.get("input_cache", 0)
+        if (
+            isinstance(size, bool) or
+            not isinstance(size, (int, float)) or
+            size < 0
+        ):
+            raise MapcheteConfigError("invalid input_cache size: %s" % size)
+        return int(size * 1024 * 1024)
+
+    @cached_property
+    def http_cache(self):
+        """
+        Optional disk cache for byte ranges of remote (HTTP) raster inputs.
+
+        http_cache:
+            path: <directory>
+            size: <megabytes>  # optional, default: 1024
+        """
+        cache = self._raw.get("http_cache")
+        if cache is None:
+            return dict(path=None, max_bytes=0)
+        if not isinstance(cache, dict) or not cache.get("path"):
+            raise MapcheteConfigError("http_cache requires a path")
+        size = cache.get("size", 1024)
+        if (
+            isinstance(size, bool) or
+            not isinstance(size, (int, float)) or
+            size <= 0
+        ):
+            raise MapcheteConfigError("invalid http_cache size: %s" % size)
+        return dict(
+            path=os.path.join(self.config_dir, cache["path"]),
+            max_bytes=int(size * 1024 * 1024)
+        )
+
     @cached_property
     def process_func(self):
         try:
@@ -385,7 +450,7 @@ class MapcheteConfig(object):
                     """provide execute() function instead""")
             if hasattr(user_process_py, "execute"):
                 user_execute = user_process_py.execute
-                if len(inspect.getargspec(user_execute).args) == 0:
+                if not _func_args(user_execute):
                     raise ImportError(
                         "execute() function has to accept at least one argument"
                     )
@@ -414,6 +479,40 @@ class MapcheteConfig(object):
         if zoom not in self.init_zoom_levels:
             raise ValueError(
                 "zoom level not available with current configuration")
+        # the input tree is copied as processes may alter it, the input
+        # objects are shared
+        params = dict(self._snapshots[zoom][0])
+        params.update(input=_copy_tree(params["input"]))
+        return params
+
+    def process_kwargs_at_zoom(self, zoom):
+        """
+        Return keyword arguments for the process function at zoom.
+
+        These are the user defined parameters of the configuration snapshot
+        if the process function accepts more than one argument.
+
+        Parameters
+        ----------
+        zoom : int
+            zoom level
+
+        Returns
+        -------
+        keyword arguments : dictionary
+        """
+        if zoom not in self.init_zoom_levels:
+            raise ValueError(
+                "zoom level not available with current configuration")
+        if len(self._process_func_args) == 1:
+            return {}
+        return _copy_tree(self._snapshots[zoom][1])
+
+    @cached_property
+    def _process_func_args(self):
+        return _func_args(self.process_func)
+
+    def _params_snapshot(self, zoom):
         out = dict(**self._params_at_zoom[zoom])
         out.update(input={}, output=self.output)
         if "input" in self._params_at_zoom[zoom]:
@@ -426,7 +525,11 @@ class MapcheteConfig(object):
             out["input"] = _unflatten_tree(flat_inputs)
         else:
             out["input"] = {}
-        return out
+        kwargs = {
+            k: v for k, v in six.iteritems(out)
+            if k not in _NON_USER_PARAMS
+        }
+        return out, kwargs
 
     def area_at_zoom(self, zoom=None):
         """
@@ -757,6 +860,11 @@ def _strip_zoom(input_string, strip_string):
         raise MapcheteConfigError("zoom level could not be determined: %s" % e)
 
 
+def _func_args(func):
+    """Return argument names of function."""
+    return inspect.getargspec(func).args
+
+
 def _flatten_tree(tree, old_path=None):
     """Flatten dict tree into dictionary where keys are paths of old dict."""
     flat_tree = []
@@ -769,6 +877,15 @@ def _flatten_tree(tree, old_path=None):
     return flat_tree
 
 
+def _copy_tree(tree):
+    """Copy nested dictionaries and lists but not the values they contain."""
+    if isinstance(tree, dict):
+        return {k: _copy_tree(v) for k, v in six.iteritems(tree)}
+    elif isinstance(tree, list):
+        return [_copy_tree(v) for v in tree]
+    return tree
+
+
 def _unflatten_tree(flat):
     """Reverse tree flattening."""
     tree = {}
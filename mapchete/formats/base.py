@@ -5,9 +5,13 @@ When writing a new driver, please inherit from these classes and implement the
 respective interfaces.
 """
 
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
 from tilematrix import TilePyramid
 
+from mapchete._registry import TileRegistry, REGISTRY_FILE
+
 
 class InputData(object):
     """
@@ -124,6 +128,15 @@ class InputTile(object):
         """
         raise NotImplementedError
 
+    def prefetch(self):
+        """
+        Read data in advance into the input cache.
+
+        Called from a background thread before the process reads this tile.
+        Drivers not using the input cache do nothing.
+        """
+        pass
+
     def __enter__(self):
         """Required for 'with' statement."""
         return self
@@ -191,9 +204,38 @@ class OutputData(object):
         ----------
         process_tile : ``BufferedTile``
             must be member of process ``TilePyramid``
+
+        Returns
+        -------
+        written : list or None
+            output tiles written; output tiles without data are not written;
+            None if not reported by output format
         """
         raise NotImplementedError
 
+    @property
+    def registry(self):
+        """
+        Return registry of processed but empty output tiles.
+
+        The registry file is stored in the output directory or, e.g. for
+        remote outputs, at the path given by the ``registry`` output parameter.
+
+        Returns
+        -------
+        registry : ``TileRegistry`` or None
+            None if output is not stored in a local directory and no registry
+            path is configured
+        """
+        if "_registry" not in self.__dict__:
+            path = getattr(self, "path", None)
+            registry_path = getattr(self, "output_params", {}).get("registry")
+            if registry_path is None and path and "://" not in path:
+                registry_path = os.path.join(path, REGISTRY_FILE)
+            self._registry = TileRegistry(
+                registry_path) if registry_path else None
+        return self._registry
+
     def tiles_exist(self, process_tile=None, output_tile=None):
         """
         Check whether output tiles of a tile (either process or output) exists.
@@ -219,6 +261,68 @@ class OutputData(object):
         if output_tile:
             return os.path.exists(self.get_path(output_tile))
 
+    def existing_tiles(self, zoom, threads=None):
+        """
+        List all existing output tiles of a zoom level at once.
+
+        The zoom level directory is listed and its row directories are then
+        listed in parallel threads. This replaces one ``tiles_exist()`` call
+        per tile, which is expensive on network file systems.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+        threads : integer
+            number of threads listing row directories (default: number of
+            CPUs)
+
+        Returns
+        -------
+        existing tiles : set or None
+            set of (row, col) tuples of existing output tiles or None if the
+            output cannot be listed
+        """
+        file_extension = getattr(self, "file_extension", None)
+        path = getattr(self, "path", None)
+        if not file_extension or not path or not os.path.isdir(path):
+            return None
+        zoomdir = os.path.join(path, str(zoom))
+        try:
+            rows = [
+                int(row) for row in os.listdir(zoomdir)
+                if row.isdigit() and int(row) < self.pyramid.matrix_height(zoom)
+            ]
+        except OSError:
+            return set()
+        width = self.pyramid.matrix_width(zoom)
+
+        def _list_row(row):
+            try:
+                filenames = os.listdir(os.path.join(zoomdir, str(row)))
+            except OSError:
+                return []
+            cols = (
+                filename[:-len(file_extension)] for filename in filenames
+                if filename.endswith(file_extension)
+            )
+            return [
+                (row, int(col)) for col in cols
+                if col.isdigit() and int(col) < width
+            ]
+
+        if not rows:
+            return set()
+        pool = ThreadPool(min(threads or cpu_count(), len(rows)))
+        try:
+            return set(
+                tile for row_tiles in pool.map(_list_row, rows)
+                for tile in row_tiles
+            )
+        finally:
+            pool.close()
+            pool.join()
+
     def is_valid_with_config(self, config):
         """
         Check if output format is valid with other process parameters.
@@ -265,6 +369,11 @@ class OutputData(object):
         """
         raise NotImplementedError
 
+    def _empty(self, process_tile):
+        # empty data of skipped or missing tiles which is not modified, so
+        # drivers can return shared read-only arrays
+        return self.empty(process_tile)
+
     def open(self, tile, process):
         """
         Open process output as input for other process.
@@ -109,23 +109,31 @@ class OutputData(base.OutputData):
         ----------
         process_tile : ``BufferedTile``
             must be member of process ``TilePyramid``
+
+        Returns
+        -------
+        written : list
+            output tiles written
         """
         if data is None or len(data) == 0:
-            return
+            return []
         if not os.path.exists(self.path):
             os.makedirs(self.path)
         assert isinstance(data, (list, types.GeneratorType))
         data = list(data)
+        written = []
         # Convert from process_tile to output_tiles
         for tile in self.pyramid.intersecting(process_tile):
             # skip if file exists and overwrite is not set
             out_path = self.get_path(tile)
             self.prepare_path(tile)
             out_tile = BufferedTile(tile, self.pixelbuffer)
-            write_vector_window(
+            if write_vector_window(
                 in_data=data, out_schema=self.output_params["schema"],
                 out_tile=out_tile, out_path=out_path
-            )
+            ):
+                written.append(tile)
+        return written
 
     def is_valid_with_config(self, config):
         """
@@ -32,14 +32,14 @@ compress: string
 
 import os
 import six
-import numpy as np
 import numpy.ma as ma
 import rasterio
 import warnings
 
 from mapchete.formats import base
 from mapchete.tile import BufferedTile
-from mapchete.io.raster import write_raster_window, prepare_array, memory_file
+from mapchete.io.raster import (
+    write_raster_window, prepare_array, memory_file, empty_array)
 from mapchete.config import validate_values
 
 
@@ -111,7 +111,7 @@ class OutputData(base.OutputData):
             with rasterio.open(path, "r") as src:
                 return src.read(masked=True)
         else:
-            return self.empty(output_tile)
+            return self._empty(output_tile)
 
     def write(self, process_tile, data):
         """
@@ -121,6 +121,11 @@ class OutputData(base.OutputData):
         ----------
         process_tile : ``BufferedTile``
             must be member of process ``TilePyramid``
+
+        Returns
+        -------
+        written : list
+            output tiles written
         """
         if (
             isinstance(data, tuple) and
@@ -134,16 +139,20 @@ class OutputData(base.OutputData):
             data, masked=True, nodata=self.nodata,
             dtype=self.profile(process_tile)["dtype"])
         if data.mask.all():
-            return
+            return []
+        written = []
         # Convert from process_tile to output_tiles
         for tile in self.pyramid.intersecting(process_tile):
             out_path = self.get_path(tile)
             self.prepare_path(tile)
             out_tile = BufferedTile(tile, self.pixelbuffer)
-            write_raster_window(
+            if write_raster_window(
                 in_tile=process_tile, in_data=data,
                 out_profile=self.profile(out_tile), out_tile=out_tile,
-                out_path=out_path, tags=tags)
+                out_path=out_path, tags=tags
+            ):
+                written.append(tile)
+        return written
 
     def is_valid_with_config(self, config):
         """
@@ -209,7 +218,7 @@ class OutputData(base.OutputData):
         metadata : dictionary
             output profile dictionary used for rasterio.
         """
-        dst_metadata = GTIFF_PROFILE
+        dst_metadata = dict(GTIFF_PROFILE)
         dst_metadata.pop("transform", None)
         dst_metadata.update(
             count=self.output_params["bands"],
@@ -252,13 +261,13 @@ class OutputData(base.OutputData):
         empty data : array
             empty array with data type provided in output profile
         """
+        return self._empty(process_tile).copy()
+
+    def _empty(self, process_tile):
         profile = self.profile(process_tile)
-        return ma.masked_array(
-            data=np.full(
-                (profile["count"], ) + process_tile.shape, profile["nodata"],
-                dtype=profile["dtype"]),
-            mask=True
-        )
+        return empty_array(
+            (profile["count"], ) + process_tile.shape, profile["dtype"],
+            profile["nodata"])
 
     def for_web(self, data):
         """
@@ -69,6 +69,10 @@ class InputData(base.InputData):
         """
         return self.process.config.output.open(tile, self.process, **kwargs)
 
+    def cleanup(self):
+        """Close input process."""
+        self.process.__exit__(None, None, None)
+
     def bbox(self, out_crs=None):
         """
         Return data bounding box.
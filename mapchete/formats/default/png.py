@@ -28,7 +28,8 @@ import numpy.ma as ma
 
 from mapchete.formats import base
 from mapchete.tile import BufferedTile
-from mapchete.io.raster import write_raster_window, prepare_array, memory_file
+from mapchete.io.raster import (
+    write_raster_window, prepare_array, memory_file, empty_array)
 from mapchete.config import validate_values
 
 
@@ -94,21 +95,29 @@ class OutputData(base.OutputData):
         ----------
         process_tile : ``BufferedTile``
             must be member of process ``TilePyramid``
+
+        Returns
+        -------
+        written : list
+            output tiles written
         """
         rgba = self._prepare_array_for_png(data)
-        data = ma.masked_where(rgba == self.nodata, rgba)
+        data = ma.masked_where(rgba == self.nodata, rgba, copy=False)
+        written = []
         # Convert from process_tile to output_tiles
         for tile in self.pyramid.intersecting(process_tile):
             # skip if file exists and overwrite is not set
             self.prepare_path(tile)
             out_tile = BufferedTile(tile, self.pixelbuffer)
-            write_raster_window(
+            if write_raster_window(
                 in_tile=process_tile,
                 in_data=data,
                 out_tile=BufferedTile(tile, self.pixelbuffer),
                 out_profile=self.profile(out_tile),
                 out_path=self.get_path(tile)
-            )
+            ):
+                written.append(tile)
+        return written
 
     def read(self, output_tile):
         """
@@ -127,7 +136,7 @@ class OutputData(base.OutputData):
             with rasterio.open(self.get_path(output_tile)) as src:
                 return src.read(masked=True)
         except RasterioIOError:
-            return self.empty(output_tile)
+            return self._empty(output_tile)
 
     def is_valid_with_config(self, config):
         """
@@ -188,7 +197,7 @@ class OutputData(base.OutputData):
         metadata : dictionary
             output profile dictionary used for rasterio.
         """
-        dst_metadata = PNG_PROFILE
+        dst_metadata = dict(PNG_PROFILE)
         dst_metadata.pop("transform", None)
         if tile is not None:
             dst_metadata.update(
@@ -213,7 +222,7 @@ class OutputData(base.OutputData):
         web data : array
         """
         rgba = self._prepare_array_for_png(data)
-        data = ma.masked_where(rgba == self.nodata, rgba)
+        data = ma.masked_where(rgba == self.nodata, rgba, copy=False)
         return memory_file(data, self.profile()), 'image/png'
 
     def empty(self, process_tile):
@@ -230,16 +239,17 @@ class OutputData(base.OutputData):
         empty data : array
             empty array with data type given in output parameters
         """
+        return self._empty(process_tile).copy()
+
+    def _empty(self, process_tile):
         bands = (
             self.output_params["bands"]
             if "bands" in self.output_params
             else PNG_PROFILE["count"]
         )
-        return ma.masked_array(
-            data=ma.zeros((bands, ) + process_tile.shape),
-            mask=ma.zeros((bands, ) + process_tile.shape),
-            dtype=PNG_PROFILE["dtype"]
-        )
+        return empty_array(
+            (bands, ) + process_tile.shape, PNG_PROFILE["dtype"], 0,
+            masked=False)
 
     def _prepare_array_for_png(self, data):
         data = prepare_array(data, dtype=np.uint8)
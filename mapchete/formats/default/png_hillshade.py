@@ -29,7 +29,8 @@ import numpy.ma as ma
 
 from mapchete.formats import base
 from mapchete.tile import BufferedTile
-from mapchete.io.raster import write_raster_window, prepare_array, memory_file
+from mapchete.io.raster import (
+    write_raster_window, prepare_array, memory_file, empty_array)
 from mapchete.config import validate_values
 
 
@@ -98,18 +99,27 @@ class OutputData(base.OutputData):
         ----------
         process_tile : ``BufferedTile``
             must be member of process ``TilePyramid``
+
+        Returns
+        -------
+        written : list
+            output tiles written
         """
         data = self._prepare_array(data)
+        written = []
         # Convert from process_tile to output_tiles
         for tile in self.pyramid.intersecting(process_tile):
             # skip if file exists and overwrite is not set
             out_path = self.get_path(tile)
             self.prepare_path(tile)
             out_tile = BufferedTile(tile, self.pixelbuffer)
-            write_raster_window(
+            if write_raster_window(
                 in_tile=process_tile, in_data=data,
                 out_profile=self.profile(out_tile), out_tile=out_tile,
-                out_path=out_path)
+                out_path=out_path
+            ):
+                written.append(tile)
+        return written
 
     def read(self, output_tile):
         """
@@ -129,7 +139,7 @@ class OutputData(base.OutputData):
                 return ma.masked_values(
                     src.read(4 if self.old_band_num else 2), 0)
         except RasterioIOError:
-            return self.empty(output_tile)
+            return self._empty(output_tile)
         return output_tile
 
     def is_valid_with_config(self, config):
@@ -191,7 +201,7 @@ class OutputData(base.OutputData):
         metadata : dictionary
             output profile dictionary used for rasterio.
         """
-        dst_metadata = PNG_PROFILE
+        dst_metadata = dict(PNG_PROFILE)
         dst_metadata.pop("transform", None)
         if tile is not None:
             dst_metadata.update(
@@ -233,7 +243,10 @@ class OutputData(base.OutputData):
             empty array with correct data type for raster data or empty list
             for vector data
         """
-        return ma.masked_values(np.zeros(process_tile.shape), 0)
+        return self._empty(process_tile).copy()
+
+    def _empty(self, process_tile):
+        return empty_array(process_tile.shape, "float64", 0)
 
     def _prepare_array(self, data):
         data = prepare_array(
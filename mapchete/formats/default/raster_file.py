@@ -7,20 +7,29 @@ extended easily.
 
 from cached_property import cached_property
 from copy import deepcopy
+from functools import partial
 import logging
 import os
 import rasterio
 from shapely.geometry import box
+import threading
 import warnings
 
 from mapchete.formats import base
 from mapchete.io.vector import reproject_geometry, segmentize_geometry
 from mapchete.io.raster import read_raster_window
 from mapchete import io
+from mapchete._input_cache import input_cache
+from mapchete._prefetch import current_block
 
 
 logger = logging.getLogger(__name__)
 
+# guards read_options, which are updated by reading and iterated by
+# prefetching threads
+_read_options_lock = threading.Lock()
+
+
 METADATA = {
     "driver_name": "raster_file",
     "data_type": "raster",
@@ -42,6 +51,8 @@ class InputData(base.InputData):
     ----------
     path : string
         path to input file
+    read_options : set
+        band indexes and resampling methods tiles were read with
     profile : dictionary
         rasterio metadata dictionary
     pixelbuffer : integer
@@ -65,6 +76,8 @@ class InputData(base.InputData):
         """Initialize."""
         super(InputData, self).__init__(input_params, **kwargs)
         self.path = input_params["path"]
+        # band indexes and resampling methods used so far, see prefetch()
+        self.read_options = set()
 
     @cached_property
     def profile(self):
@@ -165,15 +178,63 @@ class InputTile(base.InputTile):
         """
         Read reprojected & resampled input data.
 
+        Data is taken from the input cache if available. If the tile is part
+        of an active ``TileBlock``, data is sliced from the data read once for
+        the whole block.
+
         Returns
         -------
         data : array
         """
+        indexes = tuple(self._get_band_indexes(indexes))
+        with _read_options_lock:
+            self.raster_file.read_options.add((indexes, self.resampling))
+        return input_cache.get(
+            self._cache_key(indexes, self.resampling),
+            partial(self._read, list(indexes), self.resampling)
+        )
+
+    def prefetch(self):
+        """
+        Read data into the input cache in advance.
+
+        Bands and resampling methods are the ones this file was read with
+        before, e.g. for the previous tile, or all bands with the tile's
+        resampling method if it was not read yet.
+        """
+        if self.is_empty():
+            return
+        with _read_options_lock:
+            options = list(self.raster_file.read_options)
+        options = options or [
+            (tuple(self._get_band_indexes()), self.resampling)]
+        for indexes, resampling in options:
+            input_cache.prefetch(
+                self._cache_key(indexes, resampling),
+                partial(self._read, list(indexes), resampling)
+            )
+
+    def _cache_key(self, indexes, resampling):
+        return (
+            self.raster_file.path, self.tile.zoom, tuple(self.tile.bounds),
+            indexes, resampling
+        )
+
+    def _read(self, indexes, resampling):
+        block = current_block()
+        if block is not None and block.covers(self.tile):
+            return block.read(
+                self.raster_file.path,
+                self.tile,
+                indexes=indexes,
+                resampling=resampling,
+                gdal_opts=self.gdal_opts
+            )
         return read_raster_window(
             self.raster_file.path,
             self.tile,
-            indexes=self._get_band_indexes(indexes),
-            resampling=self.resampling,
+            indexes=indexes,
+            resampling=resampling,
             gdal_opts=self.gdal_opts
         )
 
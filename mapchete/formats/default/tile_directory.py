@@ -1,5 +1,6 @@
 """Use a directory of zoom/row/column tiles as input."""
 
+from functools import partial
 from itertools import chain
 import numpy as np
 import numpy.ma as ma
@@ -17,6 +18,7 @@ from mapchete.tile import BufferedTilePyramid
 from mapchete.config import validate_values
 from mapchete.errors import MapcheteConfigError
 from mapchete.formats import base
+from mapchete._input_cache import input_cache
 from mapchete.io import path_is_remote
 from mapchete.io.vector import reproject_geometry, read_vector_window
 from mapchete.io.raster import (
@@ -218,19 +220,34 @@ class InputTile(base.InputTile):
                         dtype=self._profile["dtype"]),
                     mask=True
                 )
-            tiles = [
-                (_tile, read_raster_window(
-                    _path, _tile, indexes=indexes, resampling=resampling,
-                    src_nodata=self._profile["nodata"], dst_nodata=dst_nodata,
-                    gdal_opts=gdal_opts))
-                for _tile, _path in self._tiles_paths
-            ]
-            return resample_from_array(
-                in_raster=create_mosaic(
-                    tiles=tiles, nodata=self._profile["nodata"]),
-                out_tile=self.tile,
-                resampling=resampling,
-                nodataval=self._profile["nodata"])
+            return input_cache.get(
+                (
+                    tuple(_path for _, _path in self._tiles_paths),
+                    self.tile.zoom, tuple(self.tile.bounds),
+                    indexes if isinstance(indexes, int) or indexes is None
+                    else tuple(indexes),
+                    resampling, dst_nodata,
+                    tuple(sorted((gdal_opts or {}).items()))
+                ),
+                partial(
+                    self._read_raster, indexes, resampling, dst_nodata,
+                    gdal_opts)
+            )
+
+    def _read_raster(self, indexes, resampling, dst_nodata, gdal_opts):
+        tiles = [
+            (_tile, read_raster_window(
+                _path, _tile, indexes=indexes, resampling=resampling,
+                src_nodata=self._profile["nodata"], dst_nodata=dst_nodata,
+                gdal_opts=gdal_opts))
+            for _tile, _path in self._tiles_paths
+        ]
+        return resample_from_array(
+            in_raster=create_mosaic(
+                tiles=tiles, nodata=self._profile["nodata"]),
+            out_tile=self.tile,
+            resampling=resampling,
+            nodataval=self._profile["nodata"])
 
     def is_empty(self):
         """
@@ -3,22 +3,26 @@
 import itertools
 import rasterio
 import logging
+import os
 import six
+import threading
 import numpy as np
 import numpy.ma as ma
 from affine import Affine
-from collections import namedtuple
-from rasterio.enums import Resampling
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from rasterio.enums import MaskFlags, Resampling
 from rasterio.io import MemoryFile
 from rasterio.vrt import WarpedVRT
 from rasterio.warp import reproject
 from rasterio.windows import from_bounds
-from shapely.ops import cascaded_union
 from tilematrix import clip_geometry_to_srs_bounds
 from types import GeneratorType
 
 from mapchete.tile import BufferedTile
 from mapchete.io import path_is_remote
+from mapchete._http_cache import cached_url
+from mapchete._timing import timed
 
 
 logger = logging.getLogger(__name__)
@@ -27,6 +31,120 @@ ReferencedRaster = namedtuple("ReferencedRaster", ("data", "affine"))
 GDAL_HTTP_OPTS = dict(
     GDAL_DISABLE_READDIR_ON_OPEN=True,
     GDAL_HTTP_TIMEOUT=30)
+# maximum number of open datasets kept per process
+DATASET_POOL_SIZE = 64
+
+
+class DatasetPool(object):
+    """
+    Keep recently used datasets open for subsequent reads.
+
+    Opening a dataset parses the file headers which is expensive for large
+    VRTs or remote files. Datasets are therefore kept open per path, GDAL
+    options and thread and the least recently used ones get closed once
+    ``maxsize`` is exceeded. Datasets still being read are only closed once
+    their reader is done. After a fork, inherited datasets are discarded and
+    the child process opens its own.
+
+    Parameters
+    ----------
+    maxsize : integer
+        maximum number of open datasets (default: DATASET_POOL_SIZE)
+    """
+
+    def __init__(self, maxsize=DATASET_POOL_SIZE):
+        """Initialize."""
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._datasets = OrderedDict()
+        # id of dataset: number of open() contexts using it
+        self._users = {}
+        self._pid = os.getpid()
+
+    @contextmanager
+    def open(self, path, gdal_opts=None):
+        """
+        Yield open dataset.
+
+        Must be called within a ``rasterio.Env`` providing ``gdal_opts``. The
+        dataset must not be used after leaving the context.
+
+        Parameters
+        ----------
+        path : string
+            path to a raster file readable by rasterio
+        gdal_opts : dict
+            GDAL options the dataset is opened with
+
+        Yields
+        ------
+        dataset : ``rasterio.io.DatasetReader``
+        """
+        key = (
+            path, tuple(sorted((gdal_opts or {}).items())),
+            threading.current_thread().ident
+        )
+        with self._lock:
+            self._check_pid()
+            src = self._datasets.pop(key, None)
+            if src is not None and not src.closed:
+                self._checkout(key, src)
+            else:
+                src = None
+        if src is None:
+            src = rasterio.open(path, "r")
+            with self._lock:
+                self._checkout(key, src)
+        try:
+            yield src
+        finally:
+            with self._lock:
+                users = self._users.pop(id(src), 1) - 1
+                if users:
+                    self._users[id(src)] = users
+                # evicted or closed while in use
+                elif self._datasets.get(key) is not src:
+                    src.close()
+
+    def close(self):
+        """Close all open datasets, the ones in use once they are released."""
+        with self._lock:
+            self._check_pid()
+            while self._datasets:
+                self._release(self._datasets.popitem()[1])
+
+    def __len__(self):
+        """Return number of open datasets."""
+        return len(self._datasets)
+
+    def _checkout(self, key, src):
+        replaced = self._datasets.pop(key, None)
+        if replaced not in [None, src]:
+            self._release(replaced)
+        self._datasets[key] = src
+        self._users[id(src)] = self._users.get(id(src), 0) + 1
+        while len(self._datasets) > self.maxsize:
+            self._release(self._datasets.popitem(last=False)[1])
+
+    def _release(self, src):
+        # datasets in use are closed by their last user
+        if id(src) not in self._users:
+            src.close()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # datasets were opened by the parent process
+            self._datasets = OrderedDict()
+            self._users = {}
+            self._pid = os.getpid()
+
+
+_dataset_pool = DatasetPool()
+
+
+def close_datasets():
+    """Close datasets kept open by ``read_raster_window()``."""
+    _dataset_pool.close()
 
 
 def read_raster_window(
@@ -69,6 +187,12 @@ def read_raster_window(
         gdal_opts.update(**user_opts)
     else:
         gdal_opts = user_opts
+    # HTTP(S) inputs are read through the disk block cache if configured
+    cached = cached_url(input_file, gdal_opts)
+    if cached != input_file:
+        # the cache applies the proxy settings, GDAL connects to it directly
+        gdal_opts.update(GDAL_HTTP_PROXY="")
+        input_file = cached
 
     if not isinstance(indexes, int):
         if indexes is None:
@@ -153,34 +277,149 @@ def _get_warped_array(
     gdal_opts=None
 ):
     """Extract a numpy array from a raster file."""
-    with rasterio.Env(**gdal_opts):
-        with rasterio.open(input_file, "r") as src:
-            if indexes is None:
-                dst_shape = (len(src.indexes), dst_shape[-2], dst_shape[-1], )
-                indexes = list(src.indexes)
-            src_nodata = src.nodata if src_nodata is None else src_nodata
-            dst_nodata = src.nodata if dst_nodata is None else dst_nodata
-            with WarpedVRT(
-                src,
-                dst_crs=dst_crs,
-                src_nodata=src_nodata,
-                dst_nodata=dst_nodata,
-                dst_width=dst_shape[-2],
-                dst_height=dst_shape[-1],
-                dst_transform=Affine(
-                    (dst_bounds[2] - dst_bounds[0]) / dst_shape[-2],
-                    0, dst_bounds[0], 0,
-                    (dst_bounds[1] - dst_bounds[3]) / dst_shape[-1],
-                    dst_bounds[3]
-                ),
-                resampling=Resampling[resampling]
-            ) as vrt:
-                return vrt.read(
-                    window=vrt.window(*dst_bounds),
-                    out_shape=dst_shape,
-                    indexes=indexes,
-                    masked=True
-                )
+    with rasterio.Env(**gdal_opts), _dataset_pool.open(
+        input_file, gdal_opts
+    ) as src:
+        if indexes is None:
+            dst_shape = (len(src.indexes), dst_shape[-2], dst_shape[-1], )
+            indexes = list(src.indexes)
+        src_nodata = src.nodata if src_nodata is None else src_nodata
+        dst_nodata = src.nodata if dst_nodata is None else dst_nodata
+        # GDAL alters valid pixels which equal a differing dst_nodata value,
+        # so only read without warping if both nodata values are the same
+        if (
+            src_nodata == dst_nodata and
+            _aligned_readable(src, indexes, src_nodata) and
+            _is_aligned(src, dst_bounds, dst_shape, dst_crs)
+        ):
+            read_window = _read_aligned_window
+        else:
+            read_window = _read_warped_window
+        return read_window(
+            src, indexes=indexes, dst_bounds=dst_bounds, dst_shape=dst_shape,
+            dst_crs=dst_crs, resampling=resampling, src_nodata=src_nodata,
+            dst_nodata=dst_nodata
+        )
+
+
+def _read_warped_window(
+    src, indexes=None, dst_bounds=None, dst_shape=None, dst_crs=None,
+    resampling=None, src_nodata=None, dst_nodata=None
+):
+    """Reproject and resample window from dataset using a WarpedVRT."""
+    with WarpedVRT(
+        src,
+        dst_crs=dst_crs,
+        src_nodata=src_nodata,
+        dst_nodata=dst_nodata,
+        dst_width=dst_shape[-1],
+        dst_height=dst_shape[-2],
+        dst_transform=Affine(
+            (dst_bounds[2] - dst_bounds[0]) / dst_shape[-1],
+            0, dst_bounds[0], 0,
+            (dst_bounds[1] - dst_bounds[3]) / dst_shape[-2],
+            dst_bounds[3]
+        ),
+        resampling=Resampling[resampling]
+    ) as vrt:
+        return vrt.read(
+            window=vrt.window(*dst_bounds),
+            out_shape=dst_shape,
+            indexes=indexes,
+            masked=True
+        )
+
+
+def _read_aligned_window(
+    src, indexes=None, dst_bounds=None, dst_shape=None, dst_nodata=None,
+    **kwargs
+):
+    """
+    Read window from dataset whose pixels match the target grid.
+
+    Pixels masked by the dataset (nodata, internal masks or alpha band) and
+    pixels equal to the nodata value are masked. Areas outside of the dataset
+    are filled with the nodata value and masked; without a nodata value, they
+    are filled with 0 and valid like when reading through a ``WarpedVRT``.
+    """
+    row_off, col_off = _pixel_offsets(src.transform, dst_bounds)
+    height, width = dst_shape[-2:]
+    dtype = src.dtypes[_band_indexes(indexes)[0] - 1]
+    data = np.full(
+        dst_shape, 0 if dst_nodata is None else dst_nodata, dtype=dtype)
+    mask = np.full(dst_shape, dst_nodata is not None, dtype=bool)
+    minrow, maxrow = max(row_off, 0), min(row_off + height, src.height)
+    mincol, maxcol = max(col_off, 0), min(col_off + width, src.width)
+    if minrow < maxrow and mincol < maxcol:
+        window = (
+            Ellipsis,
+            slice(minrow - row_off, maxrow - row_off),
+            slice(mincol - col_off, maxcol - col_off)
+        )
+        read = src.read(
+            indexes, window=((minrow, maxrow), (mincol, maxcol)), masked=True)
+        data[window] = read.data
+        mask[window] = ma.getmaskarray(read)
+    if dst_nodata is not None:
+        # masked pixels hold the nodata value like in warped reads
+        np.copyto(data, dst_nodata, where=mask, casting="unsafe")
+        mask |= _nodata_mask(data, dst_nodata)
+    return ma.MaskedArray(data, mask=mask, fill_value=dst_nodata)
+
+
+def _aligned_readable(src, indexes, src_nodata):
+    """Determine whether bands can be read without warping."""
+    band_indexes = _band_indexes(indexes)
+    # rasterio reads bands of one data type only
+    if len(set(src.dtypes[i - 1] for i in band_indexes)) > 1:
+        return False
+    if src.nodata is not None:
+        # masked reads always apply the dataset nodata value
+        return src_nodata == src.nodata
+    # without nodata, WarpedVRT ignores internal masks but applies alpha
+    # bands, so only datasets without any mask are read directly
+    return all(
+        src.mask_flag_enums[i - 1] == [MaskFlags.all_valid]
+        for i in band_indexes)
+
+
+def _band_indexes(indexes):
+    return [indexes] if isinstance(indexes, int) else list(indexes)
+
+
+def _is_aligned(src, dst_bounds, dst_shape, dst_crs):
+    """Determine whether dataset pixels match target pixels without warping."""
+    transform = src.transform
+    if (
+        src.crs != dst_crs or
+        transform.b != 0 or
+        transform.d != 0 or
+        not np.isclose(
+            transform.a, (dst_bounds[2] - dst_bounds[0]) / dst_shape[-1],
+            rtol=1e-9, atol=0) or
+        not np.isclose(
+            -transform.e, (dst_bounds[3] - dst_bounds[1]) / dst_shape[-2],
+            rtol=1e-9, atol=0)
+    ):
+        return False
+    row_off = (dst_bounds[3] - transform.f) / transform.e
+    col_off = (dst_bounds[0] - transform.c) / transform.a
+    return all(
+        abs(offset - round(offset)) < 1e-6 for offset in (row_off, col_off))
+
+
+def _pixel_offsets(transform, dst_bounds):
+    """Return row and column of target upper left pixel within dataset."""
+    return (
+        int(round((dst_bounds[3] - transform.f) / transform.e)),
+        int(round((dst_bounds[0] - transform.c) / transform.a))
+    )
+
+
+def _nodata_mask(data, nodata):
+    if np.isnan(nodata):
+        return np.isnan(data)
+    return data == nodata
 
 
 def _is_on_edge(tile):
@@ -217,7 +456,8 @@ class RasterWindowMemoryFile():
         """Open MemoryFile, write data and return."""
         self.rio_memfile = MemoryFile()
         with self.rio_memfile.open(**self.profile) as dst:
-            dst.write(self.data.astype(self.profile["dtype"]))
+            dst.write(_filled(self.data, dst.nodata).astype(
+                self.profile["dtype"], copy=False))
             _write_tags(dst, self.tags)
         return self.rio_memfile
 
@@ -244,6 +484,11 @@ def write_raster_window(
         provides output boundaries; if None, in_tile is used
     out_path : string
         output path to write to
+
+    Returns
+    -------
+    written : bool
+        False if the window was not written because it is fully masked
     """
     if out_path == "memoryfile":
         raise DeprecationWarning(
@@ -262,10 +507,21 @@ def write_raster_window(
     if "affine" in out_profile:
         out_profile["transform"] = out_profile.pop("affine")
     # write if there is any band with non-masked data
-    if window_data.all() is not ma.masked:
+    if ma.getmask(window_data) is ma.nomask or not window_data.mask.all():
         with rasterio.open(out_path, 'w', **out_profile) as dst:
-            dst.write(window_data.astype(out_profile["dtype"]))
+            dst.write(_filled(window_data, dst.nodata).astype(
+                out_profile["dtype"], copy=False))
             _write_tags(dst, tags)
+        return True
+    return False
+
+
+def _filled(data, nodata):
+    # rasterio copies masked array views twice, so masked pixels are filled
+    # with nodata here and arrays without a mask are passed on as they are
+    if ma.getmask(data) is ma.nomask:
+        return ma.getdata(data)
+    return data.filled(data.fill_value if nodata is None else nodata)
 
 
 def _write_tags(dst, tags):
@@ -302,6 +558,11 @@ def extract_from_array(in_raster=None, in_affine=None, out_tile=None):
     -------
     extracted array : array
     """
+    with timed("prepare"):
+        return _extract_from_array(in_raster, in_affine, out_tile)
+
+
+def _extract_from_array(in_raster, in_affine, out_tile):
     if isinstance(in_raster, ReferencedRaster):
         in_affine = in_raster.affine
         in_raster = in_raster.data
@@ -332,6 +593,12 @@ def resample_from_array(
     """
     Extract and resample from array to target tile.
 
+    If the tile pixels are aligned with the array pixels and an integer
+    multiple of their size, e.g. when interpolating from the next higher zoom
+    level, nearest, average, mode, min, max and med resampling reduce blocks of
+    array pixels directly. Otherwise the array is warped using rasterio's
+    reproject().
+
     Parameters
     ----------
     in_raster : array
@@ -349,7 +616,8 @@ def resample_from_array(
     if isinstance(in_raster, ma.MaskedArray):
         pass
     if isinstance(in_raster, np.ndarray):
-        in_raster = ma.MaskedArray(in_raster, mask=in_raster == nodataval)
+        in_raster = ma.MaskedArray(
+            in_raster, mask=ma.getdata(in_raster) == nodataval)
     elif isinstance(in_raster, ReferencedRaster):
         in_affine = in_raster.affine
         in_raster = in_raster.data
@@ -374,6 +642,11 @@ def resample_from_array(
         raise TypeError("input array must have 2 or 3 dimensions")
     if in_raster.fill_value != nodataval:
         ma.set_fill_value(in_raster, nodataval)
+    # reduce aligned grids by integer factors without warping
+    factor = _downsample_factor(in_affine, out_tile)
+    if factor and resampling in DOWNSAMPLING_METHODS:
+        return _downsample(
+            in_raster, in_affine, out_tile, factor, resampling, nodataval)
     out_shape = (in_raster.shape[0], ) + out_tile.shape
     dst_data = np.empty(out_shape, in_raster.dtype)
     in_raster = ma.masked_array(
@@ -385,6 +658,185 @@ def resample_from_array(
     return ma.MaskedArray(dst_data, mask=dst_data == nodataval)
 
 
+def _downsample_factor(in_affine, out_tile):
+    """Return integer factor between input and tile pixels on aligned grids."""
+    out_affine = out_tile.affine
+    if in_affine.b != 0 or in_affine.d != 0:
+        return None
+    factor = int(round(out_affine.a / in_affine.a))
+    if (
+        factor < 2 or
+        not np.isclose(
+            out_affine.a, factor * in_affine.a, rtol=1e-9, atol=0) or
+        not np.isclose(
+            out_affine.e, factor * in_affine.e, rtol=1e-9, atol=0)
+    ):
+        return None
+    row_off = (out_affine.f - in_affine.f) / in_affine.e
+    col_off = (out_affine.c - in_affine.c) / in_affine.a
+    if any(
+        abs(offset - round(offset)) > 1e-6 for offset in (row_off, col_off)
+    ):
+        return None
+    return factor
+
+
+def _downsample(in_raster, in_affine, out_tile, factor, resampling, nodataval):
+    """
+    Reduce blocks of factor x factor input pixels to one output pixel.
+
+    Masked pixels are ignored and output pixels without any valid input pixel
+    are masked. Results match GDAL's resampling methods and keep the data
+    type, averages of integer data are rounded.
+    """
+    bands = in_raster.shape[0]
+    height, width = out_tile.shape
+    out_affine = out_tile.affine
+    row = int(round((out_affine.f - in_affine.f) / in_affine.e))
+    col = int(round((out_affine.c - in_affine.c) / in_affine.a))
+    window = (
+        slice(None),
+        slice(row, row + height * factor),
+        slice(col, col + width * factor)
+    )
+    if (
+        row >= 0 and col >= 0 and
+        window[1].stop <= in_raster.shape[1] and
+        window[2].stop <= in_raster.shape[2]
+    ):
+        values = ma.getdata(in_raster)[window]
+        mask = ma.getmaskarray(in_raster)[window]
+    else:
+        # pad input window not covered by input with masked pixels
+        values = np.full(
+            (bands, height * factor, width * factor), nodataval,
+            dtype=in_raster.dtype)
+        mask = np.ones(values.shape, dtype=bool)
+        src_rows = slice(
+            max(row, 0), min(window[1].stop, in_raster.shape[1]))
+        src_cols = slice(
+            max(col, 0), min(window[2].stop, in_raster.shape[2]))
+        if src_rows.start < src_rows.stop and src_cols.start < src_cols.stop:
+            dst = (
+                slice(None),
+                slice(src_rows.start - row, src_rows.stop - row),
+                slice(src_cols.start - col, src_cols.stop - col)
+            )
+            values[dst] = ma.getdata(in_raster)[:, src_rows, src_cols]
+            mask[dst] = ma.getmaskarray(in_raster)[:, src_rows, src_cols]
+    blocks_shape = (bands, height, factor, width, factor)
+    out, out_mask = DOWNSAMPLING_METHODS[resampling](
+        values.reshape(blocks_shape), mask.reshape(blocks_shape))
+    out_mask = out_mask | _nodata_mask(out, nodataval)
+    out[out_mask] = nodataval
+    return ma.MaskedArray(out, mask=out_mask)
+
+
+def _reduce_nearest(values, mask):
+    # GDAL takes the pixel at the output pixel center
+    center = values.shape[2] // 2
+    return (
+        values[:, :, center, :, center].copy(),
+        mask[:, :, center, :, center]
+    )
+
+
+def _reduce_average(values, mask):
+    total = np.zeros(values.shape[:2] + values.shape[3:4], dtype="float64")
+    count = np.zeros(total.shape, dtype="uint32")
+    for block_values, block_mask in _block_pixels(values, mask):
+        valid = ~block_mask
+        np.add(total, block_values, out=total, where=valid)
+        count += valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = total / count
+    if not np.issubdtype(values.dtype, np.floating):
+        average = np.floor(average + 0.5)
+    return np.nan_to_num(average).astype(values.dtype), count == 0
+
+
+def _reduce_min(values, mask):
+    return _reduce_with(
+        np.minimum, _dtype_limits(values.dtype)[1], values, mask)
+
+
+def _reduce_max(values, mask):
+    return _reduce_with(
+        np.maximum, _dtype_limits(values.dtype)[0], values, mask)
+
+
+def _reduce_with(function, fill, values, mask):
+    out = np.full(values.shape[:2] + values.shape[3:4], fill, values.dtype)
+    out_mask = np.ones(out.shape, dtype=bool)
+    for block_values, block_mask in _block_pixels(values, mask):
+        function(out, np.where(block_mask, fill, block_values), out=out)
+        out_mask &= block_mask
+    return out, out_mask
+
+
+def _block_pixels(values, mask):
+    """Yield arrays of pixels at the same position within each block."""
+    factor = values.shape[2]
+    for row in range(factor):
+        for col in range(factor):
+            yield values[:, :, row, :, col], mask[:, :, row, :, col]
+
+
+def _reduce_median(values, mask):
+    # lower median, so the result is one of the input values like in GDAL
+    fill = _dtype_limits(values.dtype)[1]
+    pixels = list(_block_pixels(values, mask))
+    count = sum(~block_mask for _, block_mask in pixels)
+    # masked pixels are sorted to the end of each block
+    values = np.sort(np.stack([
+        np.where(block_mask, fill, block_values)
+        for block_values, block_mask in pixels
+    ], axis=-1), axis=-1)
+    index = np.maximum((count - 1) // 2, 0)[..., None]
+    return np.take_along_axis(values, index, axis=-1)[..., 0], count == 0
+
+
+def _reduce_mode(values, mask):
+    # like GDAL, take the value which first reaches the highest frequency
+    # when scanning the block row by row
+    pixels = [
+        (block_values, ~block_mask)
+        for block_values, block_mask in _block_pixels(values, mask)
+    ]
+    out = pixels[0][0].copy()
+    best = np.zeros(out.shape, dtype="uint32")
+    frequency = np.empty(out.shape, dtype="uint32")
+    for i, (block_values, valid) in enumerate(pixels):
+        frequency[:] = 0
+        for other_values, other_valid in pixels[:i + 1]:
+            frequency += (other_values == block_values) & other_valid
+        frequency *= valid
+        update = frequency > best
+        np.copyto(out, block_values, where=update)
+        np.maximum(best, frequency, out=best)
+    return out, best == 0
+
+
+def _dtype_limits(dtype):
+    if np.issubdtype(dtype, np.floating):
+        return -np.inf, np.inf
+    elif dtype == bool:
+        return False, True
+    info = np.iinfo(dtype)
+    return info.min, info.max
+
+
+# resampling methods supported by NumPy downsampling of aligned grids
+DOWNSAMPLING_METHODS = {
+    "nearest": _reduce_nearest,
+    "average": _reduce_average,
+    "mode": _reduce_mode,
+    "min": _reduce_min,
+    "max": _reduce_max,
+    "med": _reduce_median,
+}
+
+
 def create_mosaic(tiles, nodata=0):
     """
     Create a mosaic from tiles.
@@ -424,9 +876,8 @@ def create_mosaic(tiles, nodata=0):
     # just handle antimeridian on global pyramid types
     shift = _shift_required(tiles)
     # determine mosaic shape and reference
-    m_left, m_bottom, m_right, m_top = None, None, None, None
+    bounds = []
     for tile, data in tiles:
-        num_bands = data.shape[0] if data.ndim > 2 else 1
         left, bottom, right, top = tile.bounds
         if shift:
             left += pyramid.x_size / 2
@@ -435,42 +886,54 @@ def create_mosaic(tiles, nodata=0):
             if right > pyramid.right:
                 right -= pyramid.x_size
                 left -= pyramid.x_size
-        m_left = min([left, m_left]) if m_left is not None else left
-        m_bottom = min([bottom, m_bottom]) if m_bottom is not None else bottom
-        m_right = max([right, m_right]) if m_right is not None else right
-        m_top = max([top, m_top]) if m_top is not None else top
+        bounds.append((left, bottom, right, top))
+    m_left = min(b[0] for b in bounds)
+    m_bottom = min(b[1] for b in bounds)
+    m_right = max(b[2] for b in bounds)
+    m_top = max(b[3] for b in bounds)
+    num_bands = data.shape[0] if data.ndim > 2 else 1
     height = int(round((m_top - m_bottom) / resolution))
     width = int(round((m_right - m_left) / resolution))
-    # initialize empty mosaic
-    mosaic = ma.MaskedArray(
-        data=np.full(
-            (num_bands, height, width), dtype=dtype, fill_value=nodata),
-        mask=np.ones((num_bands, height, width))
-    )
-    # create Affine
-    affine = Affine(resolution, 0, m_left, 0, -resolution, m_top)
-    # fill mosaic array with tile data
-    for tile, data in tiles:
-        data = prepare_array(data, nodata=nodata, dtype=dtype)
-        t_left, t_bottom, t_right, t_top = tile.bounds
-        if shift:
-            t_left += pyramid.x_size / 2
-            t_right += pyramid.x_size / 2
-            # if tile is now shifted outside pyramid bounds, move within
-            if t_right > pyramid.right:
-                t_right -= pyramid.x_size
-                t_left -= pyramid.x_size
-        minrow, maxrow, mincol, maxcol = _bounds_to_ranges(
-            (t_left, t_bottom, t_right, t_top), affine, (height, width)
-        )
-        mosaic[:, minrow:maxrow, mincol:maxcol] = data
-        mosaic.mask[:, minrow:maxrow, mincol:maxcol] = data.mask
+    # fill plain data and mask arrays and create the masked array once
+    with timed("prepare"):
+        mosaic_data = np.full((num_bands, height, width), nodata, dtype=dtype)
+        mosaic_mask = np.ones((num_bands, height, width), dtype=bool)
+        for (tile, data), (left, _, _, top) in zip(tiles, bounds):
+            # mosaic is already masked where tiles are empty
+            if _is_empty(data):
+                continue
+            values, mask = _values_and_mask(data, nodata)
+            row = int(round((m_top - top) / resolution))
+            col = int(round((left - m_left) / resolution))
+            window = (
+                slice(None),
+                slice(row, row + tile.height),
+                slice(col, col + tile.width)
+            )
+            mosaic_data[window] = values
+            mosaic_mask[window] = mask
+        mosaic = ma.MaskedArray(data=mosaic_data, mask=mosaic_mask)
     if shift:
         # shift back output mosaic
-        affine = Affine(
-            resolution, 0, m_left - pyramid.x_size / 2, 0, -resolution, m_top
-        )
-    return ReferencedRaster(data=mosaic, affine=affine)
+        m_left -= pyramid.x_size / 2
+    return ReferencedRaster(
+        data=mosaic,
+        affine=Affine(resolution, 0, m_left, 0, -resolution, m_top)
+    )
+
+
+def _values_and_mask(data, nodata):
+    """Return 3D data and mask of a tile array like prepare_array() would."""
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    values = data.data if isinstance(data, ma.MaskedArray) else data
+    if isinstance(data, ma.MaskedArray) and data.mask.shape == data.shape:
+        return values, data.mask
+    # same as ma.masked_values()
+    elif np.issubdtype(values.dtype, np.floating):
+        return values, np.isclose(values, nodata)
+    else:
+        return values, values == nodata
 
 
 def _bounds_to_ranges(bounds, affine, shape):
@@ -497,12 +960,15 @@ def _get_tiles_properties(tiles):
 
 def _shift_required(tiles):
     """Determine if temporary shift is required to deal with antimeridian."""
-    if tiles[0][0].tile_pyramid.is_global:
-        # check if tiles are all connected to each other
-        bbox = cascaded_union([tile.bbox for tile, _ in tiles])
-        connected = True if bbox.geom_type != "MultiPolygon" else False
-        # if tiles are not connected, shift by half the globe
-        return True if not connected else False
+    tile_pyramid = tiles[0][0].tile_pyramid
+    if tile_pyramid.is_global:
+        # shift by half the globe if tiles are closer together across the
+        # antimeridian than within the tile matrix
+        matrix_width = tile_pyramid.matrix_width(tiles[0][0].zoom)
+        cols = set(tile.col for tile, _ in tiles)
+        shifted = set(
+            (col + matrix_width // 2) % matrix_width for col in cols)
+        return max(shifted) - min(shifted) < max(cols) - min(cols)
     else:
         return False
 
@@ -525,6 +991,56 @@ def memory_file(data=None, profile=None):
     return memfile
 
 
+# read-only data and mask views shared by all empty arrays of the same kind
+_empty_arrays = {}
+
+
+def empty_array(shape, dtype, nodata, masked=True):
+    """
+    Return masked array of nodata values without allocating its pixels.
+
+    Data and mask are read-only broadcast views of a single value which are
+    cached per shape, data type, nodata value and mask. ``prepare_array()``,
+    ``create_mosaic()`` and the raster writers handle these arrays without
+    materializing them. Copy the array before modifying it in place.
+
+    Parameters
+    ----------
+    shape : tuple
+        array shape
+    dtype : string
+        data type
+    nodata : integer or float
+        value of all pixels
+    masked : bool
+        whether all pixels are masked (default: True)
+
+    Returns
+    -------
+    array : MaskedArray
+    """
+    # repr() lets NaN nodata values match
+    key = (tuple(shape), np.dtype(dtype).str, repr(nodata), bool(masked))
+    if key not in _empty_arrays:
+        _empty_arrays[key] = (
+            np.broadcast_to(np.array(nodata, dtype=dtype), shape),
+            np.broadcast_to(np.array(bool(masked)), shape)
+        )
+    data, mask = _empty_arrays[key]
+    return ma.MaskedArray(data=data, mask=mask, fill_value=nodata)
+
+
+def _is_empty(data):
+    """Return whether data is a fully masked array like from empty_array()."""
+    mask = ma.getmask(data)
+    return (
+        mask is not ma.nomask and
+        mask.size > 0 and
+        not any(mask.strides) and
+        bool(mask.flat[0])
+    )
+
+
 def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     """
     Turn input data into a proper array for further usage.
@@ -549,6 +1065,11 @@ def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     -------
     array : array
     """
+    with timed("prepare"):
+        return _prepare_array(data, masked, nodata, dtype)
+
+
+def _prepare_array(data, masked, nodata, dtype):
     # input is iterable
     if isinstance(data, (list, tuple)):
         return _prepare_iterable(data, masked, nodata, dtype)
@@ -557,6 +1078,11 @@ def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     elif isinstance(data, np.ndarray) and data.ndim == 2:
         data = ma.expand_dims(data, axis=0)
 
+    # keep empty arrays compact
+    if _is_empty(data):
+        empty = empty_array(data.shape, dtype, nodata)
+        return empty if masked else empty.data
+
     # input is a masked array
     if isinstance(data, ma.MaskedArray):
         return _prepare_masked(data, masked, nodata, dtype)
@@ -564,9 +1090,12 @@ def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     # input is a NumPy array
     elif isinstance(data, np.ndarray):
         if masked:
-            return ma.masked_values(data, nodata).astype(dtype)
+            return _burn_nodata(
+                ma.masked_values(data, nodata, copy=False).astype(
+                    dtype, copy=False),
+                nodata)
         else:
-            return data.astype(dtype)
+            return data.astype(dtype, copy=False)
     else:
         raise ValueError(
             "data must be array, masked array or iterable containing arrays.")
@@ -583,32 +1112,67 @@ def _prepare_iterable(data, masked, nodata, dtype):
                     assert band.shape == band.mask.shape
                     out_mask += (band.mask, )
             except AssertionError:
-                out_mask += (
-                    np.where(band.data == nodata, True, False), )
+                out_mask += (band.data == nodata, )
         elif isinstance(band, np.ndarray):
             out_data += (band, )
             if masked:
-                out_mask += (np.where(band == nodata, True, False), )
+                out_mask += (band == nodata, )
         else:
             raise ValueError("input data bands must be NumPy arrays")
     if masked:
         assert len(out_data) == len(out_mask)
-        return ma.MaskedArray(
-            data=np.stack(out_data).astype(dtype),
-            mask=np.stack(out_mask))
+        return _burn_nodata(
+            ma.MaskedArray(
+                data=np.stack(out_data).astype(dtype, copy=False),
+                mask=np.stack(out_mask)),
+            nodata)
     else:
-        return np.stack(out_data).astype(dtype)
+        return np.stack(out_data).astype(dtype, copy=False)
 
 
 def _prepare_masked(data, masked, nodata, dtype):
+    # arrays are only copied if they have to be converted
     try:
         assert data.shape == data.mask.shape
         if masked:
-            return data.astype(dtype)
+            return _burn_nodata(data.astype(dtype, copy=False), nodata)
         else:
-            return ma.filled(data, nodata).astype(dtype)
+            return ma.filled(data, nodata).astype(dtype, copy=False)
     except AssertionError:
         if masked:
-            return ma.masked_values(data, nodata).astype(dtype)
+            return _burn_nodata(
+                ma.masked_values(data, nodata, copy=False).astype(
+                    dtype, copy=False),
+                nodata)
         else:
-            return ma.filled(data, nodata).astype(dtype)
+            return ma.filled(data, nodata).astype(dtype, copy=False)
+
+
+def _burn_nodata(data, nodata):
+    # masked pixels get the nodata value; the array is only copied if any
+    # masked pixel holds a different value
+    mask = ma.getmask(data)
+    if (
+        mask is not ma.nomask and
+        mask.any() and
+        _differs(data.data[mask], nodata).any()
+    ):
+        data = ma.MaskedArray(
+            np.where(mask, nodata, data.data).astype(data.dtype, copy=False),
+            mask=mask)
+    else:
+        # don't set fill_value on the array passed in
+        data = data.view(ma.MaskedArray)
+    try:
+        data.fill_value = nodata
+    except (TypeError, OverflowError):
+        # nodata cannot be represented in data type
+        pass
+    return data
+
+
+def _differs(values, nodata):
+    # NaN does not equal itself
+    if nodata != nodata:
+        return ~np.isnan(values)
+    return values != nodata
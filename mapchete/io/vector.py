@@ -214,6 +214,11 @@ def write_vector_window(
         tile used for output extent
     out_path : string
         output path for GeoJSON file
+
+    Returns
+    -------
+    written : bool
+        False if no feature intersects with the tile
     """
     # Delete existing file.
     try:
@@ -246,6 +251,8 @@ def write_vector_window(
         ) as dst:
             for feature in out_features:
                 dst.write(feature)
+        return True
+    return False
 
 
 def _get_reprojected_features(
@@ -147,6 +147,18 @@ def process_error_py():
     return os.path.join(TESTDATA_DIR, "process_error.py")
 
 
+@pytest.fixture
+def process_unpicklable_error_py():
+    """Fixture for process_unpicklable_error.py"""
+    return os.path.join(TESTDATA_DIR, "process_unpicklable_error.py")
+
+
+@pytest.fixture
+def process_worker_killed_py():
+    """Fixture for process_worker_killed.py"""
+    return os.path.join(TESTDATA_DIR, "process_worker_killed.py")
+
+
 @pytest.fixture
 def output_error_py():
     """Fixture for output_error.py"""
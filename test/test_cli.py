@@ -120,6 +120,12 @@ def test_execute_multiprocessing(mp_tmpdir, cleantopo_br, cleantopo_br_tif):
     # run example process with multiprocessing
     args = [None, 'execute', cleantopo_br.path, '--zoom', '5', '-m', '2']
     MapcheteCLI(args)
+    # write output in background threads
+    args = [
+        None, 'execute', cleantopo_br.path, '--zoom', '5', '-m', '2',
+        '--write_threads', '2', '--tile_order', 'hilbert', '--overwrite',
+        '--max_chunksize', '4', '--adaptive_chunksize']
+    MapcheteCLI(args)
 
 
 def test_execute_debug(mp_tmpdir, example_mapchete):
@@ -360,7 +366,10 @@ def test_index_geojson(mp_tmpdir, cleantopo_br):
     MapcheteCLI([
         None, 'index', cleantopo_br.path,  '-z', '3', '--geojson', '--debug'])
     with mapchete.open(cleantopo_br.dict) as mp:
-        files = os.listdir(mp.config.output.path)
+        # ignore tile registry
+        files = [
+            f for f in os.listdir(mp.config.output.path)
+            if not f.startswith(".")]
         assert len(files) == 2
         assert "3.geojson" in files
     with fiona.open(os.path.join(mp.config.output.path, "3.geojson")) as src:
@@ -432,7 +441,10 @@ def test_index_geojson_tile(mp_tmpdir, cleantopo_tl):
         None, 'index', cleantopo_tl.path, '-t', '3', '0', '0', '--geojson',
         '--debug'])
     with mapchete.open(cleantopo_tl.dict) as mp:
-        files = os.listdir(mp.config.output.path)
+        # ignore tile registry
+        files = [
+            f for f in os.listdir(mp.config.output.path)
+            if not f.startswith(".")]
         assert len(files) == 2
         assert "3.geojson" in files
     with fiona.open(os.path.join(mp.config.output.path, "3.geojson")) as src:
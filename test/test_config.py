@@ -86,6 +86,36 @@ def test_config_zoom11(example_mapchete, dummy2_tif, dummy1_tif):
     assert zoom11["some_bool_parameter"] is True
 
 
+def test_params_snapshots(example_mapchete, execute_kwargs_py):
+    """Configuration snapshots are prepared once per zoom level."""
+    config = MapcheteConfig(example_mapchete.path)
+    zoom7 = config.params_at_zoom(7)
+    assert zoom7 == config.params_at_zoom(7)
+    # input objects are shared, the input tree is not
+    assert zoom7["input"] is not config.params_at_zoom(7)["input"]
+    assert all(
+        v is config.params_at_zoom(7)["input"][k]
+        for k, v in zoom7["input"].items())
+    # changing a snapshot does not affect other tiles
+    zoom7.update(some_integer_parameter=0)
+    zoom7["input"].clear()
+    assert config.params_at_zoom(7)["some_integer_parameter"] == 12
+    assert config.params_at_zoom(7)["input"]
+    # execute(mp, **kwargs) is only called with the MapcheteProcess
+    assert config.process_kwargs_at_zoom(7) == {}
+    kwargs_config = example_mapchete.dict
+    kwargs_config.update(process_file=execute_kwargs_py)
+    config = MapcheteConfig(kwargs_config)
+    kwargs = config.process_kwargs_at_zoom(7)
+    assert kwargs == dict(
+        some_integer_parameter=12, some_float_parameter=5.3,
+        some_string_parameter="string1", some_bool_parameter=True)
+    kwargs.update(some_integer_parameter=0)
+    assert config.process_kwargs_at_zoom(7)["some_integer_parameter"] == 12
+    with pytest.raises(ValueError):
+        config.process_kwargs_at_zoom(5)
+
+
 def test_read_zoom_level(zoom_mapchete):
     """Read zoom level from config file."""
     config = MapcheteConfig(zoom_mapchete.path)
@@ -216,3 +246,23 @@ def test_abstract_input(abstract_input):
 def test_init_zoom(cleantopo_br):
     with mapchete.open(cleantopo_br.dict, zoom=[3, 5]) as mp:
         assert mp.config.init_zoom_levels == range(3, 6)
+
+
+def test_http_cache(cleantopo_br):
+    """Parse disk cache configuration for remote inputs."""
+    config = deepcopy(cleantopo_br.dict)
+    assert MapcheteConfig(config).http_cache == dict(path=None, max_bytes=0)
+    config.update(http_cache=dict(path="cache"))
+    assert MapcheteConfig(config).http_cache == dict(
+        path=os.path.join(config["config_dir"], "cache"),
+        max_bytes=1024 * 1024 * 1024)
+    config.update(http_cache=dict(path="/tmp/cache", size=10))
+    assert MapcheteConfig(config).http_cache == dict(
+        path="/tmp/cache", max_bytes=10 * 1024 * 1024)
+    for invalid in [
+        "cache", dict(size=10), dict(path="cache", size=0),
+        dict(path="cache", size="10MB")
+    ]:
+        config.update(http_cache=invalid)
+        with pytest.raises(MapcheteConfigError):
+            MapcheteConfig(config).http_cache
@@ -4,6 +4,7 @@
 
 import pytest
 from copy import deepcopy
+from multiprocessing.pool import MaybeEncodingError
 
 import mapchete
 from mapchete.config import MapcheteConfig, validate_values
@@ -263,6 +264,22 @@ def test_process_exception(mp_tmpdir, cleantopo_br, process_error_py):
             mp.execute((5, 0, 0))
 
 
+def test_batch_process_lost_task(
+    mp_tmpdir, cleantopo_br, process_unpicklable_error_py,
+    process_worker_killed_py
+):
+    """Assert failed worker tasks are raised instead of waited for."""
+    for process_file, exception in [
+        (process_unpicklable_error_py, MaybeEncodingError),
+        (process_worker_killed_py, errors.MapcheteProcessException)
+    ]:
+        config = cleantopo_br.dict
+        config.update(process_file=process_file)
+        with mapchete.open(config) as mp:
+            with pytest.raises(exception):
+                mp.batch_process(zoom=5, multi=2)
+
+
 def test_output_error(mp_tmpdir, cleantopo_br, output_error_py):
     """Assert output error is raised."""
     config = cleantopo_br.dict
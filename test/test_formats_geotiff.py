@@ -57,10 +57,16 @@ def test_output_data(mp_tmpdir):
     data = output.read(tile)
     assert isinstance(data, np.ndarray)
     assert data[0].mask.all()
+    # missing tiles are shared read-only arrays
+    assert not any(data.mask.strides)
     # empty
     empty = output.empty(tile)
     assert isinstance(empty, ma.MaskedArray)
     assert not empty.any()
+    # empty data can be filled in place
+    empty[:] = 1
+    assert empty.all()
+    assert not output.empty(tile).any()
     # deflate with predictor
     output_params.update(compress="deflate", predictor=2)
     output = gtiff.OutputData(output_params)
@@ -87,6 +87,10 @@ def test_output_data(mp_tmpdir):
     empty = output.empty(tile)
     assert isinstance(empty, ma.MaskedArray)
     assert not empty.any()
+    # empty data can be filled in place
+    empty[:] = 1
+    assert empty.all()
+    assert not output.empty(tile).any()
     # read non-existing file
     data = output.read(tile)
     assert data.mask.all()
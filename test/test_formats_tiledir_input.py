@@ -7,6 +7,7 @@ import six
 
 from mapchete.formats import available_input_formats
 from mapchete.errors import MapcheteDriverError
+from mapchete._input_cache import input_cache
 
 import mapchete
 
@@ -74,6 +75,24 @@ def _run_tiledir_process_raster(conf_dict, metatiling, bounds):
             for tile in mp.get_process_tiles(4)])
 
 
+def test_read_raster_data_cached(
+    mp_tmpdir, cleantopo_br, cleantopo_br_tiledir
+):
+    """Repeated reads are served from the input cache."""
+    with mapchete.open(cleantopo_br.path) as mp:
+        bounds = mp.config.bounds_at_zoom()
+        mp.batch_process(zoom=4)
+    conf = deepcopy(cleantopo_br_tiledir.dict)
+    conf.update(input_cache=16)
+    with mapchete.open(conf, mode="overwrite", bounds=bounds) as mp:
+        tile = next(mp.get_process_tiles(4))
+        input_data = next(six.itervalues(mp.config.input))
+        first = input_data.open(tile).read()
+        assert input_cache.misses == 1
+        assert (input_data.open(tile).read() == first).all()
+        assert input_cache.hits == 1
+
+
 def test_read_remote_raster_data(mp_tmpdir, cleantopo_remote):
     """Read raster data."""
     with mapchete.open(cleantopo_remote.path) as mp:
@@ -13,12 +13,28 @@ try:
 except ImportError:
     from pickle import dumps
 from functools import partial
+from itertools import product
 from multiprocessing import Pool
-from shapely.geometry import shape
+from shapely.geometry import box, LineString, Point, shape
+import threading
+import time
 
 import mapchete
-from mapchete.io.raster import create_mosaic
-from mapchete.errors import MapcheteProcessOutputError
+from mapchete._core import (
+    _process_worker, _process_tiles_worker, _update_registry)
+from mapchete._scheduler import (
+    TILE_ORDERS, ChunkSizer, TileScheduler, block_tiles, hilbert_index,
+    sort_tiles, zorder_index)
+from mapchete._prefetch import NextTilePrefetcher, TileBlock, current_block
+from mapchete._input_cache import input_cache
+from mapchete._tile_cache import TileCache, output_nbytes
+from mapchete.io.raster import (
+    _dataset_pool, create_mosaic, read_raster_window)
+from mapchete.tile import BufferedTilePyramid
+from mapchete._timing import TileTimer, timed
+from mapchete._coverage import tile_coverage
+from mapchete.errors import (
+    MapcheteConfigError, MapcheteProcessException, MapcheteProcessOutputError)
 
 
 def test_empty_execute(mp_tmpdir, cleantopo_br):
@@ -116,6 +132,119 @@ def test_get_raw_output_memory(mp_tmpdir, cleantopo_tl):
         assert not mp.get_raw_output((5, 0, 0)).mask.all()
 
 
+def test_process_tile_cache(mp_tmpdir, cleantopo_tl):
+    """Process output cache is limited by bytes and counts its use."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(dict(config), mode="memory") as mp:
+        tiles = list(mp.get_process_tiles(5))[2:5]
+        nbytes = max(output_nbytes(mp.execute(tile)) for tile in tiles)
+    # room for two process tiles
+    with mapchete.open(
+        dict(config), mode="memory", cache_size=2.5 * nbytes / 2 ** 20
+    ) as mp:
+        cache = mp.process_tile_cache
+        for tile in tiles:
+            mp.get_raw_output(tile)
+        assert (cache.hits, cache.misses, cache.evictions) == (0, 3, 1)
+        assert len(cache) == 2
+        assert cache.nbytes <= cache.max_bytes
+        assert tiles[0].id not in cache
+        mp.get_raw_output(tiles[2])
+        assert cache.hits == 1
+    # output larger than the cache is processed but not cached
+    with mapchete.open(
+        dict(config), mode="memory", cache_size=0.5 * nbytes / 2 ** 20
+    ) as mp:
+        assert not mp.get_raw_output(tiles[0]).mask.all()
+        assert not len(mp.process_tile_cache)
+    with pytest.raises(ValueError):
+        mapchete.open(cleantopo_tl.path, mode="memory", cache_size=0)
+    # vector output is estimated by its features
+    features = [
+        dict(geometry=box(0, 0, 1, 1), properties=dict(name="a" * 1000))
+    ]
+    assert output_nbytes(features) > 1000
+    assert output_nbytes(features * 10) > 9 * output_nbytes(features)
+
+
+def test_process_tile_cache_spill(mp_tmpdir, cleantopo_tl):
+    """Process output dropped from memory is kept on disk."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    spill_dir = os.path.join(mp_tmpdir, "spill")
+    with mapchete.open(dict(config), mode="memory") as mp:
+        tiles = list(mp.get_process_tiles(5))[2:5]
+        outputs = [mp.get_raw_output(tile) for tile in tiles]
+        nbytes = max(output_nbytes(output) for output in outputs)
+    # room for one process tile in memory and two on disk
+    with mapchete.open(
+        dict(config), mode="memory", cache_size=1.5 * nbytes / 2 ** 20,
+        spill_dir=spill_dir, spill_size=2.5 * nbytes / 2 ** 20
+    ) as mp:
+        cache = mp.process_tile_cache
+        for tile in tiles:
+            mp.get_raw_output(tile)
+        assert (cache.misses, cache.evictions) == (3, 2)
+        cache.flush()
+        assert 0 < cache.spilled_nbytes <= 2.5 * nbytes
+        assert all(tile.id in cache for tile in tiles)
+        output = mp.get_raw_output(tiles[0])
+        assert (cache.hits, cache.disk_hits) == (1, 1)
+        assert np.array_equal(output, outputs[0])
+        assert np.array_equal(output.mask, outputs[0].mask)
+        # least recently used files are removed to stay within spill_size
+        cache.flush()
+        assert tiles[1].id not in cache
+        assert cache.spilled_nbytes <= 2.5 * nbytes
+        assert len(os.listdir(spill_dir)) == 1
+    # spilled tiles are removed on exit
+    assert not os.listdir(spill_dir)
+    with pytest.raises(ValueError):
+        mapchete.open(
+            cleantopo_tl.path, mode="memory", spill_dir=spill_dir,
+            spill_size=-1)
+
+
+def test_process_tile_cache_spill_unlocked(mp_tmpdir):
+    """Neither cache updates nor lookups wait for tiles written to disk."""
+    first, second = np.ones((256, 256)), np.zeros((256, 256))
+    cache = TileCache(
+        1.5 * first.nbytes, spill_path=os.path.join(mp_tmpdir, "spill"),
+        spill_max_bytes=10 * first.nbytes)
+    started, release = threading.Event(), threading.Event()
+    store = cache._spill.store
+
+    def blocking_store(key, output):
+        started.set()
+        release.wait(10)
+        store(key, output)
+
+    cache._spill.store = blocking_store
+    cache.set((5, 0, 0), first)
+    try:
+        start = time.time()
+        cache.set((5, 0, 1), second)
+        assert started.wait(10)
+        assert cache.get((5, 0, 1)) is second
+        # tiles waiting to be spilled are still available
+        assert (5, 0, 0) in cache
+        assert cache.get((5, 0, 0)) is first
+        assert time.time() - start < 5
+    finally:
+        release.set()
+    cache.flush()
+    assert cache.spilled_nbytes
+    assert not cache._pending
+    # tiles are loaded from disk once dropped from memory again
+    cache.set((5, 0, 2), np.ones((256, 256)))
+    cache.flush()
+    assert np.array_equal(cache.get((5, 0, 1)), second)
+    assert cache.disk_hits == 1
+    cache.close()
+    assert not cache._writer[1].is_alive()
+
+
 def test_get_raw_output_readonly(mp_tmpdir, cleantopo_tl):
     """Get raw process output using readonly flag."""
     tile = (5, 0, 0)
@@ -300,6 +429,16 @@ def _worker(mp, tile):
     return tile, mp.execute(tile)
 
 
+def test_worker_task_size(cleantopo_tl):
+    """Batch processing tasks only carry tile indexes."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        tile = next(mp.get_process_tiles(5))
+        # previously, the whole process object was pickled for every task
+        per_tile_before = len(dumps((partial(_process_worker, mp), tile)))
+        per_tile_after = len(dumps((_process_tiles_worker, ([tile.id], ))))
+        assert per_tile_after * 10 < per_tile_before
+
+
 def test_write_empty(mp_tmpdir, cleantopo_tl):
     """Test write function when passing an empty process_tile."""
     with mapchete.open(cleantopo_tl.path) as mp:
@@ -347,6 +486,41 @@ def test_count_tiles(zoom_mapchete):
                 maxzoom)
 
 
+def test_tile_coverage():
+    """Rasterized coverage yields the same tiles as tiles_from_geom()."""
+    pyramid = BufferedTilePyramid("geodetic", metatiling=2).tile_pyramid
+    ring = Point(15, 48).buffer(3).difference(Point(15, 48).buffer(1))
+    geometries = [
+        ring,
+        box(14.0625, 47.8125, 16.875, 50.625),
+        LineString([(0, 0), (10, 5), (12, -3)]),
+        Point(-170, 80).buffer(5).union(Point(100, -40).buffer(7)),
+    ]
+    for geometry in geometries:
+        for zoom in [0, 3, 6, 9]:
+            coverage = tile_coverage(geometry, pyramid, zoom)
+            tile_ids = list(coverage.tile_ids())
+            assert tile_ids == [
+                tile.id for tile in pyramid.tiles_from_geom(geometry, zoom)]
+            assert coverage.count == len(tile_ids)
+    # geometries which cannot be rasterized
+    assert tile_coverage(Point(0, 0), pyramid, 5) is None
+    assert tile_coverage(box(170, 0, 190, 10), pyramid, 5) is None
+
+
+def test_count_process_tiles(zoom_mapchete):
+    """Count exactly the tiles which get processed."""
+    conf = zoom_mapchete.dict
+    conf.update(
+        zoom_levels=dict(min=0, max=10),
+        bounds=[14.0625, 47.8125, 16.875, 50.625], input=None)
+    with mapchete.open(conf) as mp:
+        for zoom in range(11):
+            assert mp.count_tiles(zoom, zoom) == len(
+                list(mp.get_process_tiles(zoom)))
+        assert mp.count_tiles(0, 10) == len(list(mp.get_process_tiles()))
+
+
 def test_batch_process(mp_tmpdir, cleantopo_tl):
     """Test batch_process function."""
     with mapchete.open(cleantopo_tl.path) as mp:
@@ -361,6 +535,605 @@ def test_batch_process(mp_tmpdir, cleantopo_tl):
         mp.batch_process(zoom=2, multi=1)
 
 
+def test_batch_process_write_threads(mp_tmpdir, cleantopo_tl, monkeypatch):
+    """Write output in background threads while processing."""
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        for multi in [1, 2]:
+            results = list(mp.batch_processor(
+                zoom=2, multi=multi, max_chunksize=4, write_threads=2))
+            assert len(results) == mp.count_tiles(2, 2)
+            for result in results:
+                assert isinstance(result["write"], str)
+                assert mp.config.output.tiles_exist(result["process_tile"])
+        # writer threads are stopped after every task, also if it failed
+        monkeypatch.setattr(mapchete._core, "_worker_process", mp)
+        monkeypatch.setattr(mapchete._core, "_worker_write_threads", 2)
+        threads = threading.active_count()
+        tile_ids = [tile.id for tile in mp.get_process_tiles(2)]
+        assert len(_process_tiles_worker(tile_ids)[0]) == len(tile_ids)
+        assert threading.active_count() == threads
+        assert _process_tiles_worker(tile_ids + [(2, 99, 99)])[2]
+        assert threading.active_count() == threads
+
+
+def test_batch_process_continue_prescan(mp_tmpdir, cleantopo_tl):
+    """Existing output is found by listing it once per zoom level."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        zoom_tiles = list(mp.get_process_tiles(3))
+        mp.batch_process(tile=zoom_tiles[0].id)
+        output_tiles = mp.config.output_pyramid.intersecting(zoom_tiles[0])
+        existing = mp.config.output.existing_tiles(3)
+        assert existing == set(
+            (tile.row, tile.col) for tile in output_tiles)
+        # stray files and directories are ignored
+        zoomdir = os.path.join(mp.config.output.path, "3")
+        os.makedirs(os.path.join(zoomdir, "foo"))
+        open(os.path.join(zoomdir, "0", "bar.tif"), "w").close()
+        assert mp.config.output.existing_tiles(3) == existing
+        assert mp.config.output.existing_tiles(4) == set()
+        for multi in [1, 2]:
+            results = list(mp.batch_processor(zoom=3, multi=multi))
+            assert len(results) == len(zoom_tiles)
+            skipped = [
+                result["process_tile"].id for result in results
+                if result["process"] == "output already exists"
+            ]
+            assert zoom_tiles[0].id in skipped
+            assert mp.config.output.existing_tiles(3)
+        assert len(skipped) == len(zoom_tiles)
+
+
+def test_batch_process_empty_registry(
+    mp_tmpdir, example_mapchete, execute_kwargs_py
+):
+    """Processed but empty tiles are not processed again in continue mode."""
+    config = example_mapchete.dict
+    config.update(process_file=execute_kwargs_py)
+    config["output"].update(path=mp_tmpdir)
+    zoom = 7
+    with mapchete.open(config) as mp:
+        registry = mp.config.output.registry
+        process_tiles = list(mp.get_process_tiles(zoom))
+        assert not os.path.isfile(registry.path)
+        # all process tiles are empty
+        for result in mp.batch_processor(zoom=zoom, multi=2):
+            assert result["write"] == "output empty, nothing written"
+        assert os.path.isfile(registry.path)
+        assert registry.tiles(zoom) == set(
+            (tile.row, tile.col)
+            for process_tile in process_tiles
+            for tile in mp.config.output.pyramid.intersecting(process_tile)
+        )
+        # tiles_exist() only checks output files
+        assert not any(
+            mp.config.output.tiles_exist(process_tile)
+            for process_tile in process_tiles)
+        # forked processes open their own database connection
+        connection = registry._connection
+        registry._pid = -1
+        assert registry.tiles(zoom)
+        assert registry._connection not in [None, connection]
+        # output tiles do not exist as files
+        assert not any(
+            mp.config.output.tiles_exist(output_tile=tile)
+            for tile in mp.config.output.pyramid.intersecting(
+                process_tiles[0]))
+        # empty tiles are skipped like existing ones
+        for multi in [1, 2]:
+            for result in mp.batch_processor(zoom=zoom, multi=multi):
+                assert result["process"] == "output already exists"
+    # written tiles are removed from registry in overwrite mode
+    with mapchete.open(config, mode="overwrite") as mp:
+        mp.write(process_tiles[0], np.ones((1, ) + process_tiles[0].shape))
+        assert mp.config.output.tiles_exist(process_tiles[0])
+        # output formats report written tiles, existing files do not count
+        assert mp.config.output.write(
+            process_tiles[0], np.ones((1, ) + process_tiles[0].shape)
+        ) == list(mp.config.output.pyramid.intersecting(process_tiles[0]))
+        assert mp.write(
+            process_tiles[0], ma.masked_all((1, ) + process_tiles[0].shape)
+        ) == "output empty, nothing written"
+        # output formats not reporting written tiles are never empty
+        mp.config.output.write = lambda process_tile, data: None
+        assert mp.write(
+            process_tiles[0], ma.masked_all((1, ) + process_tiles[0].shape)
+        ).startswith("output written")
+        del mp.config.output.write
+        _update_registry(
+            mp, [(process_tiles[0], dict(write="output written in 0.1s"))])
+        assert len(mp.config.output.registry.tiles(zoom)) == len(
+            process_tiles) - 1
+
+
+def test_batch_processor_timings(mp_tmpdir, cleantopo_tl):
+    """Reports contain numeric timings which are aggregated."""
+    fields = [
+        "read_time", "process_time", "prepare_time", "write_time",
+        "read_bytes", "written_bytes", "cache_hits", "cache_misses"]
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        for multi, write_threads in [(1, 0), (2, 0), (2, 2)]:
+            results = list(mp.batch_processor(
+                zoom=3, multi=multi, write_threads=write_threads))
+            for result in results:
+                timings = result["timings"]
+                assert set(timings.keys()) == set(fields)
+                assert timings["read_time"] > 0
+                assert timings["write_time"] > 0
+                assert timings["read_bytes"] > 0
+                assert timings["written_bytes"] > 0
+            summary = mp.timing_summary.as_dict()
+            assert summary["tiles"] == len(results)
+            assert summary["total"]["written_bytes"] == sum(
+                result["timings"]["written_bytes"] for result in results)
+    # nested stages are not counted twice
+    timer = TileTimer()
+    with timer.active():
+        with timed("process"):
+            with timed("read"):
+                time.sleep(0.05)
+    assert timer.durations["read"] >= 0.05
+    assert timer.durations["process"] < 0.05
+    # nothing is counted without an active timer
+    with timed("read"):
+        pass
+
+
+def test_batch_process_journal(mp_tmpdir, cleantopo_tl, process_error_py):
+    """Finished and failed tiles are journaled in the output directory."""
+    process_file = cleantopo_tl.dict["process_file"]
+    with mapchete.open(cleantopo_tl.path) as mp:
+        results = list(mp.batch_processor(zoom=3, multi=2))
+        registry = mp.config.output.registry
+        assert registry.recorded(["written"]) == set(
+            result["process_tile"].id for result in results)
+        assert not registry.recorded(["failed"])
+        assert registry.is_complete(3)
+        written = registry.recorded(["written"])
+    # restarted run skips journaled tiles without looking at the output
+    with mapchete.open(cleantopo_tl.path) as mp:
+        def existing_tiles(zoom):
+            raise AssertionError("output listed")
+        mp.config.output.existing_tiles = existing_tiles
+        for result in mp.batch_processor(zoom=3, multi=2):
+            assert result["process"] == "output already exists"
+    # restarted run processes journaled tiles again if their output is gone
+    shutil.rmtree(os.path.join(mp_tmpdir, "3"))
+    with mapchete.open(cleantopo_tl.path) as mp:
+        assert set(
+            result["process_tile"].id
+            for result in mp.batch_processor(zoom=3, multi=1)
+            if result["process"] != "output already exists"
+        ) == written
+        assert os.listdir(os.path.join(mp_tmpdir, "3"))
+        for result in mp.batch_processor(zoom=3, multi=1):
+            assert result["process"] == "output already exists"
+    # existing output is added to the journal
+    with mapchete.open(cleantopo_tl.path) as mp:
+        mp.config.output.registry.discard(3)
+        assert not mp.config.output.registry.recorded()
+    with mapchete.open(cleantopo_tl.path) as mp:
+        list(mp.batch_processor(zoom=3, multi=1))
+        assert mp.config.output.registry.recorded(["written"]) == written
+        assert mp.config.output.registry.is_complete(3)
+    # journal is discarded if the tile pyramids change
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=4)
+    with mapchete.open(config) as mp:
+        assert not mp.config.output.registry.recorded()
+        assert not mp.config.output.registry.is_complete(3)
+    with mapchete.open(cleantopo_tl.path) as mp:
+        assert not mp.config.output.registry.recorded()
+    # failed tiles
+    config = cleantopo_tl.dict
+    config.update(process_file=process_error_py)
+    for multi in [1, 2]:
+        with mapchete.open(config) as mp:
+            with pytest.raises(MapcheteProcessException):
+                mp.batch_process(zoom=4, multi=multi)
+            failed = mp.config.output.registry.recorded(["failed"], zoom=4)
+            assert failed
+            assert failed.issubset(
+                set(tile.id for tile in mp.get_process_tiles(4)))
+    # registry file can be placed elsewhere, e.g. for remote outputs
+    config = cleantopo_tl.dict
+    config.update(process_file=process_file)
+    config["output"].update(registry="journal/tiles.sqlite")
+    with mapchete.open(config) as mp:
+        assert mp.config.output.registry.path == os.path.join(
+            cleantopo_tl.dict["config_dir"], "journal/tiles.sqlite")
+        list(mp.batch_processor(zoom=3, multi=1))
+        assert mp.config.output.registry.is_complete(3)
+    shutil.rmtree(os.path.join(cleantopo_tl.dict["config_dir"], "journal"))
+
+
+def test_batch_process_baselevels(mp_tmpdir, baselevels):
+    """Batch process baselevels and interpolated zoom levels in one run."""
+    with mapchete.open(baselevels.path) as mp:
+        results = list(mp.batch_processor(multi=2))
+        assert len(results) == mp.count_tiles(3, 7)
+        for zoom in [3, 7]:
+            tile = next(mp.get_process_tiles(zoom))
+            assert not mp.get_raw_output(tile).mask.all()
+
+
+def test_tile_scheduler(baselevels):
+    """Release tiles only after the tiles they are interpolated from."""
+    with mapchete.open(baselevels.path) as mp:
+        zoom_levels = list(reversed(mp.config.zoom_levels))
+        scheduler = TileScheduler(mp, zoom_levels)
+        # dependent zoom levels are loaded lazily
+        assert not scheduler.num_waiting
+        ready = scheduler.ready(1)
+        assert [tile.zoom for tile in ready] == [6]
+        assert scheduler.num_waiting == mp.count_tiles(7, 7)
+        # only baselevel tiles are ready at first
+        ready += scheduler.ready(1000)
+        assert set(tile.zoom for tile in ready) == set([5, 6])
+        assert scheduler.num_waiting
+        finished = set()
+        while ready:
+            for tile in ready:
+                if tile.zoom == 7:
+                    assert tile.get_parent().id in finished
+                elif tile.zoom < 5:
+                    assert all(
+                        child.id in finished
+                        for child in tile.get_children()
+                        if child.id in set(
+                            t.id for t in mp.get_process_tiles(tile.zoom + 1))
+                    )
+                finished.add(tile.id)
+                scheduler.done(tile)
+            ready = scheduler.ready(1000)
+        assert not scheduler.num_waiting
+        assert len(finished) == mp.count_tiles(3, 7)
+    # without baselevels all tiles are ready immediately
+    config = baselevels.dict
+    config.pop("baselevels")
+    with mapchete.open(config) as mp:
+        scheduler = TileScheduler(mp, [7, 6, 5, 4, 3])
+        assert len(scheduler.ready(1000)) == mp.count_tiles(3, 7)
+        assert not scheduler.num_waiting
+
+
+def test_adaptive_chunksize(mp_tmpdir, cleantopo_tl):
+    """Number of tiles per task follows measured tile durations."""
+    # fixed chunksize
+    chunksize = ChunkSizer(8)
+    chunksize.finished(8, 100.)
+    assert chunksize.size() == 8
+    # adaptive: start with single tiles until first durations are measured
+    chunksize = ChunkSizer(
+        16, adaptive=True, workers=2, total=1000, target_duration=1.)
+    assert chunksize.size() == 1
+    # cheap tiles get batched up to max_chunksize
+    chunksize.finished(1, 0.01)
+    assert chunksize.size() == 16
+    # expensive tiles are handed out one by one
+    for _ in range(20):
+        chunksize.finished(4, 4.)
+    assert chunksize.size() == 1
+    # towards the end, remaining tiles are spread over all workers
+    for _ in range(20):
+        chunksize.finished(10, 1.)
+    assert 8 <= chunksize.size() <= 10
+    chunksize.dispatched(980)
+    assert chunksize.size() == 5
+    chunksize.dispatched(18)
+    assert chunksize.size() == 1
+    with mapchete.open(cleantopo_tl.path) as mp:
+        results = list(mp.batch_processor(
+            zoom=4, multi=2, max_chunksize=8, adaptive_chunksize=True))
+        assert len(results) == mp.count_tiles(4, 4)
+
+
+def test_tile_order(mp_tmpdir, cleantopo_tl):
+    """Process tiles ordered along space filling curves."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        zoom = 5
+        rowcol = list(mp.get_process_tiles(zoom))
+        for order in ["zorder", "hilbert"]:
+            tiles = list(mp.get_process_tiles(zoom, order=order))
+            assert len(tiles) == len(rowcol)
+            assert set(tiles) == set(rowcol)
+        with pytest.raises(ValueError):
+            mp.batch_process(zoom=zoom, tile_order="invalid")
+        mp.batch_process(zoom=zoom, multi=1, tile_order="hilbert")
+
+
+def test_tile_order_locality():
+    """Chunks of consecutive tiles touch fewer input blocks."""
+    pyramid = BufferedTilePyramid("geodetic")
+    all_tiles = list(pyramid.tiles_from_bounds((-180, -90, 180, 90), 5))
+    blocks_per_chunk = {}
+    for order in TILE_ORDERS:
+        tiles = list(sort_tiles(iter(all_tiles), order))
+        assert len(tiles) == len(all_tiles)
+        # average number of 4x4 tile blocks hit by a chunk of 16 tiles
+        blocks = [
+            len(set((t.row // 4, t.col // 4) for t in tiles[i:i + 16]))
+            for i in range(0, len(tiles), 16)
+        ]
+        blocks_per_chunk[order] = float(sum(blocks)) / len(blocks)
+    assert blocks_per_chunk["rowcol"] == 4
+    assert blocks_per_chunk["zorder"] == 1
+    assert blocks_per_chunk["hilbert"] == 1
+    # consecutive tiles on the Hilbert curve are direct neighbours, except for
+    # one jump as the geodetic grid only covers half of the curve
+    tiles = list(sort_tiles(iter(all_tiles), "hilbert"))
+    assert len([
+        (a, b) for a, b in zip(tiles[:-1], tiles[1:])
+        if abs(a.row - b.row) + abs(a.col - b.col) != 1
+    ]) == 1
+    assert zorder_index(0, 0) == 0
+    assert zorder_index(1, 1) == 3
+    assert [
+        hilbert_index(row, col, 2)
+        for row, col in [(0, 0), (1, 0), (1, 1), (0, 1)]
+    ] == [0, 1, 2, 3]
+
+
+def test_prefetch_block(mp_tmpdir, cleantopo_tl):
+    """Raster inputs are read once per block of process tiles."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    zoom = 7
+    config.update(zoom_levels=zoom)
+    with mapchete.open(config) as mp:
+        params = mp.config.params_at_zoom(zoom)
+        tiles = [
+            mp.config.process_pyramid.tile(zoom, row, col)
+            for row, col in product([2, 3], [2, 3])
+        ]
+        block = TileBlock(tiles)
+        assert block.prefetchable
+        for resampling in ["nearest", "bilinear"]:
+            direct = [
+                mapchete.MapcheteProcess(
+                    tile=tile, config=mp.config, params=params
+                ).open("file1", resampling=resampling).read()
+                for tile in tiles
+            ]
+            with block.active():
+                assert current_block() is block
+                for tile, data in zip(tiles, direct):
+                    prefetched = mapchete.MapcheteProcess(
+                        tile=tile, config=mp.config, params=params
+                    ).open("file1", resampling=resampling).read()
+                    assert np.array_equal(prefetched.mask, data.mask)
+                    assert np.array_equal(prefetched, data)
+                # one read for all tiles
+                assert len(block._data) == 1
+            assert current_block() is None
+        # blocks on the tile pyramid boundaries or with one tile are not
+        # prefetched
+        assert not TileBlock([
+            mp.config.process_pyramid.tile(zoom, 0, col) for col in [2, 3]
+        ]).prefetchable
+        assert not TileBlock(tiles[:1]).prefetchable
+        # scheduler hands out blocks of adjacent tiles
+        scheduler = TileScheduler(mp, [zoom], "hilbert", block_size=2)
+        scheduled = []
+        while True:
+            tiles = scheduler.ready()
+            if not tiles:
+                break
+            assert len(set(
+                (tile.row // 2, tile.col // 2) for tile in tiles)) == 1
+            scheduled.extend(tiles)
+        assert set(scheduled) == set(mp.get_process_tiles(zoom))
+        assert len(scheduled) == len(set(scheduled))
+        # reference output without blocks
+        mp.batch_process(zoom=zoom, multi=1)
+        reference = dict(
+            (tile.id, mp.config.output.read(tile))
+            for tile in mp.get_process_tiles(zoom)
+        )
+    for multi in [1, 2]:
+        with mapchete.open(config, mode="overwrite") as mp:
+            mp.batch_process(zoom=zoom, multi=multi, prefetch_block=2)
+            for tile in mp.get_process_tiles(zoom):
+                assert np.array_equal(
+                    mp.config.output.read(tile), reference[tile.id])
+    assert block_tiles([], 2) == []
+
+
+def test_input_cache(mp_tmpdir, cleantopo_tl):
+    """Repeated input reads are served from the input cache."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    config.update(input_cache=1)
+    with mapchete.open(config) as mp:
+        assert mp.config.input_cache_size == 1024 * 1024
+        assert input_cache.max_bytes == 1024 * 1024
+        zoom = 5
+        tiles = list(mp.get_process_tiles(zoom))
+        params = mp.config.params_at_zoom(zoom)
+        timer = TileTimer()
+        with timer.active():
+            mp_tile = mapchete.MapcheteProcess(
+                tile=tiles[0], config=mp.config, params=params)
+            first = mp_tile.open("file1").read()
+            # modifying returned data does not alter cached data
+            first[:] = 0
+            second = mp_tile.open("file1").read()
+            assert second.any()
+            assert np.array_equal(second, mp_tile.open("file1").read())
+            # other resampling methods are cached separately
+            mp_tile.open("file1", resampling="bilinear").read()
+            # reading the only band explicitly is the same as reading all
+            mp_tile.open("file1").read([1])
+        assert timer.cache_hits == 3
+        assert timer.cache_misses == 2
+        assert timer.as_dict()["cache_hits"] == 3
+        # least recently used arrays are dropped once budget is exceeded
+        for tile in tiles:
+            mapchete.MapcheteProcess(
+                tile=tile, config=mp.config, params=params
+            ).open("file1").read()
+        assert 0 < len(input_cache) < len(tiles)
+        assert sum(
+            data.nbytes + data.mask.nbytes
+            for data in input_cache._arrays.values()
+        ) <= input_cache.max_bytes
+        # misses return the read array, hits a copy of the cached one
+        data = np.ones(3)
+        assert input_cache.get("array", lambda: data) is data
+        data[:] = 0
+        cached = input_cache.get("array", lambda: data)
+        assert cached is not data
+        assert cached.all()
+    # cache is cleared on exit
+    assert not len(input_cache)
+    # batch processing reports cache misses
+    with mapchete.open(config) as mp:
+        mp.batch_process(zoom=3, multi=2)
+        assert mp.timing_summary.as_dict()["total"]["cache_misses"]
+    # disabled by default
+    with mapchete.open(cleantopo_tl.path) as mp:
+        assert mp.config.input_cache_size == 0
+        tile = next(mp.get_process_tiles(5))
+        mp_tile = mapchete.MapcheteProcess(
+            tile=tile, config=mp.config, params=mp.config.params_at_zoom(5))
+        mp_tile.open("file1").read()
+        assert not len(input_cache)
+    # invalid budget
+    for size in [-1, "1MB", True]:
+        config.update(input_cache=size)
+        with pytest.raises(MapcheteConfigError):
+            mapchete.open(config).config.input_cache_size
+
+
+def test_input_cache_shared(mp_tmpdir, cleantopo_tl):
+    """Closing one process keeps caches of other open processes."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    config.update(input_cache=1)
+    mp_a = mapchete.open(config)
+    config.update(input_cache=2)
+    with mapchete.open(config) as mp_b:
+        assert input_cache.max_bytes == 2 * 1024 * 1024
+        tile = next(mp_b.get_process_tiles(5))
+        mapchete.MapcheteProcess(
+            tile=tile, config=mp_b.config,
+            params=mp_b.config.params_at_zoom(5)
+        ).open("file1").read()
+        assert len(input_cache) == 1
+        assert len(_dataset_pool)
+        mp_a.__exit__(None, None, None)
+        assert input_cache.max_bytes == 2 * 1024 * 1024
+        assert len(input_cache) == 1
+        assert len(_dataset_pool)
+    assert not len(input_cache)
+    assert not len(_dataset_pool)
+
+
+def test_prefetch_next(mp_tmpdir, cleantopo_tl):
+    """Inputs of the next tile are read into the input cache in advance."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    config.update(input_cache=16)
+    zoom = 5
+    with mapchete.open(config) as mp:
+        tile = next(mp.get_process_tiles(zoom))
+        prefetcher = NextTilePrefetcher(mp)
+        prefetcher.prefetch(tile)
+        prefetcher.close()
+        assert len(input_cache) == 1
+        timer = TileTimer()
+        with timer.active():
+            data = mapchete.MapcheteProcess(
+                tile=tile, config=mp.config,
+                params=mp.config.params_at_zoom(zoom)
+            ).open("file1").read()
+        assert timer.cache_hits == 1
+        assert not timer.cache_misses
+        path = mp.config.params_at_zoom(zoom)["input"]["file1"].path
+        assert np.array_equal(data, read_raster_window(path, tile, 1))
+        # failing reads are not cached and do not raise
+        input_cache.prefetch("invalid", partial(open, "invalid"))
+        assert len(input_cache) == 1
+        assert not input_cache._pending
+        # reference output
+        mp.batch_process(zoom=zoom, multi=1)
+        reference = dict(
+            (tile.id, mp.config.output.read(tile))
+            for tile in mp.get_process_tiles(zoom)
+        )
+    for multi in [1, 2]:
+        with mapchete.open(config, mode="overwrite") as mp:
+            mp.batch_process(
+                zoom=zoom, multi=multi, max_chunksize=4, prefetch_next=True)
+            for tile in mp.get_process_tiles(zoom):
+                assert np.array_equal(
+                    mp.config.output.read(tile), reference[tile.id])
+            assert mp.timing_summary.as_dict()["total"]["cache_hits"]
+    # worker tasks of single tiles have no next tile to prefetch
+    with mapchete.open(config, mode="overwrite") as mp:
+        mp.batch_process(
+            zoom=zoom, multi=2, max_chunksize=1, prefetch_next=True)
+        assert not mp.timing_summary.as_dict()["total"]["cache_hits"]
+    # without input cache prefetching is disabled
+    config.update(input_cache=0)
+    with mapchete.open(config, mode="overwrite") as mp:
+        mp.batch_process(zoom=zoom, multi=1, prefetch_next=True)
+        assert not mp.timing_summary.as_dict()["total"]["cache_hits"]
+
+
+def test_read_many(mp_tmpdir, file_groups):
+    """Read several inputs concurrently."""
+    config = file_groups.dict
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config) as mp:
+        zoom = 5
+        params = mp.config.params_at_zoom(zoom)
+        tile = mp.config.process_pyramid.tile(zoom, 1, 1)
+        mp_tile = mapchete.MapcheteProcess(
+            tile=tile, config=mp.config, params=params)
+        inputs = [
+            params["input"]["group1"]["file1"],
+            params["input"]["group1"]["file2"],
+            mp_tile.open(params["input"]["group2"]["file1"]),
+            params["input"]["nested_group"]["group1"]["file1"],
+        ]
+        expected = [
+            i.read() if hasattr(i, "read") else mp_tile.open(i).read()
+            for i in inputs
+        ]
+        timer = TileTimer()
+        with timer.active():
+            data = mp_tile.read_many(inputs, threads=2)
+        assert len(data) == len(expected)
+        for a, b in zip(data, expected):
+            assert np.array_equal(a, b)
+            assert np.array_equal(a.mask, b.mask)
+        assert timer.durations["read"] > 0
+        assert timer.read_bytes == sum(d.nbytes for d in data)
+        # keyword arguments are passed on to open()
+        assert np.array_equal(
+            mp_tile.read_many(inputs[:2], resampling="bilinear")[1],
+            mp_tile.open(inputs[1], resampling="bilinear").read())
+        assert mp_tile.read_many([]) == []
+        # exceptions are raised in the calling thread
+        with pytest.raises(ValueError):
+            mp_tile.read_many(["invalid", inputs[0]])
+        # concurrent calls with different numbers of threads
+        results = []
+        callers = [
+            threading.Thread(target=lambda threads=threads: results.extend(
+                mp_tile.read_many(inputs, threads=threads)))
+            for threads in [2, 3] * 4
+        ]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        assert len(results) == 8 * len(inputs)
+        assert all(
+            np.array_equal(a, b)
+            for a, b in zip(results, expected * 8))
+
+
 def test_custom_grid(mp_tmpdir, custom_grid):
     """Cutom grid processing."""
     # process and save
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+"""Example process file."""
+
+
+def execute(mp):
+    """User defined process."""
+    # the exception cannot be sent back from a worker process
+    raise ValueError(lambda: None)
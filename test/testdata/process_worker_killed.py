@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+"""Example process file."""
+
+import os
+import signal
+
+
+def execute(mp):
+    """User defined process."""
+    os.kill(os.getpid(), signal.SIGKILL)